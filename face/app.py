@@ -1,18 +1,29 @@
 import os
 from flask import Flask
 import wtforms_json
+from lib.utils.admission import MemoryBudget
+from lib.utils.degradation import DegradationPolicy
+from lib.utils.profiling import RequestProfiler
 
 wtforms_json.init()
 os.environ["NO_ALBUMENTATIONS_UPDATE"] = "1"
 app = Flask(__name__)
 app.config["MAX_CONTENT_LENGTH"] = 16 * 1024 * 1024  # 16MB
+app.config["ROSTER_DIR"] = os.environ.get("ROSTER_DIR", "rosters")
+RequestProfiler(app)
+DegradationPolicy(app)
+MemoryBudget(app)
 
 # Register blueprints
 from modules.common import bp as common_bp
 from modules.verification import bp as verification_bp
+from modules.attendance import bp as attendance_bp
+from modules.identification import bp as identification_bp
 
 app.register_blueprint(common_bp, url_prefix="/api")
 app.register_blueprint(verification_bp, url_prefix="/api/verification")
+app.register_blueprint(attendance_bp, url_prefix="/api/attendance")
+app.register_blueprint(identification_bp, url_prefix="/api/identification")
 
 
 @app.route("/")
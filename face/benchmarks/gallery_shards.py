@@ -0,0 +1,121 @@
+"""Benchmark of the 1:N search of the sharded gallery.
+
+Measures the latency of one identification query (`ShardedGallery.search`)
+against the gallery size and the number of shards, with the shards in the
+service process (threads) and in worker processes. The gallery holds random
+normalized embeddings, several per student, so the benchmark does not need
+the model weights. The results of every configuration are checked to be the
+same students as the search of a single shard.
+
+Run from the `face` directory:
+
+    python -m benchmarks.gallery_shards --students 10000 100000 --shards 1 2 4
+"""
+
+import time
+import argparse
+import numpy as np
+from lib.gallery.shard import ShardedGallery
+
+
+def synthetic_students(
+    num_students: int, per_student: int, size: int, num_classes: int, seed: int = 0
+) -> list[tuple[str, np.ndarray, list[str]]]:
+    rng = np.random.default_rng(seed)
+    embeddings = rng.normal(size=(num_students, per_student, size)).astype(np.float32)
+    return [
+        (
+            "student-{}".format(i),
+            embeddings[i],
+            ["class-{}".format(rng.integers(num_classes))],
+        )
+        for i in range(num_students)
+    ]
+
+
+def measure(
+    gallery: ShardedGallery,
+    queries: np.ndarray,
+    k: int,
+    class_id: str | None,
+    repeat: int,
+) -> tuple[float, list]:
+    """Median latency of a single-query search in milliseconds, and the results."""
+    results = [
+        gallery.search(query[np.newaxis, :], k, class_id)[0] for query in queries
+    ]
+    latencies = []
+    for _ in range(repeat):
+        for query in queries:
+            started_at = time.perf_counter()
+            gallery.search(query[np.newaxis, :], k, class_id)
+            latencies.append(time.perf_counter() - started_at)
+    latency = float(np.median(latencies)) * 1000 if len(latencies) > 0 else 0.0
+    return latency, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--students", type=int, nargs="+", default=[10000, 50000])
+    parser.add_argument("--shards", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--per-student", type=int, default=5)
+    parser.add_argument("--size", type=int, default=512, help="embedding size")
+    parser.add_argument("--classes", type=int, default=200)
+    parser.add_argument("--queries", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("-k", type=int, default=5)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(1)
+    print(
+        "{:>9} {:>7} {:>7} {:>10} {:>12} {:>12} {:>6}".format(
+            "students", "shards", "mode", "shard_by", "all ms", "class ms", "same"
+        )
+    )
+    for num_students in args.students:
+        students = synthetic_students(
+            num_students, args.per_student, args.size, args.classes
+        )
+        queries = rng.normal(size=(args.queries, args.size)).astype(np.float32)
+
+        reference = ShardedGallery(1)
+        reference.upsert(students)
+        _, expected = measure(reference, queries, args.k, None, 0)
+        _, expected_class = measure(reference, queries, args.k, "class-0", 0)
+        reference.close()
+
+        for num_shards in args.shards:
+            for processes in [False, True]:
+                for shard_by in ["student", "class"]:
+                    gallery = ShardedGallery(num_shards, shard_by, processes)
+                    gallery.upsert(students)
+
+                    latency, results = measure(
+                        gallery, queries, args.k, None, args.repeat
+                    )
+                    class_latency, class_results = measure(
+                        gallery, queries, args.k, "class-0", args.repeat
+                    )
+                    same = all(
+                        [s for s, _ in a] == [s for s, _ in b]
+                        for a, b in zip(
+                            results + class_results, expected + expected_class
+                        )
+                    )
+                    gallery.close()
+
+                    print(
+                        "{:>9} {:>7} {:>7} {:>10} {:>12.2f} {:>12.2f} {:>6}".format(
+                            num_students,
+                            num_shards,
+                            "process" if processes else "thread",
+                            shard_by,
+                            latency,
+                            class_latency,
+                            "yes" if same else "NO",
+                        )
+                    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,249 @@
+"""Benchmark of the OpenCV DNN and onnxruntime backends of YuNet and SFace.
+
+Runs the same images through `YuNetDetector` and `SFaceRecognizer` with both
+backends and reports:
+- latency of one detection / embedding (mean, p50, p95)
+- throughput with concurrent requests on the shared executor, and of
+  `infer_aligned` with batches of chips
+- numerical agreement: detections matched by IoU (count mismatch, maximum
+  difference of boxes, landmarks and scores), difference of the aligned
+  chips and cosine similarity between the embeddings of both backends
+
+Run from the `face` directory so the model weights are found:
+
+    python -m benchmarks.inference_backends images/*.jpg --threads 1 4 8
+"""
+
+import json
+import time
+import argparse
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from lib.face_detector.yunet import YuNetDetector
+from lib.face_recognizer.sface import SFaceRecognizer
+from lib.gallery.roster import normalize
+from lib.utils.image import read_image
+
+BACKENDS = ["opencv", "onnxruntime"]
+
+
+def latency(function, items: list, repeat: int) -> dict:
+    durations = []
+    for _ in range(repeat):
+        for item in items:
+            start = time.perf_counter()
+            function(item)
+            durations.append((time.perf_counter() - start) * 1000)
+    return {
+        "mean_ms": float(np.mean(durations)),
+        "p50_ms": float(np.percentile(durations, 50)),
+        "p95_ms": float(np.percentile(durations, 95)),
+    }
+
+
+def throughput(function, items: list, repeat: int, threads: int) -> float:
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(function, items))
+        start = time.perf_counter()
+        list(pool.map(function, items * repeat))
+        return len(items) * repeat / (time.perf_counter() - start)
+
+
+def timed(function, *args) -> float:
+    start = time.perf_counter()
+    function(*args)
+    return time.perf_counter() - start
+
+
+def as_array(faces: list) -> np.ndarray:
+    # (x, y, w, h, 10 landmark coordinates, confidence) per face
+    return np.asarray(
+        [
+            [*face.bbox.values()]
+            + [v for point in face.landmarks.values() for v in point]
+            + [face.confidence]
+            for face in faces
+        ],
+        dtype=np.float64,
+    ).reshape(-1, 15)
+
+
+def match_detections(a: np.ndarray, b: np.ndarray) -> tuple[np.ndarray, int]:
+    """Match every face of `a` with the face of `b` of highest IoU.
+
+    Returns:
+        out (tuple[np.ndarray, int]): The absolute differences of the matched
+        faces and the number of faces without a match (IoU < 0.5).
+    """
+    if len(a) == 0 or len(b) == 0:
+        return np.empty((0, 15)), max(len(a), len(b))
+
+    a_xyxy = np.hstack([a[:, :2], a[:, :2] + a[:, 2:4]])
+    b_xyxy = np.hstack([b[:, :2], b[:, :2] + b[:, 2:4]])
+    top_left = np.maximum(a_xyxy[:, np.newaxis, :2], b_xyxy[np.newaxis, :, :2])
+    bottom_right = np.minimum(a_xyxy[:, np.newaxis, 2:], b_xyxy[np.newaxis, :, 2:])
+    inter = np.prod(np.clip(bottom_right - top_left, 0, None), axis=-1)
+    areas_a = np.prod(a[:, 2:4], axis=1)[:, np.newaxis]
+    areas_b = np.prod(b[:, 2:4], axis=1)[np.newaxis, :]
+    iou = inter / (areas_a + areas_b - inter)
+
+    best = iou.argmax(axis=1)
+    matched = iou[np.arange(len(a)), best] >= 0.5
+    unmatched = int((~matched).sum() + len(b) - len(np.unique(best[matched])))
+    return np.abs(a[matched] - b[best[matched]]), unmatched
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare the OpenCV DNN and onnxruntime backends."
+    )
+    parser.add_argument("images", nargs="+")
+    parser.add_argument(
+        "--yunet-model", default="weights/face_detection_yunet_2023mar.onnx"
+    )
+    parser.add_argument(
+        "--sface-model", default="weights/face_recognition_sface_2021dec.onnx"
+    )
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--threads", nargs="+", type=int, default=[1, 4])
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument(
+        "--ort-threads",
+        type=int,
+        default=0,
+        help="Threads per onnxruntime session, 0 for the onnxruntime default",
+    )
+    parser.add_argument("--report", help="Write the results as JSON")
+    args = parser.parse_args()
+
+    images = []
+    for path in args.images:
+        with open(path, "rb") as f:
+            images.append(read_image(f))
+
+    detectors = {
+        backend: YuNetDetector(
+            model_file=args.yunet_model, backend=backend, numThreads=args.ort_threads
+        )
+        for backend in BACKENDS
+    }
+    recognizers = {
+        backend: SFaceRecognizer(
+            model_file=args.sface_model, backend=backend, numThreads=args.ort_threads
+        )
+        for backend in BACKENDS
+    }
+
+    # Chips are aligned from the OpenCV detections so that the recognizers
+    # are compared on the same faces
+    detections = {
+        backend: [detectors[backend].detect(image) for image in images]
+        for backend in BACKENDS
+    }
+    faces = [
+        (image, face)
+        for image, image_faces in zip(images, detections["opencv"])
+        for face in image_faces
+    ]
+    chips = {
+        backend: [recognizers[backend].align(image, face) for image, face in faces]
+        for backend in BACKENDS
+    }
+
+    report = {"images": len(images), "faces": len(faces), "backends": {}}
+    for backend in BACKENDS:
+        detector, recognizer = detectors[backend], recognizers[backend]
+        batches = [
+            chips[backend][start : start + args.batch_size]
+            for start in range(0, len(chips[backend]), args.batch_size)
+        ]
+
+        report["backends"][backend] = {
+            "yunet": {
+                "latency": latency(detector.detect, images, args.repeat),
+                "images_per_second": {
+                    threads: throughput(detector.detect, images, args.repeat, threads)
+                    for threads in args.threads
+                },
+            },
+            "sface": (
+                {
+                    "latency": latency(
+                        lambda chip: recognizer.infer_aligned([chip]),
+                        chips[backend],
+                        args.repeat,
+                    ),
+                    "faces_per_second": {
+                        threads: throughput(
+                            lambda chip: recognizer.infer_aligned([chip]),
+                            chips[backend],
+                            args.repeat,
+                            threads,
+                        )
+                        for threads in args.threads
+                    },
+                    "batched_faces_per_second": len(faces)
+                    * args.repeat
+                    / sum(
+                        timed(recognizer.infer_aligned, batch)
+                        for _ in range(args.repeat)
+                        for batch in batches
+                    ),
+                }
+                if len(faces) > 0
+                else None
+            ),
+        }
+
+    differences, unmatched = [], 0
+    for a, b in zip(detections["opencv"], detections["onnxruntime"]):
+        difference, count = match_detections(as_array(a), as_array(b))
+        differences.append(difference)
+        unmatched += count
+    differences = np.vstack(differences)
+
+    agreement = {
+        "yunet": {
+            "faces": {
+                backend: sum(len(faces) for faces in detections[backend])
+                for backend in BACKENDS
+            },
+            "unmatched_faces": unmatched,
+            "max_abs_diff": (
+                {
+                    "bbox": float(differences[:, :4].max()),
+                    "landmarks": float(differences[:, 4:14].max()),
+                    "confidence": float(differences[:, 14].max()),
+                }
+                if len(differences) > 0
+                else None
+            ),
+        },
+        "sface": None,
+    }
+    if len(faces) > 0:
+        embeddings = {
+            backend: normalize(recognizers[backend].infer_aligned(chips[backend]))
+            for backend in BACKENDS
+        }
+        cosine = np.einsum("ij,ij->i", embeddings["opencv"], embeddings["onnxruntime"])
+        agreement["sface"] = {
+            "chip_max_abs_diff": int(
+                max(
+                    np.abs(a.astype(np.int16) - b.astype(np.int16)).max()
+                    for a, b in zip(chips["opencv"], chips["onnxruntime"])
+                )
+            ),
+            "cosine_min": float(cosine.min()),
+            "cosine_mean": float(cosine.mean()),
+        }
+    report["agreement"] = agreement
+
+    print(json.dumps(report, indent=2))
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
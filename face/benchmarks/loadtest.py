@@ -0,0 +1,405 @@
+"""Load test of the face service replaying the call mix of the server.
+
+The harness runs against a running instance (e.g. `flask run`) and replays
+the two call sequences issued by the NestJS server:
+
+- enroll: `/api/verification` with a card and a selfie (retinaface+arcface),
+  followed by `/api/get_single` with the selfie (yunet+sface), with the
+  pipelines hard-coded in FacesService.create.
+- identify: `/api/get` with a group photo, with each of `--pipelines`.
+
+Concurrency is ramped through the given levels, each held for a fixed
+duration, until a latency SLO or the error budget is broken. The report
+gives throughput, tail latency and error rates per endpoint and per
+pipeline for every level, and the saturation throughput (the last level
+that met the SLOs).
+
+Fixtures are read from a directory with the following layout:
+
+    fixtures/
+        card/*.jpg      student card photos
+        selfie/*.jpg    selfies, paired with the cards in sorted order
+        group/*.jpg     classroom photos
+
+Example:
+
+    python benchmarks/loadtest.py --fixtures fixtures \\
+        --pipelines retinaface+arcface yunet+sface \\
+        --concurrency 1 2 4 8 16 --duration 30 --slo-p95 1500
+"""
+
+import os
+import sys
+import json
+import time
+import uuid
+import random
+import argparse
+import threading
+import mimetypes
+import urllib.error
+import urllib.request
+import numpy as np
+from collections import defaultdict
+
+# Pipelines used by FacesService.create for the verification of the selfie
+# against the card and for the embedding stored in the face table
+ENROLL_VERIFICATION_PIPELINE = "retinaface+arcface"
+ENROLL_EMBEDDING_PIPELINE = "yunet+sface"
+
+
+def encode_multipart(
+    fields: dict[str, str], files: dict[str, tuple[str, bytes]]
+) -> tuple[bytes, str]:
+    boundary = uuid.uuid4().hex
+    chunks = []
+    for name, value in fields.items():
+        chunks.append(
+            (
+                '--{}\r\nContent-Disposition: form-data; name="{}"\r\n\r\n{}\r\n'.format(
+                    boundary, name, value
+                )
+            ).encode()
+        )
+
+    for name, (filename, content) in files.items():
+        content_type = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+        chunks.append(
+            (
+                "--{}\r\nContent-Disposition: form-data; "
+                'name="{}"; filename="{}"\r\nContent-Type: {}\r\n\r\n'.format(
+                    boundary, name, filename, content_type
+                )
+            ).encode()
+        )
+        chunks.append(content)
+        chunks.append(b"\r\n")
+
+    chunks.append("--{}--\r\n".format(boundary).encode())
+    return b"".join(chunks), "multipart/form-data; boundary={}".format(boundary)
+
+
+def load_fixtures(path: str) -> dict[str, list[tuple[str, bytes]]]:
+    fixtures = {}
+    for kind in ["card", "selfie", "group"]:
+        directory = os.path.join(path, kind)
+        names = (
+            sorted(
+                name
+                for name in os.listdir(directory)
+                if name.lower().endswith((".jpg", ".jpeg", ".png"))
+            )
+            if os.path.isdir(directory)
+            else []
+        )
+        fixtures[kind] = []
+        for name in names:
+            with open(os.path.join(directory, name), "rb") as f:
+                fixtures[kind].append((name, f.read()))
+    return fixtures
+
+
+class Recorder:
+    """Thread-safe store of call and scenario latencies of the current level."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.calls = defaultdict(list)  # (endpoint, pipeline) -> [(latency, status)]
+        self.scenarios = defaultdict(list)  # (scenario, pipeline) -> [(latency, ok)]
+
+    def call(self, endpoint: str, pipeline: str, latency: float, status: int):
+        with self._lock:
+            self.calls[(endpoint, pipeline)].append((latency, status))
+
+    def scenario(self, scenario: str, pipeline: str, latency: float, ok: bool):
+        with self._lock:
+            self.scenarios[(scenario, pipeline)].append((latency, ok))
+
+
+class Client:
+    def __init__(self, url: str, timeout: float, recorder: Recorder):
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+        self.recorder = recorder
+
+    def post(
+        self,
+        endpoint: str,
+        pipeline: str,
+        files: dict[str, tuple[str, bytes]],
+    ) -> int:
+        body, content_type = encode_multipart({"pipeline": pipeline}, files)
+        request = urllib.request.Request(
+            self.url + endpoint,
+            data=body,
+            headers={"Content-Type": content_type},
+            method="POST",
+        )
+
+        # Status 0 means that the request did not get a response
+        start = time.perf_counter()
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                response.read()
+                status = response.status
+        except urllib.error.HTTPError as e:
+            e.read()
+            status = e.code
+        except OSError:
+            status = 0
+        latency = time.perf_counter() - start
+
+        self.recorder.call(endpoint, pipeline, latency, status)
+        return status
+
+    def enroll(self, card, selfie) -> bool:
+        # Same calls as FacesService.create: verification, then embedding
+        start = time.perf_counter()
+        ok = (
+            self.post(
+                "/api/verification/",
+                ENROLL_VERIFICATION_PIPELINE,
+                {"image_1": card, "image_2": selfie},
+            )
+            == 200
+        )
+        if ok:
+            ok = (
+                self.post(
+                    "/api/get_single", ENROLL_EMBEDDING_PIPELINE, {"image": selfie}
+                )
+                == 200
+            )
+        self.recorder.scenario(
+            "enroll",
+            "{},{}".format(ENROLL_VERIFICATION_PIPELINE, ENROLL_EMBEDDING_PIPELINE),
+            time.perf_counter() - start,
+            ok,
+        )
+        return ok
+
+    def identify(self, pipeline: str, group) -> bool:
+        start = time.perf_counter()
+        ok = self.post("/api/get", pipeline, {"image": group}) == 200
+        self.recorder.scenario("identify", pipeline, time.perf_counter() - start, ok)
+        return ok
+
+
+def summarize(samples: list[tuple[float, int | bool]], duration: float, ok) -> dict:
+    latencies = np.array([latency for latency, _ in samples]) * 1000
+    errors = sum(1 for _, status in samples if not ok(status))
+    return {
+        "count": len(samples),
+        "throughput": len(samples) / duration,
+        "error_rate": errors / len(samples) if len(samples) > 0 else 0.0,
+        "p50": float(np.percentile(latencies, 50)) if len(samples) > 0 else None,
+        "p95": float(np.percentile(latencies, 95)) if len(samples) > 0 else None,
+        "p99": float(np.percentile(latencies, 99)) if len(samples) > 0 else None,
+        "max": float(latencies.max()) if len(samples) > 0 else None,
+    }
+
+
+def run_level(args: argparse.Namespace, fixtures: dict, concurrency: int) -> dict:
+    recorder = Recorder()
+    client = Client(args.url, args.timeout, recorder)
+    pairs = list(zip(fixtures["card"], fixtures["selfie"]))
+    scenarios = [
+        scenario
+        for scenario, weight in [
+            ("enroll", args.enroll_weight),
+            ("identify", args.identify_weight),
+        ]
+        if weight > 0
+    ]
+    weights = [
+        weight for weight in [args.enroll_weight, args.identify_weight] if weight > 0
+    ]
+
+    deadline = time.perf_counter() + args.duration
+
+    def worker(seed: int):
+        rng = random.Random(seed)
+        while time.perf_counter() < deadline:
+            if rng.choices(scenarios, weights)[0] == "enroll":
+                card, selfie = rng.choice(pairs)
+                client.enroll(card, selfie)
+            else:
+                client.identify(
+                    rng.choice(args.pipelines), rng.choice(fixtures["group"])
+                )
+
+    start = time.perf_counter()
+    threads = [
+        threading.Thread(target=worker, args=(args.seed + i,), daemon=True)
+        for i in range(concurrency)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    duration = time.perf_counter() - start
+
+    # Server errors and dropped requests count against the error budget,
+    # rejected images (4xx) are part of the normal call mix
+    def call_ok(status):
+        return 0 < status < 500
+
+    endpoints = {
+        "{} [{}]".format(endpoint, pipeline): summarize(samples, duration, call_ok)
+        for (endpoint, pipeline), samples in sorted(recorder.calls.items())
+    }
+    pipelines = {
+        "{} [{}]".format(scenario, pipeline): summarize(
+            samples, duration, lambda ok: ok
+        )
+        for (scenario, pipeline), samples in sorted(recorder.scenarios.items())
+    }
+    all_calls = [sample for samples in recorder.calls.values() for sample in samples]
+
+    return {
+        "concurrency": concurrency,
+        "duration": duration,
+        "total": summarize(all_calls, duration, call_ok),
+        "endpoints": endpoints,
+        "pipelines": pipelines,
+    }
+
+
+def check_slo(args: argparse.Namespace, level: dict) -> list[str]:
+    violations = []
+    for name, stats in level["endpoints"].items():
+        if stats["p95"] is not None and stats["p95"] > args.slo_p95:
+            violations.append(
+                "{}: p95 {:.0f}ms > {:.0f}ms".format(name, stats["p95"], args.slo_p95)
+            )
+        if stats["p99"] is not None and args.slo_p99 and stats["p99"] > args.slo_p99:
+            violations.append(
+                "{}: p99 {:.0f}ms > {:.0f}ms".format(name, stats["p99"], args.slo_p99)
+            )
+        if stats["error_rate"] > args.max_error_rate:
+            violations.append(
+                "{}: error rate {:.2%} > {:.2%}".format(
+                    name, stats["error_rate"], args.max_error_rate
+                )
+            )
+    return violations
+
+
+def print_level(level: dict) -> None:
+    print(
+        "\n== concurrency {} ({:.1f}s) ==".format(
+            level["concurrency"], level["duration"]
+        )
+    )
+    header = "{:<45} {:>7} {:>8} {:>8} {:>8} {:>8} {:>7}".format(
+        "", "count", "req/s", "p50", "p95", "p99", "err"
+    )
+    print(header)
+    for group in ["endpoints", "pipelines"]:
+        for name, stats in level[group].items():
+            print(
+                "{:<45} {:>7} {:>8.2f} {:>8.0f} {:>8.0f} {:>8.0f} {:>6.1%}".format(
+                    name,
+                    stats["count"],
+                    stats["throughput"],
+                    stats["p50"] or 0,
+                    stats["p95"] or 0,
+                    stats["p99"] or 0,
+                    stats["error_rate"],
+                )
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Ramp concurrency against the face service until SLOs break."
+    )
+    parser.add_argument("--url", default="http://localhost:5000")
+    parser.add_argument("--fixtures", required=True, help="Fixture directory")
+    parser.add_argument(
+        "--pipelines",
+        nargs="+",
+        default=["retinaface+arcface"],
+        choices=["yunet+sface", "retinaface+arcface"],
+        help="Pipelines of the identify calls, enroll calls use the server's",
+    )
+    parser.add_argument(
+        "--concurrency", nargs="+", type=int, default=[1, 2, 4, 8, 16, 32]
+    )
+    parser.add_argument(
+        "--duration", type=float, default=30, help="Seconds per concurrency level"
+    )
+    parser.add_argument("--enroll-weight", type=float, default=1)
+    parser.add_argument("--identify-weight", type=float, default=1)
+    parser.add_argument(
+        "--slo-p95", type=float, default=2000, help="p95 latency SLO per call (ms)"
+    )
+    parser.add_argument(
+        "--slo-p99", type=float, default=None, help="p99 latency SLO per call (ms)"
+    )
+    parser.add_argument("--max-error-rate", type=float, default=0.01)
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the full report as JSON")
+    args = parser.parse_args()
+
+    fixtures = load_fixtures(args.fixtures)
+    if args.enroll_weight > 0 and (
+        len(fixtures["card"]) == 0 or len(fixtures["selfie"]) == 0
+    ):
+        parser.error(
+            "enroll needs images in {0}/card and {0}/selfie".format(args.fixtures)
+        )
+    if args.identify_weight > 0 and len(fixtures["group"]) == 0:
+        parser.error("identify needs images in {}/group".format(args.fixtures))
+
+    levels = []
+    saturation = None
+    for concurrency in args.concurrency:
+        level = run_level(args, fixtures, concurrency)
+        level["violations"] = check_slo(args, level)
+        levels.append(level)
+        print_level(level)
+
+        if len(level["violations"]) > 0:
+            print("SLO broken:\n  " + "\n  ".join(level["violations"]))
+            break
+        saturation = level
+
+    print()
+    if saturation is None:
+        print("SLOs are already broken at concurrency {}".format(args.concurrency[0]))
+    else:
+        print(
+            "Saturation: {:.2f} req/s at concurrency {} (p95 {:.0f}ms, errors {:.2%})".format(
+                saturation["total"]["throughput"],
+                saturation["concurrency"],
+                saturation["total"]["p95"] or 0,
+                saturation["total"]["error_rate"],
+            )
+        )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(
+                {
+                    "args": vars(args),
+                    "levels": levels,
+                    "saturation": (
+                        {
+                            "concurrency": saturation["concurrency"],
+                            "throughput": saturation["total"]["throughput"],
+                        }
+                        if saturation is not None
+                        else None
+                    ),
+                },
+                f,
+                indent=2,
+            )
+
+    return 0 if saturation is not None else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,187 @@
+"""Benchmark of the RetinaFace post-processing.
+
+Compares `RetinaFaceDetector` (lib/cores/retinaface.py, vectorized decoding
+and NMS) with the previous path through `insightface RetinaFace.detect`, its
+per-stride decoding and Python NMS loop, followed by the per-face conversion
+loop. Both run on the same synthetic raw outputs of det_10g.onnx, produced by
+a fake ONNX session, so the benchmark isolates post-processing and does not
+need the model weights. The detections of both paths are checked to be
+identical.
+
+Run from the `face` directory:
+
+    python -m benchmarks.retinaface_postprocess --faces 5 50 200
+"""
+
+import time
+import argparse
+import numpy as np
+from types import SimpleNamespace
+from insightface.model_zoo.retinaface import RetinaFace as InsightFaceRetinaFace
+from lib.cores.retinaface import RetinaFace
+from lib.face_detector.retinaface import RetinaFaceDetector
+
+STRIDES = [8, 16, 32]
+NUM_ANCHORS = 2
+
+
+class FakeSession:
+    """Stands in for the onnxruntime session of det_10g.onnx."""
+
+    def __init__(self, outputs: list[np.ndarray]):
+        self.outputs = outputs
+
+    def get_inputs(self):
+        return [SimpleNamespace(name="input.1", shape=[1, 3, "?", "?"])]
+
+    def get_outputs(self):
+        return [
+            SimpleNamespace(name="output_{}".format(i), shape=list(output.shape))
+            for i, output in enumerate(self.outputs)
+        ]
+
+    def set_providers(self, providers):
+        pass
+
+    def run(self, output_names, feed):
+        return self.outputs
+
+
+def synthetic_outputs(
+    num_faces: int, size: int = 640, seed: int = 0
+) -> list[np.ndarray]:
+    """Raw outputs with many overlapping candidates around each face."""
+    rng = np.random.default_rng(seed)
+    scores, boxes, kpss = [], [], []
+    for stride in STRIDES:
+        h = w = size // stride
+        count = h * w * NUM_ANCHORS
+        scores.append(rng.uniform(0, 0.1, (count, 1)).astype(np.float32))
+        boxes.append(rng.uniform(0.5, 2, (count, 4)).astype(np.float32))
+        kpss.append(rng.uniform(-1, 1, (count, 10)).astype(np.float32))
+
+    for _ in range(num_faces):
+        level = rng.integers(0, 2)
+        stride = STRIDES[level]
+        h = w = size // stride
+        cy, cx = rng.integers(1, h - 1), rng.integers(1, w - 1)
+        face_size = rng.uniform(0.75, 2)
+        for dy in range(-1, 2):
+            for dx in range(-1, 2):
+                for anchor in range(NUM_ANCHORS):
+                    index = ((cy + dy) * w + (cx + dx)) * NUM_ANCHORS + anchor
+                    scores[level][index] = rng.uniform(0.3, 0.95)
+                    boxes[level][index] = face_size + rng.normal(0, 0.2, 4)
+
+    return scores + boxes + kpss
+
+
+def legacy_detect(retinaface, image) -> list[tuple]:
+    # The previous RetinaFaceDetector.detect and _convert_result_format
+    faces = retinaface.detect(image)
+    converted_faces = []
+    for i in range(faces[0].shape[0]):
+        bbox = faces[0][i][:4]
+        landmarks = faces[1][i]
+        conf = faces[0][i][4]
+        converted_faces.append(
+            (
+                {
+                    "x": bbox[0],
+                    "y": bbox[1],
+                    "w": bbox[2] - bbox[0],
+                    "h": bbox[3] - bbox[1],
+                },
+                {
+                    "left_eye": landmarks[0],
+                    "right_eye": landmarks[1],
+                    "nose": landmarks[2],
+                    "left_mouth": landmarks[3],
+                    "right_mouth": landmarks[4],
+                },
+                conf,
+            )
+        )
+    return converted_faces
+
+
+def as_array(faces: list) -> np.ndarray:
+    rows = []
+    for bbox, landmarks, conf in faces:
+        rows.append(
+            [bbox["x"], bbox["y"], bbox["w"], bbox["h"], conf]
+            + [float(v) for point in landmarks.values() for v in point]
+        )
+    return np.asarray(rows, dtype=np.float32).reshape(-1, 15)
+
+
+def timeit(function, repeat: int) -> float:
+    function()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        function()
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--faces", nargs="+", type=int, default=[1, 20, 100, 300])
+    parser.add_argument("--conf-threshold", type=float, default=0.35)
+    parser.add_argument("--nms-threshold", type=float, default=0.4)
+    parser.add_argument("--image-size", nargs=2, type=int, default=[1920, 1080])
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    image = np.zeros((args.image_size[1], args.image_size[0], 3), dtype=np.uint8)
+    print(
+        "{:>6} {:>11} {:>8} {:>11} {:>11} {:>8} {:>9}".format(
+            "faces", "candidates", "kept", "legacy ms", "new ms", "speedup", "identical"
+        )
+    )
+
+    for num_faces in args.faces:
+        session = FakeSession(synthetic_outputs(num_faces))
+
+        legacy = InsightFaceRetinaFace(session=session)
+        legacy.prepare(
+            -1,
+            det_thresh=args.conf_threshold,
+            nms_thresh=args.nms_threshold,
+            input_size=(640, 640),
+        )
+
+        detector = RetinaFaceDetector.__new__(RetinaFaceDetector)
+        detector._confThreshold = args.conf_threshold
+        detector._nmsThreshold = args.nms_threshold
+        detector._topK = None
+        detector._retinaface = RetinaFace(
+            None, inputSize=(640, 640), confThreshold=0.2, session=session
+        )
+
+        legacy_faces = as_array(legacy_detect(legacy, image))
+        new_faces = as_array(
+            [
+                (face.bbox, face.landmarks, face.confidence)
+                for face in detector.detect(image)
+            ]
+        )
+        candidates = len(detector._retinaface.infer(image)[0])
+
+        legacy_ms = timeit(lambda: legacy_detect(legacy, image), args.repeat)
+        new_ms = timeit(lambda: detector.detect(image), args.repeat)
+
+        print(
+            "{:>6} {:>11} {:>8} {:>11.2f} {:>11.2f} {:>7.1f}x {:>9}".format(
+                num_faces,
+                candidates,
+                len(new_faces),
+                legacy_ms,
+                new_ms,
+                legacy_ms / new_ms,
+                str(np.array_equal(legacy_faces, new_faces)),
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,238 @@
+"""Benchmark of the per-student template fusion of the gallery.
+
+Compares the 1:N search over one row per selfie with the search over the
+fused template of each student (`StudentTemplate`), alone and with medoids:
+the gallery size, the latency of one query and the identification accuracy
+at the default thresholds of the recognizers.
+
+Selfies come from a npz file with `student_ids` and `embeddings` (one row per
+selfie, e.g. exported from the `face` table) and optional `qualities`. A
+fraction of the students is not enrolled and their selfies are impostor
+queries. For each other student with at least two selfies, one selfie is
+held out as the query and the others are enrolled. Without a file, synthetic identities are used:
+each student has a few poses around an identity vector, selfies are noisy
+samples of the poses with a quality inversely proportional to the noise
+variance, and students that are not enrolled provide impostor queries.
+
+Run from the `face` directory:
+
+    python -m benchmarks.template_fusion --students 5000 --selfies 10
+    python -m benchmarks.template_fusion --embeddings faces.npz --impostors 0.2
+"""
+
+import time
+import argparse
+import numpy as np
+from lib.face_recognizer.arcface import ArcFaceRecognizer
+from lib.face_recognizer.sface import SFaceRecognizer
+from lib.gallery.roster import normalize
+from lib.gallery.shard import ShardedGallery
+from lib.gallery.template import StudentTemplate
+
+
+def synthetic_dataset(
+    num_students: int,
+    num_selfies: int,
+    size: int,
+    num_poses: int = 3,
+    noise: float = 1.6,
+    seed: int = 0,
+) -> tuple[dict, list, list]:
+    """Enrolled selfies, genuine queries and impostor queries.
+
+    With the default noise, a selfie and a query of the same student have a
+    similarity of about 0.26 ± 0.08, and of different students about 0.03,
+    so the search over the raw selfies misses about half of the genuine
+    queries at the default thresholds.
+    """
+    rng = np.random.default_rng(seed)
+    # Direction shared by all faces, so identities are not orthogonal
+    population = normalize(rng.normal(size=size))[0]
+
+    def identity():
+        center = normalize(0.4 * population + normalize(rng.normal(size=size))[0])[0]
+        poses = normalize(center + 0.5 * normalize(rng.normal(size=(num_poses, size))))
+        return poses
+
+    def sample(poses, count):
+        scales = noise * rng.uniform(0.6, 1.4, size=count)
+        pose = poses[rng.integers(len(poses), size=count)]
+        samples = pose + scales[:, np.newaxis] * normalize(
+            rng.normal(size=(count, size))
+        )
+        return normalize(samples), 1 / scales**2
+
+    students, genuine = {}, []
+    for i in range(num_students):
+        poses = identity()
+        embeddings, qualities = sample(poses, num_selfies + 1)
+        student_id = "student-{}".format(i)
+        students[student_id] = (embeddings[:-1], qualities[:-1])
+        genuine.append((student_id, embeddings[-1]))
+
+    impostors = [sample(identity(), 1)[0][0] for _ in range(num_students // 5)]
+    return students, genuine, impostors
+
+
+def file_dataset(
+    path: str, impostor_fraction: float = 0.2, seed: int = 0
+) -> tuple[dict, list, list]:
+    """Leave-one-out split of real selfie embeddings, with the selfies of a
+    random `impostor_fraction` of the students as impostor queries."""
+    with np.load(path, allow_pickle=False) as data:
+        student_ids = data["student_ids"].astype(str)
+        embeddings = normalize(data["embeddings"])
+        qualities = (
+            data["qualities"] if "qualities" in data else np.ones(len(student_ids))
+        )
+
+    unique_ids = np.unique(student_ids)
+    rng = np.random.default_rng(seed)
+    held_out = set(
+        rng.choice(
+            unique_ids, size=int(len(unique_ids) * impostor_fraction), replace=False
+        ).tolist()
+    )
+
+    students, genuine, impostors = {}, [], []
+    for student_id in unique_ids:
+        rows = np.flatnonzero(student_ids == student_id)
+        if student_id in held_out:
+            impostors.extend(embeddings[rows])
+            continue
+        if len(rows) < 2:
+            continue
+        students[student_id] = (embeddings[rows[1:]], qualities[rows[1:]])
+        genuine.append((student_id, embeddings[rows[0]]))
+    return students, genuine, impostors
+
+
+def build(students: dict, mode: str, medoid_count: int) -> ShardedGallery:
+    entries = []
+    for student_id, (embeddings, qualities) in students.items():
+        if mode == "raw":
+            entries.append((student_id, embeddings, []))
+            continue
+
+        template = StudentTemplate(embeddings.shape[1])
+        weights = qualities if mode != "mean" else np.ones(len(qualities))
+        for index, (embedding, weight) in enumerate(zip(embeddings, weights)):
+            template.add(str(index), embedding, float(weight))
+        entries.append((student_id, template.rows(medoid_count), []))
+
+    gallery = ShardedGallery(1)
+    gallery.upsert(entries)
+    return gallery
+
+
+def evaluate(
+    gallery: ShardedGallery, genuine: list, impostors: list, thresholds: dict
+) -> tuple[float, dict]:
+    queries = np.stack([query for _, query in genuine] + list(impostors))
+    gallery.search(queries[:1], 1)
+
+    # Latency of a single query, as served by /api/identification
+    latencies = []
+    for query in queries[:200]:
+        started_at = time.perf_counter()
+        gallery.search(query[np.newaxis, :], 1)
+        latencies.append(time.perf_counter() - started_at)
+
+    results = gallery.search(queries, 1)
+    top = [result[0] for result in results]
+    metrics = {}
+    for name, threshold in thresholds.items():
+        correct = sum(
+            1
+            for (student_id, _), (found, score) in zip(genuine, top)
+            if found == student_id and score >= threshold
+        )
+        wrong = sum(
+            1
+            for (student_id, _), (found, score) in zip(genuine, top)
+            if found != student_id and score >= threshold
+        )
+        false_accepts = sum(1 for _, score in top[len(genuine) :] if score >= threshold)
+        metrics[name] = (
+            correct / len(genuine),
+            wrong / len(genuine),
+            false_accepts / len(impostors) if len(impostors) > 0 else float("nan"),
+        )
+    return float(np.median(latencies)) * 1000, metrics
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--embeddings", help="npz file of real selfie embeddings")
+    parser.add_argument("--students", type=int, default=2000)
+    parser.add_argument("--selfies", type=int, default=10)
+    parser.add_argument("--size", type=int, default=512, help="embedding size")
+    parser.add_argument("--medoids", type=int, nargs="+", default=[2])
+    parser.add_argument(
+        "--noise", type=float, default=1.6, help="noise of the synthetic selfies"
+    )
+    parser.add_argument(
+        "--impostors",
+        type=float,
+        default=0.2,
+        help="fraction of the students of --embeddings held out as impostors",
+    )
+    args = parser.parse_args()
+
+    if args.embeddings:
+        students, genuine, impostors = file_dataset(args.embeddings, args.impostors)
+    else:
+        students, genuine, impostors = synthetic_dataset(
+            args.students, args.selfies, args.size, noise=args.noise
+        )
+
+    thresholds = {
+        "arcface": ArcFaceRecognizer.default_threshold,
+        "sface": SFaceRecognizer.default_threshold,
+    }
+    configurations = [("raw", 0), ("mean", 0), ("fused", 0)] + [
+        ("fused", count) for count in args.medoids
+    ]
+
+    print(
+        "{} students, {} genuine and {} impostor queries".format(
+            len(students), len(genuine), len(impostors)
+        )
+    )
+    print(
+        "{:<12} {:>8} {:>10} {:>9}  {}".format(
+            "template",
+            "rows",
+            "query ms",
+            "speedup",
+            "  ".join(
+                "{}@{:.3f} hit/wrong/far".format(name, threshold)
+                for name, threshold in thresholds.items()
+            ),
+        )
+    )
+
+    baseline = None
+    for mode, medoid_count in configurations:
+        gallery = build(students, mode, medoid_count)
+        rows = sum(shard["embedding_count"] for shard in gallery.stats()["shards"])
+        latency, metrics = evaluate(gallery, genuine, impostors, thresholds)
+        baseline = baseline or latency
+        gallery.close()
+
+        print(
+            "{:<12} {:>8} {:>10.3f} {:>8.1f}x  {}".format(
+                mode if medoid_count == 0 else "{}+{}med".format(mode, medoid_count),
+                rows,
+                latency,
+                baseline / latency,
+                "  ".join(
+                    "{:>9.3f}/{:.3f}/{:.3f}".format(*metrics[name])
+                    for name in thresholds
+                ),
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
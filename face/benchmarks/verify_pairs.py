@@ -0,0 +1,310 @@
+"""Offline bulk verification of image pairs.
+
+Reads a CSV of pairs (e.g. student card / selfie) and scores every pair
+with each pipeline, like `/api/verification` does, but every unique image is
+decoded, detected and embedded exactly once, in parallel, and the aligned
+chips go through the recognizer in batches. Pairs are then scored with a
+single vectorized cosine similarity.
+
+The CSV needs the columns `image_1` and `image_2`, with paths relative to
+the CSV file, and an optional `label` column (1 for the same person, 0
+otherwise). Rows with a missing image or a label other than 0 or 1 are
+skipped and counted in the report. With labels, ROC and threshold statistics
+are reported, including the metrics at the default threshold of the
+recognizer (0.352 for ArcFace, as in FacesService.create).
+
+Run from the `face` directory so the model weights are found:
+
+    python -m benchmarks.verify_pairs pairs.csv \\
+        --pipelines retinaface+arcface yunet+sface --output scores.csv
+"""
+
+import os
+import csv
+import json
+import time
+import argparse
+import numpy as np
+from lib.face_detector.base import BaseFaceDetector
+from lib.face_recognizer.base import BaseFaceRecognizer
+from lib.gallery.roster import normalize
+from lib.utils.executor import executor
+from lib.utils.image import read_image
+
+
+def create_pipeline(name: str) -> tuple[BaseFaceDetector, BaseFaceRecognizer]:
+    # Models are imported lazily so that only the requested ones are loaded
+    model_det_name, model_rec_name = name.split("+")
+    if model_det_name == "yunet":
+        from lib.face_detector.yunet import YuNetDetector
+
+        detector = YuNetDetector()
+    else:
+        from lib.face_detector.retinaface import RetinaFaceDetector
+
+        detector = RetinaFaceDetector()
+
+    if model_rec_name == "sface":
+        from lib.face_recognizer.sface import SFaceRecognizer
+
+        recognizer = SFaceRecognizer()
+    else:
+        from lib.face_recognizer.arcface import ArcFaceRecognizer
+
+        recognizer = ArcFaceRecognizer()
+
+    return detector, recognizer
+
+
+def read_pairs(
+    path: str,
+) -> tuple[list[str], np.ndarray, np.ndarray | None, int]:
+    """Read the pairs CSV.
+
+    Returns:
+        out (tuple[list[str], np.ndarray, np.ndarray | None, int]): The unique
+        image paths, the (pairs, 2) indices into them, the labels if present
+        and the number of skipped rows.
+    """
+    root = os.path.dirname(os.path.abspath(path))
+    images: dict[str, int] = {}
+    pairs, labels = [], []
+    skipped = 0
+
+    with open(path, newline="") as f:
+        reader = csv.DictReader(f)
+        has_label = "label" in (reader.fieldnames or [])
+        for row in reader:
+            names = [
+                (row.get(column) or "").strip() for column in ["image_1", "image_2"]
+            ]
+            label = (row.get("label") or "").strip()
+            if "" in names or (has_label and label not in ["0", "1"]):
+                skipped += 1
+                continue
+
+            pairs.append(
+                [
+                    images.setdefault(
+                        os.path.normpath(os.path.join(root, name)), len(images)
+                    )
+                    for name in names
+                ]
+            )
+            if has_label:
+                labels.append(int(label))
+
+    return (
+        list(images),
+        np.asarray(pairs, dtype=np.int64).reshape(-1, 2),
+        np.asarray(labels, dtype=np.int64) if has_label else None,
+        skipped,
+    )
+
+
+def embed_images(
+    paths: list[str],
+    detector: BaseFaceDetector,
+    recognizer: BaseFaceRecognizer,
+    batch_size: int,
+) -> tuple[np.ndarray, np.ndarray]:
+    """Embed each image once.
+
+    Returns:
+        out (tuple[np.ndarray, np.ndarray]): The normalized embeddings, one
+        row per image, and a mask of the images where exactly one face was
+        found. Images that cannot be read are failed, like images without a
+        face.
+    """
+
+    def prepare(path: str) -> np.ndarray | None:
+        try:
+            with open(path, "rb") as f:
+                image, face = detector.detect_single(read_image(f))
+        except (OSError, ValueError):
+            return None
+        return None if face is None else recognizer.align(image, face)
+
+    chips = list(executor.map(prepare, paths))
+    valid = np.array([chip is not None for chip in chips], dtype=bool)
+    valid_chips = [chip for chip in chips if chip is not None]
+
+    batches = [
+        recognizer.infer_aligned(valid_chips[start : start + batch_size])
+        for start in range(0, len(valid_chips), batch_size)
+    ]
+    if len(batches) == 0:
+        return np.empty((len(paths), 0), dtype=np.float32), valid
+
+    features = normalize(np.vstack(batches))
+    embeddings = np.full((len(paths), features.shape[1]), np.nan, dtype=np.float32)
+    embeddings[valid] = features
+    return embeddings, valid
+
+
+def roc_statistics(
+    scores: np.ndarray, labels: np.ndarray, threshold: float
+) -> dict | None:
+    positives = int(labels.sum())
+    negatives = int(len(labels) - positives)
+    if positives == 0 or negatives == 0:
+        return None
+
+    order = np.argsort(-scores, kind="stable")
+    sorted_scores = scores[order]
+    sorted_labels = labels[order]
+
+    # Accepting every pair with a score >= sorted_scores[i]
+    tp = np.cumsum(sorted_labels)
+    fp = np.cumsum(1 - sorted_labels)
+    last = np.r_[np.flatnonzero(np.diff(sorted_scores)), len(scores) - 1]
+    thresholds = sorted_scores[last]
+    tpr = tp[last] / positives
+    fpr = fp[last] / negatives
+
+    x, y = np.r_[0, fpr], np.r_[0, tpr]
+    auc = float(np.sum(np.diff(x) * (y[1:] + y[:-1]) / 2))
+    eer_index = int(np.argmin(np.abs(fpr - (1 - tpr))))
+    accuracy = (tp[last] + negatives - fp[last]) / len(scores)
+    best_index = int(np.argmax(accuracy))
+
+    tar_at_far = {}
+    for far in [1e-4, 1e-3, 1e-2, 1e-1]:
+        allowed = np.flatnonzero(fpr <= far)
+        tar_at_far[str(far)] = (
+            {
+                "tar": float(tpr[allowed[-1]]),
+                "threshold": float(thresholds[allowed[-1]]),
+            }
+            if len(allowed) > 0
+            else None
+        )
+
+    accepted = scores >= threshold
+    return {
+        "positives": positives,
+        "negatives": negatives,
+        "auc": auc,
+        "eer": float((fpr[eer_index] + 1 - tpr[eer_index]) / 2),
+        "eer_threshold": float(thresholds[eer_index]),
+        "best_accuracy": float(accuracy[best_index]),
+        "best_accuracy_threshold": float(thresholds[best_index]),
+        "tar_at_far": tar_at_far,
+        "at_threshold": {
+            "threshold": threshold,
+            "tar": float(accepted[labels == 1].mean()),
+            "far": float(accepted[labels == 0].mean()),
+            "accuracy": float((accepted == (labels == 1)).mean()),
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Score image pairs in bulk, embedding every image once."
+    )
+    parser.add_argument("pairs", help="CSV with image_1, image_2 and optional label")
+    parser.add_argument(
+        "--pipelines",
+        nargs="+",
+        default=["retinaface+arcface"],
+        choices=["yunet+sface", "retinaface+arcface"],
+    )
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        help="Decision threshold, defaults to the one of the recognizer",
+    )
+    parser.add_argument("--output", help="Write the score of every pair as CSV")
+    parser.add_argument("--report", help="Write the statistics as JSON")
+    args = parser.parse_args()
+
+    paths, pairs, labels, skipped = read_pairs(args.pairs)
+    report = {
+        "images": len(paths),
+        "pairs": len(pairs),
+        "skipped_rows": skipped,
+        "pipelines": {},
+    }
+    all_scores = {}
+
+    for pipeline in args.pipelines:
+        detector, recognizer = create_pipeline(pipeline)
+
+        start = time.perf_counter()
+        embeddings, valid = embed_images(paths, detector, recognizer, args.batch_size)
+        embed_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        scored = valid[pairs[:, 0]] & valid[pairs[:, 1]]
+        scores = np.full(len(pairs), np.nan, dtype=np.float32)
+        scores[scored] = np.einsum(
+            "ij,ij->i",
+            embeddings[pairs[scored, 0]],
+            embeddings[pairs[scored, 1]],
+        )
+        score_time = time.perf_counter() - start
+        all_scores[pipeline] = scores
+
+        report["pipelines"][pipeline] = {
+            "failed_images": int((~valid).sum()),
+            "failed_pairs": int((~scored).sum()),
+            "throughput": {
+                "embed_seconds": embed_time,
+                "images_per_second": (
+                    len(paths) / embed_time if embed_time > 0 else None
+                ),
+                # Pairs per second as seen by a caller of /api/verification
+                "effective_pairs_per_second": (
+                    len(pairs) / (embed_time + score_time)
+                    if embed_time + score_time > 0
+                    else None
+                ),
+                "score_seconds": score_time,
+            },
+            "roc": (
+                roc_statistics(
+                    scores[scored],
+                    labels[scored],
+                    (
+                        args.threshold
+                        if args.threshold is not None
+                        else recognizer.default_threshold
+                    ),
+                )
+                if labels is not None
+                else None
+            ),
+        }
+
+    if args.output:
+        with open(args.output, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(
+                ["image_1", "image_2"]
+                + (["label"] if labels is not None else [])
+                + args.pipelines
+            )
+            for index, (i, j) in enumerate(pairs):
+                writer.writerow(
+                    [paths[i], paths[j]]
+                    + ([int(labels[index])] if labels is not None else [])
+                    + [
+                        (
+                            ""
+                            if np.isnan(all_scores[pipeline][index])
+                            else float(all_scores[pipeline][index])
+                        )
+                        for pipeline in args.pipelines
+                    ]
+                )
+
+    print(json.dumps(report, indent=2))
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+import numpy as np
+import cv2 as cv
+import onnxruntime
+
+
+class RetinaFace:
+    """RetinaFace (SCRFD) detector of insightface running on raw ONNX outputs.
+
+    Pre-processing is the same as `insightface.model_zoo.retinaface.RetinaFace`,
+    but the outputs of all strides are decoded at once: the anchor centers of
+    every stride are concatenated and cached per input size, and only the
+    anchors above the confidence threshold are decoded. NMS is left to the
+    caller.
+    """
+
+    def __init__(
+        self,
+        modelPath,
+        inputSize=[640, 640],
+        confThreshold=0.5,
+        session=None,
+    ):
+        self._modelPath = modelPath
+        self._inputSize = tuple(inputSize)  # [w, h]
+        self._confThreshold = confThreshold
+        self._session = session or onnxruntime.InferenceSession(
+            self._modelPath, providers=["CPUExecutionProvider"]
+        )
+
+        self._inputName = self._session.get_inputs()[0].name
+        self._outputNames = [output.name for output in self._session.get_outputs()]
+        self._batched = len(self._session.get_outputs()[0].shape) == 3
+
+        # Same output layouts as insightface
+        self._inputMean = 127.5
+        self._inputStd = 128.0
+        self._fmc, self._strides, self._numAnchors, self._useKps = {
+            6: (3, [8, 16, 32], 2, False),
+            9: (3, [8, 16, 32], 2, True),
+            10: (5, [8, 16, 32, 64, 128], 1, False),
+            15: (5, [8, 16, 32, 64, 128], 1, True),
+        }[len(self._outputNames)]
+
+        self._anchorCache: dict[tuple[int, int], tuple[np.ndarray, np.ndarray]] = {}
+
+    @property
+    def name(self):
+        return self.__class__.__name__
+
+    def _anchors(self, height: int, width: int) -> tuple[np.ndarray, np.ndarray]:
+        """Anchor centers and strides of every stride, concatenated.
+
+        Returns:
+            out (tuple[np.ndarray, np.ndarray]): The (M, 2) anchor centers and
+            the (M, 1) stride of each anchor, in the order of the model outputs.
+        """
+        key = (height, width)
+        if key not in self._anchorCache:
+            centers, strides = [], []
+            for stride in self._strides:
+                h, w = height // stride, width // stride
+                center = np.stack(np.mgrid[:h, :w][::-1], axis=-1).astype(np.float32)
+                center = (center * stride).reshape(-1, 2)
+                if self._numAnchors > 1:
+                    center = np.repeat(center, self._numAnchors, axis=0)
+                centers.append(center)
+                strides.append(np.full((len(center), 1), stride, dtype=np.float32))
+            self._anchorCache[key] = (np.concatenate(centers), np.concatenate(strides))
+        return self._anchorCache[key]
+
+    def _preprocess(self, image, inputSize) -> tuple[np.ndarray, float]:
+        # Resize keeping the aspect ratio, then pad to the input size
+        input_w, input_h = inputSize
+        im_ratio = float(image.shape[0]) / image.shape[1]
+        if im_ratio > float(input_h) / input_w:
+            new_height = input_h
+            new_width = int(new_height / im_ratio)
+        else:
+            new_width = input_w
+            new_height = int(new_width * im_ratio)
+        scale = float(new_height) / image.shape[0]
+
+        det_image = np.zeros((input_h, input_w, 3), dtype=np.uint8)
+        det_image[:new_height, :new_width, :] = cv.resize(
+            image, (new_width, new_height)
+        )
+
+        blob = cv.dnn.blobFromImage(
+            det_image,
+            1.0 / self._inputStd,
+            (input_w, input_h),
+            (self._inputMean, self._inputMean, self._inputMean),
+            swapRB=True,
+        )
+        return blob, scale
+
+    def _postprocess(
+        self, outputs: list[np.ndarray], height: int, width: int, scale: float
+    ) -> tuple[np.ndarray, np.ndarray]:
+        if self._batched:
+            outputs = [output[0] for output in outputs]
+
+        fmc = self._fmc
+        centers, strides = self._anchors(height, width)
+        scores = np.concatenate(outputs[:fmc]).ravel()
+
+        candidates = np.flatnonzero(scores >= self._confThreshold)
+        candidates = candidates[np.argsort(-scores[candidates], kind="stable")]
+        centers = centers[candidates]
+        strides = strides[candidates]
+
+        distances = np.concatenate(outputs[fmc : 2 * fmc])[candidates] * strides
+        det = np.empty((len(candidates), 5), dtype=np.float32)
+        det[:, :2] = centers - distances[:, :2]
+        det[:, 2:4] = centers + distances[:, 2:4]
+        det[:, :4] /= scale
+        det[:, 4] = scores[candidates]
+
+        if not self._useKps:
+            return det, None
+
+        offsets = np.concatenate(outputs[2 * fmc : 3 * fmc])[candidates]
+        kpss = centers[:, np.newaxis, :] + offsets.reshape(len(candidates), -1, 2) * (
+            strides[:, :, np.newaxis]
+        )
+        return det, kpss / scale
+
+    def infer(self, image, inputSize=None) -> tuple[np.ndarray, np.ndarray | None]:
+        """Detect face candidates above the confidence threshold.
+
+        Args:
+            image (np.ndarray): The input image.
+            inputSize (tuple[int, int] | None): The [w, h] input size of the
+                model for this image, multiple of 32, defaults to `inputSize`.
+
+        Returns:
+            out (tuple[np.ndarray, np.ndarray | None]): The (N, 5) candidates as
+            (x1, y1, x2, y2, score) sorted by decreasing score, and their (N, 5, 2)
+            keypoints. Overlapping candidates are not suppressed.
+        """
+        blob, scale = self._preprocess(image, inputSize or self._inputSize)
+        outputs = self._session.run(self._outputNames, {self._inputName: blob})
+        return self._postprocess(outputs, blob.shape[2], blob.shape[3], scale)
@@ -6,6 +6,7 @@
 
 import numpy as np
 import cv2 as cv
+import onnxruntime
 
 
 class SFace:
@@ -69,3 +70,131 @@ class SFace:
             return norml2_distance, (
                 1 if norml2_distance <= self._threshold_norml2 else 0
             )
+
+
+def similarityTransform(src: np.ndarray, dst: np.ndarray) -> np.ndarray:
+    """Least-squares similarity transform (Umeyama) mapping src onto dst.
+
+    Same estimation as the alignment of `cv.FaceRecognizerSF.alignCrop` and
+    `insightface.utils.face_align.norm_crop`.
+
+    Returns:
+        np.ndarray: The 2x3 affine matrix.
+    """
+    src = src.astype(np.float64)
+    dst = dst.astype(np.float64)
+    src_mean, dst_mean = src.mean(axis=0), dst.mean(axis=0)
+    src_demean, dst_demean = src - src_mean, dst - dst_mean
+
+    A = dst_demean.T @ src_demean / len(src)
+    d = np.ones(2)
+    if np.linalg.det(A) < 0:
+        d[1] = -1
+    U, S, Vt = np.linalg.svd(A)
+    if np.linalg.matrix_rank(A) == 1 and np.linalg.det(U) * np.linalg.det(Vt) > 0:
+        rotation = U @ Vt
+    elif np.linalg.matrix_rank(A) == 1:
+        rotation = U @ np.diag([1, -1]) @ Vt
+    else:
+        rotation = U @ np.diag(d) @ Vt
+
+    scale = (S @ d) / src_demean.var(axis=0).sum()
+    M = np.empty((2, 3))
+    M[:, :2] = scale * rotation
+    M[:, 2] = dst_mean - M[:, :2] @ src_mean
+    return M
+
+
+class SFaceONNX:
+    """SFace running on onnxruntime instead of OpenCV DNN.
+
+    Same interface and results as `SFace`, with the alignment of
+    `cv.FaceRecognizerSF.alignCrop` reimplemented, and `infer` also accepts
+    a list of aligned faces that are embedded in a single forward pass when
+    the model has a dynamic batch axis.
+    """
+
+    _dstPoints = np.array(
+        [
+            [38.2946, 51.6963],
+            [73.5318, 51.5014],
+            [56.0252, 71.7366],
+            [41.5493, 92.3655],
+            [70.7299, 92.2041],
+        ],
+        dtype=np.float32,
+    )
+
+    def __init__(self, modelPath, disType=0, numThreads=0, session=None):
+        self._modelPath = modelPath
+        if session is None:
+            options = onnxruntime.SessionOptions()
+            options.intra_op_num_threads = numThreads
+            session = onnxruntime.InferenceSession(
+                self._modelPath, options, providers=["CPUExecutionProvider"]
+            )
+        self._session = session
+        self._inputName = self._session.get_inputs()[0].name
+        self._batched = not isinstance(self._session.get_inputs()[0].shape[0], int)
+
+        self._disType = disType  # 0: cosine similarity, 1: Norm-L2 distance
+        assert self._disType in [
+            0,
+            1,
+        ], "0: Cosine similarity, 1: norm-L2 distance, others: invalid"
+
+        self._threshold_cosine = 0.363
+        self._threshold_norml2 = 1.128
+
+    @property
+    def name(self):
+        return self.__class__.__name__
+
+    def _preprocess(self, image, bbox):
+        if bbox is None:
+            return image
+        else:
+            M = similarityTransform(
+                np.asarray(bbox[4:14], dtype=np.float32).reshape(5, 2),
+                self._dstPoints,
+            )
+            return cv.warpAffine(image, M, (112, 112))
+
+    def _forward(self, images: list[np.ndarray]) -> np.ndarray:
+        blob = cv.dnn.blobFromImages(images, 1.0, (112, 112), (0, 0, 0), True, False)
+        return self._session.run(None, {self._inputName: blob})[0]
+
+    def infer(self, image, bbox=None):
+        if isinstance(image, list):
+            # Several aligned faces
+            if self._batched:
+                return self._forward(image)
+            return np.vstack([self._forward([chip]) for chip in image])
+
+        # Preprocess
+        inputBlob = self._preprocess(image, bbox)
+
+        # Forward
+        return self._forward([inputBlob])
+
+    def match(self, image1, face1, image2, face2):
+        feature1 = self.infer(image1, face1).ravel()
+        feature2 = self.infer(image2, face2).ravel()
+
+        if self._disType == 0:  # COSINE
+            cosine_score = float(
+                feature1
+                @ feature2
+                / (np.linalg.norm(feature1) * np.linalg.norm(feature2))
+            )
+            return cosine_score, 1 if cosine_score >= self._threshold_cosine else 0
+        else:  # NORM_L2
+            norml2_distance = float(
+                np.linalg.norm(
+                    feature1 / np.linalg.norm(feature1)
+                    - feature2 / np.linalg.norm(feature2)
+                )
+            )
+            return norml2_distance, (
+                1 if norml2_distance <= self._threshold_norml2 else 0
+            )
@@ -1,5 +1,7 @@
 import numpy as np
 import cv2 as cv
+import onnxruntime
+from lib.utils.nms import nms
 
 
 class YuNet:
@@ -56,4 +58,112 @@ class YuNet:
     def infer(self, image):
         # Forward
         faces = self._model.detect(image)
-        return np.empty(shape=(0, 5)) if faces[1] is None else faces[1]
+        return np.empty(shape=(0, 15)) if faces[1] is None else faces[1]
+
+
+class YuNetONNX:
+    """YuNet running on onnxruntime instead of OpenCV DNN.
+
+    Same interface and results as `YuNet`: the image is padded to a multiple
+    of 32 like `cv.FaceDetectorYN` and the outputs are decoded the same way,
+    vectorized over all strides. The input size is only taken from the image,
+    so one instance can be shared by concurrent detections.
+    """
+
+    _strides = [8, 16, 32]
+
+    def __init__(
+        self,
+        modelPath,
+        inputSize=[320, 320],
+        confThreshold=0.6,
+        nmsThreshold=0.3,
+        topK=5000,
+        numThreads=0,
+        session=None,
+    ):
+        self._modelPath = modelPath
+        self._inputSize = tuple(inputSize)  # [w, h]
+        self._confThreshold = confThreshold
+        self._nmsThreshold = nmsThreshold
+        self._topK = topK
+
+        if session is None:
+            options = onnxruntime.SessionOptions()
+            options.intra_op_num_threads = numThreads
+            session = onnxruntime.InferenceSession(
+                self._modelPath, options, providers=["CPUExecutionProvider"]
+            )
+        self._session = session
+        self._inputName = self._session.get_inputs()[0].name
+        self._outputNames = [
+            "{}_{}".format(output, stride)
+            for output in ["cls", "obj", "bbox", "kps"]
+            for stride in self._strides
+        ]
+
+        self._anchorCache: dict[tuple[int, int], tuple[np.ndarray, np.ndarray]] = {}
+
+    @property
+    def name(self):
+        return self.__class__.__name__
+
+    def setInputSize(self, input_size):
+        self._inputSize = tuple(input_size)
+
+    def _anchors(self, height: int, width: int) -> tuple[np.ndarray, np.ndarray]:
+        # (column, row) of every cell and its stride, in the order of the outputs
+        key = (height, width)
+        if key not in self._anchorCache:
+            cells, strides = [], []
+            for stride in self._strides:
+                rows, cols = height // stride, width // stride
+                cell = np.stack(np.mgrid[:rows, :cols][::-1], axis=-1)
+                cells.append(cell.reshape(-1, 2).astype(np.float32))
+                strides.append(np.full((rows * cols, 1), stride, dtype=np.float32))
+            self._anchorCache[key] = (np.concatenate(cells), np.concatenate(strides))
+        return self._anchorCache[key]
+
+    def _preprocess(self, image) -> np.ndarray:
+        # Pad to a multiple of 32 at the bottom and right, as cv.FaceDetectorYN
+        h, w = image.shape[:2]
+        pad_h, pad_w = (h - 1) // 32 * 32 + 32, (w - 1) // 32 * 32 + 32
+        image = cv.copyMakeBorder(
+            image, 0, pad_h - h, 0, pad_w - w, cv.BORDER_CONSTANT, value=0
+        )
+        return cv.dnn.blobFromImage(image)
+
+    def _postprocess(self, outputs: list[np.ndarray], height: int, width: int):
+        cells, strides = self._anchors(height, width)
+        cls, obj, bbox, kps = (
+            np.concatenate([output.reshape(-1, output.shape[-1]) for output in group])
+            for group in (outputs[0:3], outputs[3:6], outputs[6:9], outputs[9:12])
+        )
+
+        scores = np.sqrt(np.clip(cls, 0, 1) * np.clip(obj, 0, 1)).ravel()
+        candidates = np.flatnonzero(scores > self._confThreshold)
+        candidates = candidates[np.argsort(-scores[candidates], kind="stable")]
+        candidates = candidates[: self._topK]
+        cells, strides = cells[candidates], strides[candidates]
+
+        bbox, kps = bbox[candidates], kps[candidates]
+        faces = np.empty((len(candidates), 15), dtype=np.float32)
+        size = np.exp(bbox[:, 2:4]) * strides
+        faces[:, 0:2] = (cells + bbox[:, 0:2]) * strides - size / 2
+        faces[:, 2:4] = size
+        faces[:, 4:14] = (
+            (kps.reshape(-1, 5, 2) + cells[:, np.newaxis, :])
+            * strides[:, :, np.newaxis]
+        ).reshape(-1, 10)
+        faces[:, 14] = scores[candidates]
+
+        if self._nmsThreshold < 1.0:
+            boxes = faces[:, :4].copy()
+            boxes[:, 2:] += boxes[:, :2]
+            faces = faces[nms(boxes, faces[:, 14], self._nmsThreshold)]
+        return faces
+
+    def infer(self, image):
+        blob = self._preprocess(image)
+        outputs = self._session.run(self._outputNames, {self._inputName: blob})
+        return self._postprocess(outputs, blob.shape[2], blob.shape[3])
@@ -29,6 +29,23 @@ class DetectedFace:
             self.bbox, self.landmarks, self.confidence
         )
 
+    def scaled(self, sx: float, sy: float) -> "DetectedFace":
+        """The same face in an image resized by (sx, sy)."""
+        return DetectedFace(
+            {
+                "x": self.bbox["x"] * sx,
+                "y": self.bbox["y"] * sy,
+                "w": self.bbox["w"] * sx,
+                "h": self.bbox["h"] * sy,
+            },
+            (
+                {name: (x * sx, y * sy) for name, (x, y) in self.landmarks.items()}
+                if self.landmarks is not None
+                else None
+            ),
+            self.confidence,
+        )
+
     def to_dict(self):
         return {
             "bbox": {
@@ -1,15 +1,35 @@
 import cv2
+import numpy as np
 from abc import ABC, abstractmethod
 from lib.entities.face import DetectedFace
+from lib.utils.nms import nms
 
 
 class BaseFaceDetector(ABC):
+    _confThreshold: float
+    _nmsThreshold: float
+    _topK: int | None
+
     @abstractmethod
-    def detect(self, image: cv2.typing.MatLike) -> list[DetectedFace]:
+    def detect(
+        self,
+        image: cv2.typing.MatLike,
+        conf_threshold: float | None = None,
+        nms_threshold: float | None = None,
+        top_k: int | None = None,
+    ) -> list[DetectedFace]:
         """Detect faces in the input image.
 
+        The model runs once at a low floor threshold, then the thresholds of
+        the request are applied as a post-processing step, so they never
+        touch the shared model. Thresholds left to None use the defaults of
+        the detector.
+
         Args:
             image (np.ndarray): The input image.
+            conf_threshold (float | None): The minimum confidence of a face.
+            nms_threshold (float | None): The IoU above which overlapping faces are suppressed.
+            top_k (int | None): The maximum number of faces to return.
 
         Returns:
             list[DetectedFace]: A list of faces detected in the input image:
@@ -68,21 +88,126 @@ class BaseFaceDetector(ABC):
 
     @abstractmethod
     def set_confidence_threshold(self, threshold: float) -> None:
-        """Set the confidence threshold for the detector.
+        """Set the default confidence threshold for the detector.
 
         Args:
             threshold (float): The confidence threshold.
         """
         raise NotImplementedError()
 
+    def _select(
+        self,
+        boxes: np.ndarray,
+        scores: np.ndarray,
+        conf_threshold: float | None = None,
+        nms_threshold: float | None = None,
+        top_k: int | None = None,
+        offset: float = 0.0,
+    ) -> np.ndarray:
+        """Apply the thresholds of a request to the raw detections of the model.
+
+        Args:
+            boxes (np.ndarray): The raw boxes as (x1, y1, x2, y2), shape (N, 4).
+            scores (np.ndarray): The raw scores, shape (N,).
+            conf_threshold (float | None): The minimum confidence of a face.
+            nms_threshold (float | None): The IoU above which overlapping faces are suppressed.
+            top_k (int | None): The maximum number of faces to keep.
+            offset (float): Offset of the box sides in the IoU, see `nms`.
+
+        Returns:
+            np.ndarray: Indices of the kept detections, sorted by decreasing score.
+        """
+        if conf_threshold is None:
+            conf_threshold = self._confThreshold
+        if nms_threshold is None:
+            nms_threshold = self._nmsThreshold
+        if top_k is None:
+            top_k = self._topK
+
+        candidates = np.flatnonzero(scores >= conf_threshold)
+        keep = nms(boxes[candidates], scores[candidates], nms_threshold, top_k, offset)
+        return candidates[keep]
+
+    def detect_single(
+        self, image: cv2.typing.MatLike, **kwargs
+    ) -> tuple[cv2.typing.MatLike, DetectedFace | None]:
+        """Detect exactly one face in the input image.
+
+        Args:
+            image (MatLike): The input image.
+            **kwargs: Thresholds passed to `detect`.
+
+        Returns:
+            out (tuple[MatLike, DetectedFace | None]): The image the face was
+            detected in, which the face coordinates refer to, and the detected
+            face. The face is None if no face or several faces were found.
+        """
+        faces = self.detect(image, **kwargs)
+        if len(faces) != 1:
+            return (image, None)
+
+        return (image, faces[0])
+
+    def detect_downscaled(
+        self, image: cv2.typing.MatLike, scale: float, **kwargs
+    ) -> list[DetectedFace]:
+        """Detect faces at a reduced resolution, to lower the cost of detection.
+
+        Args:
+            image (MatLike): The input image.
+            scale (float): The resolution of the detection relative to the image.
+            **kwargs: Thresholds passed to `detect`.
+
+        Returns:
+            list[DetectedFace]: The detected faces, in the coordinates of the
+            input image.
+        """
+        if scale >= 1.0:
+            return self.detect(image, **kwargs)
+
+        h, w = image.shape[:2]
+        scaled_w, scaled_h = max(1, int(w * scale)), max(1, int(h * scale))
+        scaled_image = cv2.resize(
+            image, (scaled_w, scaled_h), interpolation=cv2.INTER_AREA
+        )
+        return [
+            face.scaled(w / scaled_w, h / scaled_h)
+            for face in self.detect(scaled_image, **kwargs)
+        ]
+
+    def detect_single_downscaled(
+        self, image: cv2.typing.MatLike, scale: float, **kwargs
+    ) -> tuple[cv2.typing.MatLike, DetectedFace | None]:
+        """Detect exactly one face at a reduced resolution.
+
+        Args:
+            image (MatLike): The input image.
+            scale (float): The resolution of the detection relative to the image.
+            **kwargs: Thresholds passed to `detect`.
+
+        Returns:
+            out (tuple[MatLike, DetectedFace | None]): Same as `detect_single`.
+        """
+        if scale >= 1.0:
+            return self.detect_single(image, **kwargs)
+
+        h, w = image.shape[:2]
+        scaled_image = cv2.resize(
+            image,
+            (max(1, int(w * scale)), max(1, int(h * scale))),
+            interpolation=cv2.INTER_AREA,
+        )
+        return self.detect_single(scaled_image, **kwargs)
+
     def detect_single_multiscale(
-        self, image: cv2.typing.MatLike, scale_factor: float = 1.1
+        self, image: cv2.typing.MatLike, scale_factor: float = 1.1, **kwargs
     ) -> tuple[DetectedFace, float] | tuple[None, None]:
         """Detect a single face in the input image with multiple scales.
 
         Args:
             image (MatLike): The input image.
             scale_factor (float): The factor to scale the image.
+            **kwargs: Thresholds passed to `detect`.
 
         Returns:
             out (tuple[DetectedFace, float] | tuple[None, None]): A tuple containing the detected face and the scale used to detect it. DetectedFace has the following format:
@@ -111,7 +236,7 @@ class BaseFaceDetector(ABC):
             h, w = int(scale * org_h), int(scale * org_w)
             scaled_image = cv2.resize(image, (w, h))
 
-            faces = self.detect(scaled_image)
+            faces = self.detect(scaled_image, **kwargs)
             if len(faces) >= 2:
                 return (None, None)
 
@@ -1,60 +1,99 @@
+import cv2
 import numpy as np
+from lib.cores.retinaface import RetinaFace
 from lib.entities.face import DetectedFace
 from lib.face_detector.base import BaseFaceDetector
-from insightface.model_zoo.retinaface import RetinaFace
 
 
 class RetinaFaceDetector(BaseFaceDetector):
     def __init__(
         self,
         confThreshold: float = 0.35,
+        nmsThreshold: float = 0.4,
+        topK: int | None = None,
+        floorThreshold: float = 0.2,
         model_file: str = "weights/det_10g.onnx",
     ):
         super().__init__()
-        self._retinaface = RetinaFace(model_file)
-        self._retinaface.prepare(-1, det_thresh=confThreshold, input_size=(640, 640))
+        self._confThreshold = confThreshold
+        self._nmsThreshold = nmsThreshold
+        self._topK = topK
+        self._retinaface = RetinaFace(
+            model_file, inputSize=(640, 640), confThreshold=floorThreshold
+        )
 
     def set_confidence_threshold(self, confThreshold: float):
-        self._retinaface.prepare(-1, det_thresh=confThreshold, input_size=(640, 640))
+        self._confThreshold = confThreshold
 
     def _convert_result_format(
         self, faces: tuple[np.ndarray, np.ndarray]
     ) -> list[DetectedFace]:
-        no_faces = faces[0].shape[0]
-        converted_faces = []
-
-        for i in range(no_faces):
-            bbox = faces[0][i][:4]
-            landmarks = faces[1][i]
-            conf = faces[0][i][4]
-
-            converted_faces.append(
-                DetectedFace(
-                    {
-                        "x": bbox[0],
-                        "y": bbox[1],
-                        "w": bbox[2] - bbox[0],
-                        "h": bbox[3] - bbox[1],
-                    },
-                    {
-                        "left_eye": landmarks[0],
-                        "right_eye": landmarks[1],
-                        "nose": landmarks[2],
-                        "left_mouth": landmarks[3],
-                        "right_mouth": landmarks[4],
-                    },
-                    conf,
-                )
+        # Converting the arrays to lists once is much faster than indexing them
+        boxes = faces[0][:, :4].tolist()
+        scores = faces[0][:, 4].tolist()
+        landmarks = faces[1].tolist()
+
+        return [
+            DetectedFace(
+                {
+                    "x": x1,
+                    "y": y1,
+                    "w": x2 - x1,
+                    "h": y2 - y1,
+                },
+                {
+                    "left_eye": tuple(points[0]),
+                    "right_eye": tuple(points[1]),
+                    "nose": tuple(points[2]),
+                    "left_mouth": tuple(points[3]),
+                    "right_mouth": tuple(points[4]),
+                },
+                conf,
             )
+            for (x1, y1, x2, y2), points, conf in zip(boxes, landmarks, scores)
+        ]
+
+    def detect(
+        self, image, conf_threshold=None, nms_threshold=None, top_k=None
+    ) -> list[DetectedFace]:
+        return self._detect(image, None, conf_threshold, nms_threshold, top_k)
+
+    def _detect(
+        self, image, input_size, conf_threshold, nms_threshold, top_k
+    ) -> list[DetectedFace]:
+        det, kpss = self._retinaface.infer(image, input_size)
+        # offset=1.0 keeps the pixel-inclusive IoU of insightface
+        keep = self._select(
+            det[:, :4], det[:, 4], conf_threshold, nms_threshold, top_k, offset=1.0
+        )
+        return self._convert_result_format((det[keep], kpss[keep]))
+
+    def detect_downscaled(self, image, scale, **kwargs) -> list[DetectedFace]:
+        # Images are resized to the 640x640 input of the model anyway, so the
+        # cost only goes down with a smaller input size
+        if scale >= 1.0:
+            return self.detect(image, **kwargs)
+
+        size = max(32, int(640 * scale) // 32 * 32)
+        return self._detect(
+            image,
+            (size, size),
+            kwargs.get("conf_threshold"),
+            kwargs.get("nms_threshold"),
+            kwargs.get("top_k"),
+        )
 
-        return converted_faces
+    def detect_single_downscaled(
+        self, image, scale, **kwargs
+    ) -> tuple[cv2.typing.MatLike, DetectedFace | None]:
+        faces = self.detect_downscaled(image, scale, **kwargs)
+        if len(faces) != 1:
+            return (image, None)
 
-    def detect(self, image):
-        faces = self._retinaface.detect(image)
-        return self._convert_result_format(faces)
+        return (image, faces[0])
 
     def detect_single_multiscale(
-        self, image, scale_factor=1.1
+        self, image, scale_factor=1.1, **kwargs
     ) -> tuple[DetectedFace, float] | tuple[None, None]:
         assert (
             False
@@ -1,4 +1,6 @@
-from lib.cores.yunet import YuNet
+import cv2
+import queue
+from lib.cores.yunet import YuNet, YuNetONNX
 from lib.entities.face import DetectedFace
 from lib.face_detector.base import BaseFaceDetector
 
@@ -7,20 +9,77 @@ class YuNetDetector(BaseFaceDetector):
     def __init__(
         self,
         confThreshold: float = 0.8,
+        nmsThreshold: float = 0.3,
+        topK: int | None = 5000,
+        floorThreshold: float = 0.5,
         model_file: str = "weights/face_detection_yunet_2023mar.onnx",
+        backend: str = "opencv",
+        numThreads: int = 0,
     ):
+        assert backend in [
+            "opencv",
+            "onnxruntime",
+        ], "YuNetDetector backend must be 'opencv' or 'onnxruntime'."
         self.model_path = model_file
-        self._yunet = YuNet(self.model_path, confThreshold=confThreshold)
+        self.backend = backend
+        self._numThreads = numThreads
+        self._confThreshold = confThreshold
+        self._nmsThreshold = nmsThreshold
+        self._topK = topK
+        self._floorThreshold = floorThreshold
+        # cv.FaceDetectorYN keeps the input size as state, so concurrent
+        # detections check out their own instance from this pool. The
+        # onnxruntime session is stateless and shared by all detections.
+        self._pool: queue.SimpleQueue[YuNet] = queue.SimpleQueue()
+        self._shared = self._create() if backend == "onnxruntime" else None
+        if self._shared is None:
+            self._pool.put(self._create())
+
+    def _create(self) -> YuNet | YuNetONNX:
+        # NMS of the model is disabled (IoU threshold 1.0), it is applied per request
+        if self.backend == "onnxruntime":
+            return YuNetONNX(
+                self.model_path,
+                confThreshold=self._floorThreshold,
+                nmsThreshold=1.0,
+                numThreads=self._numThreads,
+            )
+        return YuNet(
+            self.model_path,
+            confThreshold=self._floorThreshold,
+            nmsThreshold=1.0,
+        )
+
+    def _acquire(self) -> YuNet | YuNetONNX:
+        if self._shared is not None:
+            return self._shared
+        try:
+            return self._pool.get_nowait()
+        except queue.Empty:
+            return self._create()
+
+    def _release(self, yunet: YuNet | YuNetONNX):
+        if self._shared is None:
+            self._pool.put(yunet)
 
     def set_confidence_threshold(self, confThreshold: float):
-        if self._yunet._confThreshold != confThreshold:
-            self._yunet = YuNet(self.model_path, confThreshold=confThreshold)
+        self._confThreshold = confThreshold
 
-    def detect(self, image) -> list[DetectedFace]:
+    def detect(
+        self, image, conf_threshold=None, nms_threshold=None, top_k=None
+    ) -> list[DetectedFace]:
         h, w = image.shape[:2]
-        self._yunet.setInputSize((w, h))
-        faces = self._yunet.infer(image)
-        return self._convert_result_format(faces)
+        yunet = self._acquire()
+        try:
+            yunet.setInputSize((w, h))
+            faces = yunet.infer(image)
+        finally:
+            self._release(yunet)
+
+        boxes = faces[:, :4].copy()
+        boxes[:, 2:] += boxes[:, :2]
+        keep = self._select(boxes, faces[:, 14], conf_threshold, nms_threshold, top_k)
+        return self._convert_result_format(faces[keep])
 
     def _convert_result_format(self, faces: list[list[float]]) -> list[DetectedFace]:
         converted_faces = [
@@ -45,6 +104,16 @@ class YuNetDetector(BaseFaceDetector):
         return converted_faces
 
     def detect_single_multiscale(
-        self, image, scale_factor=1.1
+        self, image, scale_factor=1.1, **kwargs
     ) -> tuple[DetectedFace, float] | tuple[None, None]:
-        return super().detect_single_multiscale(image, scale_factor)
+        return super().detect_single_multiscale(image, scale_factor, **kwargs)
+
+    def detect_single(
+        self, image, **kwargs
+    ) -> tuple[cv2.typing.MatLike, DetectedFace | None]:
+        face, scale = self.detect_single_multiscale(image, **kwargs)
+        if face is None:
+            return (image, None)
+
+        h, w = image.shape[:2]
+        return (cv2.resize(image, (int(w * scale), int(h * scale))), face)
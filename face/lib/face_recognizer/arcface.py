@@ -4,9 +4,13 @@ import numpy as np
 from lib.entities.face import DetectedFace
 from lib.face_recognizer.base import BaseFaceRecognizer
 from insightface.model_zoo.arcface_onnx import ArcFaceONNX
+from insightface.utils import face_align
 
 
 class ArcFaceRecognizer(BaseFaceRecognizer):
+    # Threshold used by the server for the enrollment (FacesService.create)
+    default_threshold = 0.352
+
     def __init__(self, model_file: str = "weights/w600k_r50.onnx"):
         self._recognizer = ArcFaceONNX(model_file)
 
@@ -37,3 +41,15 @@ class ArcFaceRecognizer(BaseFaceRecognizer):
         converted_face = self._convert_input_face(face)
         # Integrated face alignment in function get (insightface/model_zoo/arcface_onnx.py)
         return self._recognizer.get(image, converted_face)
+
+    def align(self, image: cv2.typing.MatLike, face: DetectedFace) -> np.ndarray:
+        converted_face = self._convert_input_face(face)
+        return face_align.norm_crop(
+            image,
+            landmark=converted_face.kps,
+            image_size=self._recognizer.input_size[0],
+        )
+
+    def infer_aligned(self, chips: list[np.ndarray]) -> np.ndarray:
+        # ArcFaceONNX.get_feat stacks the chips into a single NCHW blob
+        return self._recognizer.get_feat(list(chips))
@@ -5,6 +5,9 @@ from lib.entities.face import DetectedFace
 
 
 class BaseFaceRecognizer(ABC):
+    # Cosine similarity above which two faces are considered the same person
+    default_threshold: float
+
     @abstractmethod
     def infer(self, image: cv2.typing.MatLike, face: DetectedFace) -> np.ndarray:
         """Extract features from the input image.
@@ -32,6 +35,52 @@ class BaseFaceRecognizer(ABC):
         """
         raise NotImplementedError()
 
+    @abstractmethod
+    def align(self, image: cv2.typing.MatLike, face: DetectedFace) -> np.ndarray:
+        """Crop and align a face region to the input size of the model.
+
+        Args:
+            image (np.ndarray): The input image.
+            face (DetectedFace): Face region to align.
+
+        Returns:
+            np.ndarray: The aligned face chip (BGR, 112x112).
+
+        """
+        raise NotImplementedError()
+
+    @abstractmethod
+    def infer_aligned(self, chips: list[np.ndarray]) -> np.ndarray:
+        """Extract features from aligned face chips.
+
+        Args:
+            chips (list[np.ndarray]): Aligned face chips returned by `align`.
+
+        Returns:
+            np.ndarray: The extracted features, one row per chip.
+
+        """
+        raise NotImplementedError()
+
+    def infer_batch(
+        self, image: cv2.typing.MatLike, faces: list[DetectedFace]
+    ) -> np.ndarray:
+        """Extract features from several face regions of the same image at once.
+
+        Args:
+            image (np.ndarray): The input image.
+            faces (list[DetectedFace]): Face regions to extract features from.
+
+        Returns:
+            np.ndarray: The extracted features, one row per face.
+
+        """
+        if len(faces) == 0:
+            return np.empty((0, 0), dtype=np.float32)
+
+        chips = [self.align(image, face) for face in faces]
+        return self.infer_aligned(chips)
+
     def match(
         self,
         image1: cv2.typing.MatLike,
@@ -1,13 +1,34 @@
 import cv2
+import threading
+from contextlib import nullcontext
 import numpy as np
-from lib.cores.sface import SFace
+from lib.cores.sface import SFace, SFaceONNX
 from lib.entities.face import DetectedFace
 from lib.face_recognizer.base import BaseFaceRecognizer
 
 
 class SFaceRecognizer(BaseFaceRecognizer):
-    def __init__(self):
-        self.recognizer = SFace("weights/face_recognition_sface_2021dec.onnx")
+    default_threshold = 0.363
+
+    def __init__(
+        self,
+        model_file: str = "weights/face_recognition_sface_2021dec.onnx",
+        backend: str = "opencv",
+        numThreads: int = 0,
+    ):
+        assert backend in [
+            "opencv",
+            "onnxruntime",
+        ], "SFaceRecognizer backend must be 'opencv' or 'onnxruntime'."
+        self.backend = backend
+        if backend == "onnxruntime":
+            self.recognizer = SFaceONNX(model_file, numThreads=numThreads)
+            self._lock = nullcontext()
+        else:
+            self.recognizer = SFace(model_file)
+            # The network of cv.FaceRecognizerSF does not support concurrent
+            # forward passes, onnxruntime sessions do
+            self._lock = threading.Lock()
 
     def _convert_input_face(self, face: DetectedFace):
         converted_face = np.array(
@@ -30,5 +51,18 @@ class SFaceRecognizer(BaseFaceRecognizer):
     def infer(self, image: cv2.typing.MatLike, face: DetectedFace) -> np.ndarray:
         converted_face = self._convert_input_face(face)
         # Integrated face alignment in the SFace model (function _preprocess in SFace class)
-        features = self.recognizer.infer(image, converted_face)
+        with self._lock:
+            features = self.recognizer.infer(image, converted_face)
         return features
+
+    def align(self, image: cv2.typing.MatLike, face: DetectedFace) -> np.ndarray:
+        converted_face = self._convert_input_face(face)
+        return self.recognizer._preprocess(image, converted_face)
+
+    def infer_aligned(self, chips: list[np.ndarray]) -> np.ndarray:
+        if self.backend == "onnxruntime":
+            # SFaceONNX embeds a list of chips at once
+            return self.recognizer.infer(list(chips))
+        # cv.FaceRecognizerSF only embeds one chip per forward pass
+        with self._lock:
+            return np.vstack([self.recognizer.infer(chip) for chip in chips])
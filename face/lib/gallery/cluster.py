@@ -0,0 +1,99 @@
+import numpy as np
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import connected_components
+from lib.gallery.roster import normalize
+
+
+def cluster_embeddings(
+    embeddings: np.ndarray,
+    threshold: float,
+    groups: np.ndarray | None = None,
+    linkage: str = "average",
+) -> np.ndarray:
+    """Group face embeddings that belong to the same identity.
+
+    Args:
+        embeddings (np.ndarray): The face embeddings, one row per face.
+        threshold (float): The minimum cosine similarity to merge two clusters.
+        groups (np.ndarray | None): The photo of each face. Faces of the same
+            photo are never put in the same cluster, since a person appears at
+            most once per photo. Only used by the average linkage.
+        linkage (str): "average" for agglomerative clustering with average
+            linkage, "single" for the connected components of the graph of
+            pairs above the threshold.
+
+    Returns:
+        np.ndarray: The cluster label of each face, from 0 to the number of
+        clusters - 1, numbered by first appearance.
+    """
+    n = len(embeddings)
+    if n == 0:
+        return np.empty((0,), dtype=np.int64)
+
+    features = normalize(embeddings)
+    similarity = features @ features.T
+
+    if linkage == "single":
+        _, labels = connected_components(
+            csr_matrix(similarity >= threshold), directed=False
+        )
+        return _relabel(labels)
+
+    similarity = similarity.astype(np.float64)
+    if groups is not None:
+        groups = np.asarray(groups)
+        similarity[groups[:, np.newaxis] == groups[np.newaxis, :]] = -np.inf
+    np.fill_diagonal(similarity, -np.inf)
+
+    labels = np.arange(n)
+    sizes = np.ones(n)
+    active = np.ones(n, dtype=bool)
+
+    while True:
+        index = int(np.argmax(similarity))
+        a, b = divmod(index, n)
+        if similarity[a, b] < threshold:
+            break
+
+        # Lance-Williams update of the average linkage, -inf keeps the
+        # cannot-link constraint of the faces of the same photo
+        merged = (sizes[a] * similarity[a] + sizes[b] * similarity[b]) / (
+            sizes[a] + sizes[b]
+        )
+        merged[~active] = -np.inf
+        merged[a] = -np.inf
+        similarity[a, :] = merged
+        similarity[:, a] = merged
+        similarity[b, :] = -np.inf
+        similarity[:, b] = -np.inf
+
+        sizes[a] += sizes[b]
+        active[b] = False
+        labels[labels == b] = a
+
+    return _relabel(labels)
+
+
+def medoids(embeddings: np.ndarray, labels: np.ndarray) -> np.ndarray:
+    """Find the face closest to all other faces of each cluster.
+
+    Args:
+        embeddings (np.ndarray): The face embeddings, one row per face.
+        labels (np.ndarray): The cluster labels returned by `cluster_embeddings`.
+
+    Returns:
+        np.ndarray: The index of the medoid face of each cluster.
+    """
+    features = normalize(embeddings)
+    result = np.empty(labels.max() + 1 if len(labels) > 0 else 0, dtype=np.int64)
+    for label in range(len(result)):
+        members = np.flatnonzero(labels == label)
+        cluster = features[members]
+        result[label] = members[np.argmax((cluster @ cluster.T).sum(axis=1))]
+    return result
+
+
+def _relabel(labels: np.ndarray) -> np.ndarray:
+    _, first, inverse = np.unique(labels, return_index=True, return_inverse=True)
+    order = np.argsort(np.argsort(first))
+    return order[inverse].astype(np.int64)
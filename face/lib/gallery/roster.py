@@ -0,0 +1,232 @@
+import os
+import threading
+import numpy as np
+from scipy.optimize import linear_sum_assignment
+
+
+def normalize(embeddings: np.ndarray) -> np.ndarray:
+    """L2-normalize the rows of an embedding matrix.
+
+    Args:
+        embeddings (np.ndarray): The embeddings, one row per face.
+
+    Returns:
+        np.ndarray: The normalized embeddings as float32.
+    """
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    if embeddings.ndim == 1:
+        embeddings = embeddings[np.newaxis, :]
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    return embeddings / np.maximum(norms, 1e-12)
+
+
+def embeddings_from_payload(students: list[dict]) -> list[tuple[str, np.ndarray]]:
+    """Parse the student ids and embeddings of an enrollment request.
+
+    Args:
+        students (list[dict]): A list of students:
+        [
+            {
+                student_id: str,
+                embeddings: list[list[float]]
+            },
+            ...
+        ]
+
+    Returns:
+        list[tuple[str, np.ndarray]]: The student id and the (n, size)
+        embeddings of each student, with the same size for every student.
+
+    Raises:
+        ValueError: If the payload is malformed.
+    """
+    if not isinstance(students, list) or len(students) == 0:
+        raise ValueError("Danh sách sinh viên không được để trống")
+
+    result = []
+    for student in students:
+        if not isinstance(student, dict) or "student_id" not in student:
+            raise ValueError("Mỗi sinh viên phải có student_id và embeddings")
+
+        student_id = str(student["student_id"])
+        embeddings = student.get("embeddings")
+        if not isinstance(embeddings, list) or len(embeddings) == 0:
+            raise ValueError("Sinh viên {} không có embedding nào".format(student_id))
+
+        try:
+            embeddings = np.asarray(embeddings, dtype=np.float32)
+        except ValueError:
+            raise ValueError("Các embedding phải có cùng kích thước")
+        except TypeError:
+            # A value that is not a number, such as an object
+            raise ValueError(
+                "Embedding của sinh viên {} không hợp lệ".format(student_id)
+            )
+        if embeddings.ndim != 2:
+            raise ValueError("Các embedding phải có cùng kích thước")
+        if not np.isfinite(embeddings).all():
+            raise ValueError(
+                "Embedding của sinh viên {} không hợp lệ".format(student_id)
+            )
+
+        result.append((student_id, embeddings))
+
+    sizes = {embeddings.shape[1] for _, embeddings in result}
+    if len(sizes) > 1:
+        raise ValueError("Các embedding phải có cùng kích thước")
+    return result
+
+
+class Roster:
+    """Normalized enrollment embeddings of the students of a class.
+
+    The embeddings of all students are stacked into a single matrix so that a
+    group photo can be scored against the whole class with one matrix product.
+    Rows of the same student are contiguous and start at `offsets[i]`.
+    """
+
+    def __init__(
+        self, student_ids: list[str], embeddings: np.ndarray, offsets: np.ndarray
+    ):
+        self.student_ids = [str(student_id) for student_id in student_ids]
+        self.embeddings = normalize(embeddings)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.student_ids)
+
+    @property
+    def size(self) -> int:
+        return self.embeddings.shape[1]
+
+    @classmethod
+    def from_payload(cls, students: list[dict]) -> "Roster":
+        """Build a roster from a request payload.
+
+        Args:
+            students (list[dict]): The students, see `embeddings_from_payload`.
+
+        Returns:
+            Roster: The roster.
+
+        Raises:
+            ValueError: If the payload is malformed.
+        """
+        parsed = embeddings_from_payload(students)
+        counts = [len(embeddings) for _, embeddings in parsed]
+        return cls(
+            [student_id for student_id, _ in parsed],
+            np.concatenate([embeddings for _, embeddings in parsed]),
+            np.concatenate([[0], np.cumsum(counts)[:-1]]),
+        )
+
+    @classmethod
+    def load(cls, path: str) -> "Roster":
+        with np.load(path, allow_pickle=False) as data:
+            return cls(
+                data["student_ids"].tolist(), data["embeddings"], data["offsets"]
+            )
+
+    def save(self, path: str) -> None:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        # Write to a temporary file first so readers never see a partial roster
+        tmp_path = "{}.{}.tmp".format(path, os.getpid())
+        with open(tmp_path, "wb") as f:
+            np.savez(
+                f,
+                student_ids=np.asarray(self.student_ids, dtype=np.str_),
+                embeddings=self.embeddings,
+                offsets=self.offsets,
+            )
+        os.replace(tmp_path, path)
+
+    def score(self, embeddings: np.ndarray) -> np.ndarray:
+        """Score face embeddings against every student of the roster.
+
+        Args:
+            embeddings (np.ndarray): The face embeddings, one row per face.
+
+        Returns:
+            np.ndarray: A (faces, students) matrix holding the best cosine
+            similarity between each face and the embeddings of each student.
+        """
+        if len(embeddings) == 0:
+            return np.empty((0, len(self)), dtype=np.float32)
+
+        faces = normalize(embeddings)
+        if faces.shape[1] != self.size:
+            raise ValueError(
+                "Kích thước embedding không khớp: {} != {}".format(
+                    faces.shape[1], self.size
+                )
+            )
+
+        scores = faces @ self.embeddings.T
+        return np.maximum.reduceat(scores, self.offsets, axis=1)
+
+    def assign(
+        self, scores: np.ndarray, threshold: float
+    ) -> list[tuple[int, int, float]]:
+        """Assign faces to students so that each student is matched at most once.
+
+        The assignment maximizes the total similarity, then pairs scoring
+        below the threshold are dropped.
+
+        Args:
+            scores (np.ndarray): The (faces, students) matrix returned by `score`.
+            threshold (float): The minimum similarity to accept a match.
+
+        Returns:
+            list[tuple[int, int, float]]: The matches as (face index,
+            student index, similarity).
+        """
+        if scores.size == 0:
+            return []
+
+        face_indices, student_indices = linear_sum_assignment(scores, maximize=True)
+        return [
+            (int(i), int(j), float(scores[i, j]))
+            for i, j in zip(face_indices, student_indices)
+            if scores[i, j] >= threshold
+        ]
+
+
+_cache: dict[str, tuple[int, Roster]] = {}
+_cache_lock = threading.Lock()
+
+
+def load_roster(path: str) -> Roster | None:
+    """Load a roster file, reusing the parsed roster while the file is unchanged.
+
+    Args:
+        path (str): Path to the roster file.
+
+    Returns:
+        Roster | None: The roster, or None if the file does not exist.
+    """
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+    with _cache_lock:
+        cached = _cache.get(path)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+
+    roster = Roster.load(path)
+    with _cache_lock:
+        _cache[path] = (mtime, roster)
+    return roster
+
+
+def remove_roster(path: str) -> bool:
+    with _cache_lock:
+        _cache.pop(path, None)
+
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        return False
+    return True
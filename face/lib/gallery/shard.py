@@ -0,0 +1,382 @@
+import zlib
+import threading
+import multiprocessing
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from lib.gallery.roster import embeddings_from_payload, normalize
+
+# A list of (student id, similarity) for each query, best first
+SearchResult = list[list[tuple[str, float]]]
+
+
+def shard_of(key: str, num_shards: int) -> int:
+    # crc32 is stable across processes, unlike the salted hash() of a str
+    return zlib.crc32(key.encode("utf-8")) % num_shards
+
+
+class GalleryShard:
+    """Normalized enrollment embeddings of a part of the gallery.
+
+    Like a `Roster`, the embeddings are stacked into a single matrix with the
+    rows of each student contiguous, so a query is scored against the whole
+    shard with one matrix product and reduced per student with
+    `np.maximum.reduceat`. The matrix is rebuilt lazily after enrollments.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._embeddings: dict[str, np.ndarray] = {}
+        self._classes: dict[str, frozenset[str]] = {}
+        self._matrix: np.ndarray | None = None
+        self._student_ids: list[str] = []
+        self._offsets = np.empty((0,), dtype=np.int64)
+        self._class_masks: dict[str, np.ndarray] = {}
+
+    def __len__(self):
+        return len(self._embeddings)
+
+    def upsert(self, students: list[tuple[str, np.ndarray, list[str]]]) -> None:
+        """Replace the embeddings and classes of students.
+
+        Args:
+            students (list[tuple[str, np.ndarray, list[str]]]): The student
+                id, embeddings and class ids of each student.
+        """
+        students = [
+            (student_id, normalize(embeddings), frozenset(class_ids))
+            for student_id, embeddings, class_ids in students
+        ]
+        with self._lock:
+            for student_id, embeddings, class_ids in students:
+                self._embeddings[student_id] = embeddings
+                self._classes[student_id] = class_ids
+            self._matrix = None
+
+    def remove(self, student_id: str) -> bool:
+        with self._lock:
+            self._classes.pop(student_id, None)
+            if self._embeddings.pop(student_id, None) is None:
+                return False
+            self._matrix = None
+            return True
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "student_count": len(self._embeddings),
+                "embedding_count": sum(len(e) for e in self._embeddings.values()),
+            }
+
+    def _build(self) -> None:
+        self._student_ids = list(self._embeddings)
+        counts = [len(self._embeddings[s]) for s in self._student_ids]
+        self._offsets = np.concatenate([[0], np.cumsum(counts)[:-1]]).astype(np.int64)
+        self._matrix = (
+            np.concatenate([self._embeddings[s] for s in self._student_ids])
+            if len(self._student_ids) > 0
+            else None
+        )
+        self._class_masks = {}
+
+    def _class_mask(self, class_id: str) -> np.ndarray:
+        # Called with the lock held, after _build
+        mask = self._class_masks.get(class_id)
+        if mask is None:
+            mask = np.array(
+                [class_id in self._classes[s] for s in self._student_ids], dtype=bool
+            )
+            self._class_masks[class_id] = mask
+        return mask
+
+    def search(
+        self, queries: np.ndarray, k: int, class_id: str | None = None
+    ) -> SearchResult:
+        """Find the k most similar students of each query.
+
+        Args:
+            queries (np.ndarray): The query embeddings, one row per face.
+            k (int): The number of students to return per query.
+            class_id (str | None): Only search the students of this class.
+
+        Returns:
+            SearchResult: The top-k (student id, similarity) of each query.
+        """
+        # The matrix is replaced, never modified, so it is searched unlocked
+        with self._lock:
+            if self._matrix is None:
+                self._build()
+            if self._matrix is None:
+                return [[] for _ in range(len(queries))]
+            matrix, student_ids, offsets = (
+                self._matrix,
+                self._student_ids,
+                self._offsets,
+            )
+            mask = self._class_mask(class_id) if class_id is not None else None
+
+        queries = normalize(queries)
+        if queries.shape[1] != matrix.shape[1]:
+            raise ValueError(
+                "Kích thước embedding không khớp: {} != {}".format(
+                    queries.shape[1], matrix.shape[1]
+                )
+            )
+
+        scores = np.maximum.reduceat(queries @ matrix.T, offsets, axis=1)
+        if mask is not None:
+            candidates = np.flatnonzero(mask)
+            scores = scores[:, candidates]
+        else:
+            candidates = np.arange(scores.shape[1])
+
+        k = min(k, scores.shape[1])
+        if k == 0:
+            return [[] for _ in range(len(queries))]
+
+        # Local top-k without sorting the whole shard
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        order = np.argsort(-top_scores, axis=1, kind="stable")
+        top = np.take_along_axis(top, order, axis=1)
+        top_scores = np.take_along_axis(top_scores, order, axis=1)
+
+        return [
+            [
+                (student_ids[candidates[j]], float(score))
+                for j, score in zip(row, row_scores)
+            ]
+            for row, row_scores in zip(top.tolist(), top_scores.tolist())
+        ]
+
+
+def _serve(connection) -> None:
+    # Main loop of a shard worker process, see ProcessShard
+    shard = GalleryShard()
+    while True:
+        message = connection.recv()
+        if message is None:
+            break
+
+        method, args = message
+        try:
+            connection.send((True, getattr(shard, method)(*args)))
+        except Exception as e:
+            connection.send((False, e))
+
+
+class ProcessShard:
+    """A `GalleryShard` held by a worker process.
+
+    Calls are forwarded through a pipe, one at a time, and the heavy matrix
+    product runs in the worker, so shards of the same gallery search in
+    parallel without sharing the memory of the service process.
+    """
+
+    def __init__(self, context: multiprocessing.context.BaseContext):
+        self._connection, child = context.Pipe()
+        self._lock = threading.Lock()
+        self._process = context.Process(target=_serve, args=(child,), daemon=True)
+        self._process.start()
+        child.close()
+
+    def _call(self, method: str, *args):
+        with self._lock:
+            self._connection.send((method, args))
+            ok, result = self._connection.recv()
+        if not ok:
+            raise result
+        return result
+
+    def __len__(self):
+        return self._call("__len__")
+
+    def upsert(self, students) -> None:
+        self._call("upsert", students)
+
+    def remove(self, student_id: str) -> bool:
+        return self._call("remove", student_id)
+
+    def stats(self) -> dict:
+        return self._call("stats")
+
+    def search(self, queries, k, class_id=None) -> SearchResult:
+        return self._call("search", queries, k, class_id)
+
+    def close(self) -> None:
+        with self._lock:
+            try:
+                self._connection.send(None)
+            except OSError:
+                pass
+        self._process.join(timeout=5)
+        self._connection.close()
+
+
+class ShardedGallery:
+    """1:N search over enrollment embeddings partitioned into shards.
+
+    Students are placed by a stable hash of their id ("student"), or of each
+    of their class ids ("class"), in which case a student of several classes
+    is stored once per shard of these classes and a search restricted to a
+    class only queries the shard of that class. Other searches fan out to
+    every shard in parallel, each one computes a local top-k, and the results
+    are merged keeping the best similarity of each student.
+
+    Shards live in the service process, or in worker processes when
+    `processes` is set (local multi-process mode).
+    """
+
+    def __init__(
+        self, num_shards: int = 1, shard_by: str = "student", processes: bool = False
+    ):
+        if shard_by not in ["student", "class"]:
+            raise ValueError("shard_by must be 'student' or 'class'")
+
+        self.shard_by = shard_by
+        if processes:
+            context = multiprocessing.get_context("spawn")
+            self.shards = [ProcessShard(context) for _ in range(num_shards)]
+        else:
+            self.shards = [GalleryShard() for _ in range(num_shards)]
+
+        self._lock = threading.Lock()
+        self._placement: dict[str, set[int]] = {}
+        # Size of the stored embeddings, None while the gallery is empty
+        self.size: int | None = None
+        self._pool = ThreadPoolExecutor(
+            max_workers=num_shards, thread_name_prefix="gallery-shard"
+        )
+
+    def __len__(self):
+        return len(self._placement)
+
+    def _shards_of(self, student_id: str, class_ids: list[str]) -> set[int]:
+        if self.shard_by == "class" and len(class_ids) > 0:
+            return {shard_of(class_id, len(self.shards)) for class_id in class_ids}
+        return {shard_of(student_id, len(self.shards))}
+
+    def upsert(self, students: list[tuple[str, np.ndarray, list[str]]]) -> None:
+        """Enroll students, replacing their previous embeddings and classes.
+
+        Args:
+            students (list[tuple[str, np.ndarray, list[str]]]): The student
+                id, embeddings and class ids of each student. The students of
+                a shard are sent to it in one call.
+
+        Raises:
+            ValueError: If the size of the embeddings differs from the ones
+                already stored, nothing is enrolled.
+        """
+        batches: list[list] = [[] for _ in self.shards]
+        with self._lock:
+            sizes = {np.shape(embeddings)[-1] for _, embeddings, _ in students}
+            if self.size is not None and len(self._placement) > 0:
+                sizes.add(self.size)
+            if len(sizes) > 1:
+                raise ValueError(
+                    "Kích thước embedding không khớp: {}".format(
+                        " != ".join(str(size) for size in sorted(sizes))
+                    )
+                )
+            if len(sizes) == 1:
+                self.size = sizes.pop()
+
+            for student_id, embeddings, class_ids in students:
+                shards = self._shards_of(student_id, class_ids)
+                for index in self._placement.get(student_id, set()) - shards:
+                    self.shards[index].remove(student_id)
+                for index in shards:
+                    batches[index].append(
+                        (student_id, normalize(embeddings), list(class_ids))
+                    )
+                self._placement[student_id] = shards
+
+            for shard, batch in zip(self.shards, batches):
+                if len(batch) > 0:
+                    shard.upsert(batch)
+
+    def remove(self, student_id: str) -> bool:
+        with self._lock:
+            shards = self._placement.pop(student_id, None)
+            if shards is None:
+                return False
+            for index in shards:
+                self.shards[index].remove(student_id)
+            return True
+
+    def search(
+        self, queries: np.ndarray, k: int = 1, class_id: str | None = None
+    ) -> SearchResult:
+        """Find the k most similar students of each query, see `GalleryShard.search`."""
+        queries = normalize(queries)
+        if self.shard_by == "class" and class_id is not None:
+            shards = [self.shards[shard_of(class_id, len(self.shards))]]
+        else:
+            shards = self.shards
+
+        if len(shards) == 1:
+            return shards[0].search(queries, k, class_id)
+
+        futures = [
+            self._pool.submit(shard.search, queries, k, class_id) for shard in shards
+        ]
+        partials = [future.result() for future in futures]
+
+        results = []
+        for query_results in zip(*partials):
+            best: dict[str, float] = {}
+            for student_id, similarity in (r for shard in query_results for r in shard):
+                if similarity > best.get(student_id, -np.inf):
+                    best[student_id] = similarity
+            results.append(
+                sorted(best.items(), key=lambda item: item[1], reverse=True)[:k]
+            )
+        return results
+
+    def stats(self) -> dict:
+        shards = [shard.stats() for shard in self.shards]
+        return {
+            "student_count": len(self),
+            "shard_by": self.shard_by,
+            "shards": shards,
+        }
+
+    def close(self) -> None:
+        self._pool.shutdown()
+        for shard in self.shards:
+            if isinstance(shard, ProcessShard):
+                shard.close()
+
+
+def students_from_payload(
+    students: list[dict],
+) -> list[tuple[str, np.ndarray, list[str]]]:
+    """Parse the students of an enrollment request.
+
+    Args:
+        students (list[dict]): The students, see `embeddings_from_payload`,
+        each one with optional class ids:
+        {
+            class_ids: list[str],  # defaults to no class
+        }
+
+    Returns:
+        list[tuple[str, np.ndarray, list[str]]]: The student id, embeddings
+        and class ids of each student, see `ShardedGallery.upsert`.
+
+    Raises:
+        ValueError: If the payload is malformed.
+    """
+    result = []
+    for student, (student_id, embeddings) in zip(
+        students, embeddings_from_payload(students)
+    ):
+        class_ids = student.get("class_ids", [])
+        if not isinstance(class_ids, list):
+            raise ValueError(
+                "class_ids của sinh viên {} phải là một danh sách".format(student_id)
+            )
+        result.append(
+            (student_id, embeddings, [str(class_id) for class_id in class_ids])
+        )
+    return result
@@ -0,0 +1,288 @@
+import math
+import threading
+import numpy as np
+from lib.gallery.cluster import medoids
+from lib.gallery.roster import normalize
+from lib.gallery.shard import ShardedGallery, students_from_payload
+
+
+class StudentTemplate:
+    """Fused template of the selfies of a student.
+
+    The template is the normalized, quality-weighted mean of the normalized
+    selfie embeddings. The weighted sum is kept, so adding or removing a
+    selfie updates the template without visiting the other selfies. A few
+    medoids can be added to the template for students whose selfies cover
+    different poses, see `medoids`.
+    """
+
+    def __init__(self, size: int):
+        self.size = size
+        self._faces: dict[str, tuple[np.ndarray, float]] = {}
+        self._sum = np.zeros((size,), dtype=np.float64)
+        self._medoids: dict[int, np.ndarray] = {}
+
+    def __len__(self):
+        return len(self._faces)
+
+    def copy(self) -> "StudentTemplate":
+        template = StudentTemplate(self.size)
+        template._faces = dict(self._faces)
+        template._sum = self._sum.copy()
+        return template
+
+    def add(self, face_id: str, embedding: np.ndarray, quality: float = 1.0) -> None:
+        """Add a selfie, replacing the selfie with the same id."""
+        embedding = normalize(embedding)[0]
+        if embedding.shape[0] != self.size:
+            raise ValueError(
+                "Kích thước embedding không khớp: {} != {}".format(
+                    embedding.shape[0], self.size
+                )
+            )
+
+        self.remove(face_id)
+        self._faces[face_id] = (embedding, quality)
+        self._sum += quality * embedding
+        self._medoids = {}
+
+    def remove(self, face_id: str) -> bool:
+        face = self._faces.pop(face_id, None)
+        if face is None:
+            return False
+
+        embedding, quality = face
+        if len(self._faces) == 0:
+            # Clear the rounding errors accumulated by the updates
+            self._sum[:] = 0
+        else:
+            self._sum -= quality * embedding
+        self._medoids = {}
+        return True
+
+    @property
+    def fused(self) -> np.ndarray:
+        """The fused template, normalized."""
+        return normalize(self._sum)[0]
+
+    def embeddings(self) -> np.ndarray:
+        """The normalized selfie embeddings, one row per selfie."""
+        return np.stack([embedding for embedding, _ in self._faces.values()])
+
+    def medoids(self, count: int, iterations: int = 10) -> np.ndarray:
+        """Selfies representing the poses of the student.
+
+        The selfies are partitioned into `count` groups by k-medoids on the
+        cosine similarity, seeded with the selfie closest to the fused
+        template and then the selfies least similar to the seeds.
+
+        Args:
+            count (int): The maximum number of medoids.
+            iterations (int): The maximum number of k-medoids iterations.
+
+        Returns:
+            np.ndarray: The medoid embeddings, one row per medoid.
+        """
+        count = min(count, len(self._faces))
+        if count == 0:
+            return np.empty((0, self.size), dtype=np.float32)
+        if count in self._medoids:
+            return self._medoids[count]
+
+        features = self.embeddings()
+        similarity = features @ features.T
+
+        centers = [int(np.argmax(features @ self.fused))]
+        while len(centers) < count:
+            centers.append(int(np.argmin(similarity[:, centers].max(axis=1))))
+
+        for _ in range(iterations):
+            _, labels = np.unique(
+                np.argmax(similarity[:, centers], axis=1), return_inverse=True
+            )
+            updated = medoids(features, labels).tolist()
+            if sorted(updated) == sorted(centers):
+                break
+            centers = updated
+
+        self._medoids[count] = features[centers]
+        return self._medoids[count]
+
+    def rows(self, medoid_count: int = 0) -> np.ndarray:
+        """The fused template followed by up to `medoid_count` medoids.
+
+        A student with no more selfies than that keeps one row per selfie.
+        """
+        if len(self._faces) <= medoid_count + 1:
+            return self.embeddings()
+        return np.concatenate(
+            [self.fused[np.newaxis, :], self.medoids(medoid_count)]
+        ).astype(np.float32)
+
+
+def templates_from_payload(
+    students: list[dict],
+) -> list[tuple[str, StudentTemplate, list[str]]]:
+    """Parse the students of an enrollment request into templates.
+
+    Args:
+        students (list[dict]): The students, see `students_from_payload`,
+        each one with optional lists parallel to its embeddings:
+        {
+            face_ids: list[str],  # defaults to the indices of the embeddings
+            qualities: list[float],  # defaults to 1
+        }
+
+    Returns:
+        list[tuple[str, StudentTemplate, list[str]]]: The student id,
+        template and class ids of each student.
+
+    Raises:
+        ValueError: If the payload is malformed.
+    """
+    result = []
+    for student, (student_id, embeddings, class_ids) in zip(
+        students, students_from_payload(students)
+    ):
+        face_ids = student.get("face_ids", list(range(len(embeddings))))
+        qualities = student.get("qualities", [1.0] * len(embeddings))
+        if (
+            not isinstance(face_ids, list)
+            or not isinstance(qualities, list)
+            or len(face_ids) != len(embeddings)
+            or len(qualities) != len(embeddings)
+        ):
+            raise ValueError(
+                "face_ids và qualities của sinh viên {} phải có cùng số phần tử với embeddings".format(
+                    student_id
+                )
+            )
+
+        template = StudentTemplate(embeddings.shape[1])
+        for face_id, embedding, quality in zip(face_ids, embeddings, qualities):
+            if (
+                not isinstance(quality, (int, float))
+                or not math.isfinite(quality)
+                or quality <= 0
+            ):
+                raise ValueError(
+                    "Chất lượng ảnh của sinh viên {} phải là số dương".format(
+                        student_id
+                    )
+                )
+            template.add(str(face_id), embedding, float(quality))
+        result.append((student_id, template, class_ids))
+    return result
+
+
+class TemplateStore:
+    """Selfies of the enrolled students and the rows they put in a gallery.
+
+    With `fusion`, each student contributes the fused template and up to
+    `medoid_count` medoids to the gallery, instead of one row per selfie, so
+    the search cost grows with the number of students rather than of
+    selfies. Adding or removing a selfie only re-enrolls its student.
+    """
+
+    def __init__(
+        self, gallery: ShardedGallery, fusion: bool = False, medoid_count: int = 0
+    ):
+        self.gallery = gallery
+        self.fusion = fusion
+        self.medoid_count = medoid_count
+        self._lock = threading.Lock()
+        self._templates: dict[str, StudentTemplate] = {}
+        self._classes: dict[str, list[str]] = {}
+
+    def _rows(self, template: StudentTemplate) -> np.ndarray:
+        if self.fusion:
+            return template.rows(self.medoid_count)
+        return template.embeddings()
+
+    def replace(self, students: list[tuple[str, StudentTemplate, list[str]]]) -> None:
+        """Enroll students, replacing their previous selfies and classes.
+
+        Raises:
+            ValueError: If the size of the embeddings differs from the gallery.
+        """
+        with self._lock:
+            # The gallery rejects embeddings of another size, before any change
+            self.gallery.upsert(
+                [
+                    (student_id, self._rows(template), class_ids)
+                    for student_id, template, class_ids in students
+                ]
+            )
+            for student_id, template, class_ids in students:
+                self._templates[student_id] = template
+                self._classes[student_id] = class_ids
+
+    def add_faces(
+        self,
+        student_id: str,
+        faces: list[tuple[str, np.ndarray, float]],
+        class_ids: list[str] | None = None,
+    ) -> StudentTemplate:
+        """Add selfies to a student, enrolling the student if needed.
+
+        Args:
+            student_id (str): The student id.
+            faces (list[tuple[str, np.ndarray, float]]): The face id, embedding
+                and quality of each selfie.
+            class_ids (list[str] | None): The new classes of the student, the
+                current classes are kept if None.
+
+        Returns:
+            StudentTemplate: The updated template.
+        """
+        with self._lock:
+            template = self._templates.get(student_id)
+            if template is None:
+                template = StudentTemplate(len(faces[0][1]))
+
+            # Validate every selfie before changing the stored template
+            updated = template.copy()
+            for face_id, embedding, quality in faces:
+                updated.add(face_id, embedding, quality)
+
+            if class_ids is None:
+                class_ids = self._classes.get(student_id, [])
+            self.gallery.upsert([(student_id, self._rows(updated), class_ids)])
+            self._templates[student_id] = updated
+            self._classes[student_id] = class_ids
+            return updated
+
+    def remove_face(self, student_id: str, face_id: str) -> bool:
+        """Remove a selfie, and the student once they have no selfie left."""
+        with self._lock:
+            template = self._templates.get(student_id)
+            if template is None or not template.remove(face_id):
+                return False
+
+            if len(template) == 0:
+                del self._templates[student_id]
+                del self._classes[student_id]
+                self.gallery.remove(student_id)
+            else:
+                self.gallery.upsert(
+                    [(student_id, self._rows(template), self._classes[student_id])]
+                )
+            return True
+
+    def remove(self, student_id: str) -> bool:
+        with self._lock:
+            if self._templates.pop(student_id, None) is None:
+                return False
+            del self._classes[student_id]
+            self.gallery.remove(student_id)
+            return True
+
+    def stats(self) -> dict:
+        with self._lock:
+            face_count = sum(len(template) for template in self._templates.values())
+        return {
+            "face_count": face_count,
+            "fusion": self.fusion,
+            "medoid_count": self.medoid_count,
+            **self.gallery.stats(),
+        }
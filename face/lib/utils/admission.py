@@ -0,0 +1,178 @@
+import os
+import math
+import json
+import logging
+import threading
+from http import HTTPStatus
+from PIL import Image
+from flask import Flask, Response, g, request
+from lib.utils.image import image_size
+
+logger = logging.getLogger(__name__)
+
+
+class MemoryBudget:
+    """Admission control of the requests by a global budget of decoded bytes.
+
+    The cost of a request is estimated before decoding, from the header of
+    each uploaded image (or the X-Frame-Width/X-Frame-Height of a raw frame),
+    as its pixels times `MEMORY_BUDGET_BYTES_PER_PIXEL`, which accounts for
+    the copies made by the decode, the color conversion and the detector
+    input. Requests wait up to `MEMORY_BUDGET_TIMEOUT` seconds for the
+    budget of `MEMORY_BUDGET` bytes to have room, and are rejected with 503
+    otherwise; a request that could never fit is rejected with 413. The
+    usage is served at `/memory_budget`. Disabled when `MEMORY_BUDGET` is 0.
+    """
+
+    def __init__(self, app: Flask | None = None):
+        self.used = 0
+        self.peak = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected = 0
+        self._condition = threading.Condition()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app: Flask) -> None:
+        app.config.setdefault(
+            "MEMORY_BUDGET", int(os.environ.get("MEMORY_BUDGET", 2 * 1024**3))
+        )
+        app.config.setdefault(
+            "MEMORY_BUDGET_BYTES_PER_PIXEL",
+            int(os.environ.get("MEMORY_BUDGET_BYTES_PER_PIXEL", 24)),
+        )
+        app.config.setdefault(
+            "MEMORY_BUDGET_TIMEOUT", float(os.environ.get("MEMORY_BUDGET_TIMEOUT", 10))
+        )
+
+        self.app = app
+        app.extensions["memory_budget"] = self
+        app.add_url_rule("/memory_budget", "memory_budget", self._usage)
+        if app.config["MEMORY_BUDGET"] <= 0:
+            return
+
+        app.before_request(self._before_request)
+        app.teardown_request(self._teardown_request)
+
+    def estimate(self) -> dict[str, float]:
+        """Estimated peak of the decoded bytes of the current request.
+
+        Returns:
+            dict[str, float]: The bytes of each field holding an image, "frame"
+            for a raw frame, infinite for an image that PIL refuses to decode.
+        """
+        pixels: dict[str, float] = {}
+        # Only multipart bodies are parsed, the body of a raw frame must stay
+        # unread for request.get_data(), whatever its content type
+        if request.mimetype == "multipart/form-data":
+            for name, file in request.files.items(multi=True):
+                try:
+                    size = image_size(file.stream)
+                except Image.DecompressionBombError:
+                    pixels[name] = math.inf
+                    continue
+                if size is not None:
+                    pixels[name] = pixels.get(name, 0) + size[0] * size[1]
+
+        # Raw frames of camera clients, see modules.common._frame_form
+        width = request.headers.get("X-Frame-Width", request.args.get("width"))
+        height = request.headers.get("X-Frame-Height", request.args.get("height"))
+        if width is not None and height is not None:
+            try:
+                pixels["frame"] = max(0, int(width)) * max(0, int(height))
+            except ValueError:
+                pass
+
+        bytes_per_pixel = self.app.config["MEMORY_BUDGET_BYTES_PER_PIXEL"]
+        return {
+            name: count * bytes_per_pixel for name, count in pixels.items() if count > 0
+        }
+
+    def acquire(self, cost: int, timeout: float) -> bool:
+        """Reserve `cost` bytes of the budget, waiting up to `timeout` seconds.
+
+        Returns:
+            bool: Whether the bytes were reserved.
+        """
+        budget = self.app.config["MEMORY_BUDGET"]
+        with self._condition:
+            self.waiting += 1
+            try:
+                admitted = self._condition.wait_for(
+                    lambda: self.used + cost <= budget, timeout
+                )
+            finally:
+                self.waiting -= 1
+
+            if not admitted:
+                self.rejected += 1
+                return False
+
+            self.used += cost
+            self.peak = max(self.peak, self.used)
+            self.admitted += 1
+            return True
+
+    def release(self, cost: int) -> None:
+        with self._condition:
+            self.used -= cost
+            self._condition.notify_all()
+
+    def _before_request(self) -> Response | None:
+        costs = self.estimate()
+        cost = sum(costs.values())
+        if cost == 0:
+            return None
+
+        budget = self.app.config["MEMORY_BUDGET"]
+        if cost > budget:
+            with self._condition:
+                self.rejected += 1
+            # The fields too large on their own, else every field
+            fields = [name for name, value in costs.items() if value > budget]
+            return Response(
+                json.dumps(
+                    {
+                        "errors": {
+                            name: ["Ảnh có độ phân giải quá lớn"]
+                            for name in fields or costs
+                        },
+                        "message": "Dữ liệu không hợp lệ",
+                    }
+                ),
+                status=HTTPStatus.REQUEST_ENTITY_TOO_LARGE,
+            )
+
+        if not self.acquire(cost, self.app.config["MEMORY_BUDGET_TIMEOUT"]):
+            logger.warning(
+                "metric=memory_budget_rejected cost=%d used=%d waiting=%d",
+                cost,
+                self.used,
+                self.waiting,
+            )
+            return Response(
+                json.dumps({"message": "Hệ thống đang quá tải, vui lòng thử lại sau"}),
+                status=HTTPStatus.SERVICE_UNAVAILABLE,
+                headers={"Retry-After": "1"},
+            )
+
+        g.memory_budget_cost = cost
+        return None
+
+    def _teardown_request(self, exc) -> None:
+        cost = g.pop("memory_budget_cost", None)
+        if cost is not None:
+            self.release(cost)
+
+    def _usage(self) -> Response:
+        with self._condition:
+            usage = {
+                "budget": self.app.config["MEMORY_BUDGET"],
+                "used": self.used,
+                "peak": self.peak,
+                "waiting": self.waiting,
+                "admitted": self.admitted,
+                "rejected": self.rejected,
+            }
+        return Response(json.dumps(usage), status=HTTPStatus.OK)
@@ -0,0 +1,226 @@
+import os
+import time
+import logging
+import threading
+from flask import Flask, current_app, request
+from lib.utils.executor import executor
+
+logger = logging.getLogger(__name__)
+
+# Cheaper model of each stage, used when the service is degraded
+CHEAPER_MODELS = {"retinaface": "yunet", "arcface": "sface"}
+
+
+class Degradation:
+    """The pipeline that actually serves a request."""
+
+    def __init__(
+        self,
+        model_detection: str,
+        model_recognition: str,
+        scale: float = 1.0,
+        modes: list[str] | None = None,
+    ):
+        self.model_detection = model_detection
+        self.model_recognition = model_recognition
+        self.scale = scale
+        self.modes = modes or []
+
+    def meta(self) -> dict:
+        return {
+            "pipeline": "{}+{}".format(self.model_detection, self.model_recognition),
+            "detection_scale": self.scale,
+            "degraded": self.modes,
+        }
+
+
+class DegradationPolicy:
+    """Opt-in load-aware degradation of the pipelines.
+
+    A monitor thread samples, every `DEGRADE_INTERVAL` seconds, the CPU
+    utilization of the process and the queue wait: the longest wait of the
+    tasks of the shared executor and, behind a proxy that sets
+    `X-Request-Start`, of the requests themselves. The service becomes
+    degraded when the CPU reaches `DEGRADE_CPU` or the queue wait reaches
+    `DEGRADE_QUEUE_WAIT`, and recovers once both stayed below
+    `DEGRADE_RECOVERY` times their threshold for `DEGRADE_COOLDOWN` seconds.
+
+    While degraded, requests that allow it with the `X-Allow-Degradation`
+    header are served by the cheaper models ("pipeline") and/or detect faces
+    at `DEGRADE_SCALE` times the resolution ("resolution"). Disabled unless
+    `DEGRADE_ENABLED` is set. State changes are logged as metrics.
+    """
+
+    def __init__(self, app: Flask | None = None):
+        self.degraded = False
+        self._lock = threading.Lock()
+        self._request_waits: list[float] = []
+        self._degraded_requests = 0
+        self._changed_at = time.monotonic()
+        self._calm_since: float | None = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app: Flask) -> None:
+        app.config.setdefault(
+            "DEGRADE_ENABLED", os.environ.get("DEGRADE_ENABLED", "0") == "1"
+        )
+        app.config.setdefault(
+            "DEGRADE_QUEUE_WAIT", float(os.environ.get("DEGRADE_QUEUE_WAIT", 0.5))
+        )
+        app.config.setdefault("DEGRADE_CPU", float(os.environ.get("DEGRADE_CPU", 0.9)))
+        app.config.setdefault(
+            "DEGRADE_RECOVERY", float(os.environ.get("DEGRADE_RECOVERY", 0.7))
+        )
+        app.config.setdefault(
+            "DEGRADE_COOLDOWN", float(os.environ.get("DEGRADE_COOLDOWN", 30))
+        )
+        app.config.setdefault(
+            "DEGRADE_INTERVAL", float(os.environ.get("DEGRADE_INTERVAL", 1))
+        )
+        app.config.setdefault(
+            "DEGRADE_SCALE", float(os.environ.get("DEGRADE_SCALE", 0.5))
+        )
+
+        self.app = app
+        app.extensions["degradation"] = self
+        if not app.config["DEGRADE_ENABLED"]:
+            return
+
+        app.before_request(self._before_request)
+        threading.Thread(target=self._monitor, daemon=True).start()
+
+    def _before_request(self) -> None:
+        # X-Request-Start: t=<seconds, milliseconds or microseconds since epoch>
+        header = request.headers.get("X-Request-Start")
+        if header is None:
+            return
+
+        try:
+            started_at = float(header.removeprefix("t="))
+        except ValueError:
+            return
+        while started_at > 1e11:
+            started_at /= 1000
+
+        with self._lock:
+            self._request_waits.append(max(0.0, time.time() - started_at))
+
+    def _monitor(self) -> None:
+        interval = self.app.config["DEGRADE_INTERVAL"]
+        cpus = (
+            len(os.sched_getaffinity(0))
+            if hasattr(os, "sched_getaffinity")
+            else os.cpu_count() or 1
+        )
+
+        last_wall, last_cpu = time.monotonic(), time.process_time()
+        while True:
+            time.sleep(interval)
+            wall, cpu = time.monotonic(), time.process_time()
+            utilization = (cpu - last_cpu) / ((wall - last_wall) * cpus)
+            last_wall, last_cpu = wall, cpu
+
+            with self._lock:
+                request_waits, self._request_waits = self._request_waits, []
+            queue_wait = max(executor.queue_wait(), max(request_waits, default=0.0))
+
+            self.update(utilization, queue_wait, wall)
+
+    def update(self, cpu: float, queue_wait: float, now: float) -> None:
+        """Apply one sample of the load to the state of the policy.
+
+        Args:
+            cpu (float): The CPU utilization of the process, from 0 to 1.
+            queue_wait (float): The queue wait in seconds.
+            now (float): The time of the sample (time.monotonic).
+        """
+        config = self.app.config
+        overloaded = (
+            cpu >= config["DEGRADE_CPU"] or queue_wait >= config["DEGRADE_QUEUE_WAIT"]
+        )
+        calm = (
+            cpu < config["DEGRADE_CPU"] * config["DEGRADE_RECOVERY"]
+            and queue_wait < config["DEGRADE_QUEUE_WAIT"] * config["DEGRADE_RECOVERY"]
+        )
+
+        if not self.degraded:
+            if overloaded:
+                self._change(True, cpu, queue_wait, now)
+            return
+
+        if not calm:
+            self._calm_since = None
+        elif self._calm_since is None:
+            self._calm_since = now
+        elif now - self._calm_since >= config["DEGRADE_COOLDOWN"]:
+            self._change(False, cpu, queue_wait, now)
+
+    def _change(self, degraded: bool, cpu: float, queue_wait: float, now: float):
+        with self._lock:
+            degraded_requests, self._degraded_requests = self._degraded_requests, 0
+
+        logger.warning(
+            "metric=degradation_state state=%s cpu=%.3f queue_wait=%.3f "
+            "previous_state_seconds=%.1f degraded_requests=%d",
+            "degraded" if degraded else "normal",
+            cpu,
+            queue_wait,
+            now - self._changed_at,
+            degraded_requests,
+        )
+        self.degraded = degraded
+        self._changed_at = now
+        self._calm_since = None
+
+    def resolve(self, pipeline: str, keep_recognizer: bool = False) -> Degradation:
+        """Choose the pipeline that serves the current request.
+
+        Args:
+            pipeline (str): The requested pipeline, e.g. "retinaface+arcface".
+            keep_recognizer (bool): Never switch the recognizer, for requests
+                whose embeddings are compared with embeddings of that model.
+
+        Returns:
+            Degradation: The models and detection scale to use.
+        """
+        model_det_name, model_rec_name = pipeline.split("+")
+        if not self.degraded:
+            return Degradation(model_det_name, model_rec_name)
+
+        allowed = [
+            mode.strip().lower()
+            for mode in request.headers.get("X-Allow-Degradation", "").split(",")
+        ]
+
+        modes = []
+        if "pipeline" in allowed:
+            cheaper_det = CHEAPER_MODELS.get(model_det_name, model_det_name)
+            cheaper_rec = (
+                model_rec_name
+                if keep_recognizer
+                else CHEAPER_MODELS.get(model_rec_name, model_rec_name)
+            )
+            if (cheaper_det, cheaper_rec) != (model_det_name, model_rec_name):
+                model_det_name, model_rec_name = cheaper_det, cheaper_rec
+                modes.append("pipeline")
+
+        scale = 1.0
+        if "resolution" in allowed:
+            scale = self.app.config["DEGRADE_SCALE"]
+            modes.append("resolution")
+
+        if len(modes) > 0:
+            with self._lock:
+                self._degraded_requests += 1
+        return Degradation(model_det_name, model_rec_name, scale, modes)
+
+
+def resolve_pipeline(pipeline: str, keep_recognizer: bool = False) -> Degradation:
+    """Choose the pipeline that serves the current request, see
+    `DegradationPolicy.resolve`. Without a policy, the requested pipeline."""
+    policy = current_app.extensions.get("degradation")
+    if policy is None:
+        model_det_name, model_rec_name = pipeline.split("+")
+        return Degradation(model_det_name, model_rec_name)
+    return policy.resolve(pipeline, keep_recognizer)
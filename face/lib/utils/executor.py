@@ -0,0 +1,65 @@
+import os
+import time
+import itertools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+class MonitoredThreadPoolExecutor(ThreadPoolExecutor):
+    """ThreadPoolExecutor that measures how long tasks wait for a worker.
+
+    The wait of a task is the time between `submit` and the start of its
+    execution, which grows once every worker is busy.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._wait_lock = threading.Lock()
+        self._task_ids = itertools.count()
+        self._pending: dict[int, float] = {}
+        # Longest wait of the tasks started since the last queue_wait()
+        self._max_wait = 0.0
+
+    def submit(self, fn, /, *args, **kwargs):
+        task_id = next(self._task_ids)
+        queued_at = time.monotonic()
+        with self._wait_lock:
+            self._pending[task_id] = queued_at
+
+        def run():
+            started_at = time.monotonic()
+            with self._wait_lock:
+                self._pending.pop(task_id, None)
+                self._max_wait = max(self._max_wait, started_at - queued_at)
+            return fn(*args, **kwargs)
+
+        try:
+            return super().submit(run)
+        except RuntimeError:
+            with self._wait_lock:
+                self._pending.pop(task_id, None)
+            raise
+
+    def queue_wait(self) -> float:
+        """Longest wait since the previous call, in seconds.
+
+        Covers the tasks that started since the previous call and the tasks
+        still waiting, so a queue where nothing starts is still visible.
+        """
+        now = time.monotonic()
+        with self._wait_lock:
+            wait, self._max_wait = self._max_wait, 0.0
+            oldest = next(iter(self._pending.values()), None)
+
+        return max(wait, now - oldest if oldest is not None else 0.0)
+
+
+# Name prefix of the worker threads, used by the profiler to sample them
+THREAD_NAME_PREFIX = "face-worker"
+
+# OpenCV and onnxruntime release the GIL, so independent images of a request
+# can be decoded, detected and aligned in parallel threads.
+executor = MonitoredThreadPoolExecutor(
+    max_workers=int(os.environ.get("FACE_WORKERS", os.cpu_count() or 4)),
+    thread_name_prefix=THREAD_NAME_PREFIX,
+)
@@ -0,0 +1,183 @@
+import base64
+import cv2
+import numpy as np
+from PIL import Image, ImageOps
+
+
+def read_image(stream) -> cv2.typing.MatLike:
+    """Decode an uploaded image into an OpenCV BGR image.
+
+    The EXIF orientation is applied before the conversion, so the returned
+    image has the same orientation as the one shown to the user.
+
+    Args:
+        stream: A file-like object containing a jpg or png image.
+
+    Returns:
+        MatLike: The decoded image in BGR order.
+    """
+    pil_image = Image.open(stream)
+    pil_image = ImageOps.exif_transpose(pil_image)
+    pil_image = pil_image.convert("RGB")
+    cv_image = np.array(pil_image)
+    return cv_image[:, :, ::-1].copy()
+
+
+def image_size(stream) -> tuple[int, int] | None:
+    """Read the size of an uploaded image from its header, without decoding.
+
+    The position of the stream is restored, so it can still be decoded with
+    `read_image`.
+
+    Args:
+        stream: A seekable file-like object containing an image.
+
+    Returns:
+        tuple[int, int] | None: The width and height of the image, or None if
+        the stream is not an image.
+
+    Raises:
+        Image.DecompressionBombError: If the image is too large to be decoded.
+    """
+    position = stream.tell()
+    try:
+        with Image.open(stream) as pil_image:
+            return pil_image.size
+    except (OSError, ValueError):
+        return None
+    finally:
+        stream.seek(position)
+
+
+# Size of the aligned face chips produced by SFace alignCrop and ArcFace norm_crop
+CHIP_SIZE = 112
+
+
+def encode_chip(chip: np.ndarray, chip_format: str) -> dict:
+    """Encode an aligned face chip for a JSON response.
+
+    Args:
+        chip (np.ndarray): The aligned face chip (BGR, 112x112).
+        chip_format (str): "jpeg" for a compact JPEG, "raw" for the raw BGR bytes.
+
+    Returns:
+        dict: The encoded chip:
+        {
+            format: "jpeg" | "raw",
+            width: int,
+            height: int,
+            data: str  # base64
+        }
+    """
+    if chip_format == "jpeg":
+        ok, buffer = cv2.imencode(".jpg", chip, [cv2.IMWRITE_JPEG_QUALITY, 95])
+        if not ok:
+            raise ValueError("Cannot encode the face chip as JPEG")
+        data = buffer.tobytes()
+    else:
+        data = np.ascontiguousarray(chip, dtype=np.uint8).tobytes()
+
+    return {
+        "format": chip_format,
+        "width": int(chip.shape[1]),
+        "height": int(chip.shape[0]),
+        "data": base64.b64encode(data).decode("ascii"),
+    }
+
+
+def decode_chip(data: bytes, filename: str) -> np.ndarray | None:
+    """Decode an aligned face chip uploaded as JPEG, PNG or raw BGR bytes.
+
+    The format is chosen from the extension of the file, so an encoded chip
+    of exactly 112 * 112 * 3 bytes is never read as raw pixels.
+
+    Args:
+        data (bytes): The content of the uploaded chip.
+        filename (str): The name of the uploaded file, ".raw" for raw bytes.
+
+    Returns:
+        np.ndarray | None: The chip (BGR, 112x112), or None if the data is not
+        a 112x112 image.
+    """
+    if filename.lower().endswith(".raw"):
+        if len(data) != CHIP_SIZE * CHIP_SIZE * 3:
+            return None
+        return np.frombuffer(data, dtype=np.uint8).reshape(CHIP_SIZE, CHIP_SIZE, 3)
+
+    chip = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if chip is None or chip.shape[:2] != (CHIP_SIZE, CHIP_SIZE):
+        return None
+    return chip
+
+
+# Pixel formats of the raw frames sent by camera clients
+FRAME_FORMATS = ["bgr", "rgb", "gray", "nv12", "i420"]
+
+
+def frame_layout(width: int, height: int, pixel_format: str) -> tuple[int, int]:
+    """Number of rows and minimum bytes per row of a raw frame buffer.
+
+    YUV 4:2:0 frames (nv12, i420) are stored as a luma plane followed by the
+    chroma planes, i.e. height * 3 / 2 rows of width bytes.
+
+    Returns:
+        out (tuple[int, int]): The number of rows and the bytes per row
+        without padding.
+    """
+    if pixel_format in ["nv12", "i420"]:
+        return height * 3 // 2, width
+    channels = 1 if pixel_format == "gray" else 3
+    return height, width * channels
+
+
+def read_frame(
+    data: bytes,
+    width: int,
+    height: int,
+    pixel_format: str = "bgr",
+    stride: int | None = None,
+) -> cv2.typing.MatLike:
+    """Wrap a raw frame buffer into an OpenCV BGR image.
+
+    BGR frames are not copied: the image is a read-only view of `data`, with
+    `stride` as row step. Other formats are converted to BGR in one pass.
+    The buffer must hold exactly `stride * rows` bytes, see `frame_layout`.
+
+    Args:
+        data (bytes): The raw pixels.
+        width (int): The frame width in pixels.
+        height (int): The frame height in pixels.
+        pixel_format (str): One of FRAME_FORMATS.
+        stride (int | None): The bytes per row (of the luma plane for YUV
+            frames), defaults to the row size without padding.
+
+    Returns:
+        MatLike: The frame in BGR order.
+    """
+    rows, row_bytes = frame_layout(width, height, pixel_format)
+    stride = stride or row_bytes
+    buffer = np.frombuffer(data, dtype=np.uint8)
+    if len(buffer) != stride * rows:
+        raise ValueError("Frame buffer size does not match its layout")
+
+    # Rows of row_bytes pixels, every stride bytes
+    plane = np.lib.stride_tricks.as_strided(
+        buffer, shape=(rows, row_bytes), strides=(stride, 1), writeable=False
+    )
+    if pixel_format == "gray":
+        return cv2.cvtColor(plane, cv2.COLOR_GRAY2BGR)
+    if pixel_format == "nv12":
+        return cv2.cvtColor(plane, cv2.COLOR_YUV2BGR_NV12)
+    if pixel_format == "i420":
+        if stride != row_bytes:
+            # Chroma rows are stride / 2 apart, they are packed two per row
+            chroma = buffer[height * stride :].reshape(-1, stride // 2)
+            plane = np.vstack(
+                [plane[:height], chroma[:, : width // 2].reshape(-1, width)]
+            )
+        return cv2.cvtColor(plane, cv2.COLOR_YUV2BGR_I420)
+
+    image = plane.reshape(rows, width, 3)
+    if pixel_format == "rgb":
+        return cv2.cvtColor(image, cv2.COLOR_RGB2BGR)
+    return image
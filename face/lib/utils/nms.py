@@ -0,0 +1,74 @@
+import numpy as np
+
+
+def nms(
+    boxes: np.ndarray,
+    scores: np.ndarray,
+    iou_threshold: float,
+    top_k: int | None = None,
+    offset: float = 0.0,
+    block_size: int = 64,
+) -> np.ndarray:
+    """Greedy non-maximum suppression.
+
+    Boxes are processed by blocks of decreasing score: the IoU within a block
+    and between the boxes kept in a block and all the following boxes are
+    computed as matrices, so the Python loop only walks over precomputed
+    overlaps. The result is the same as the usual box-by-box greedy loop.
+
+    Args:
+        boxes (np.ndarray): The boxes as (x1, y1, x2, y2), shape (N, 4).
+        scores (np.ndarray): The scores of the boxes, shape (N,).
+        iou_threshold (float): Boxes overlapping a kept box with an IoU above
+            this threshold are suppressed.
+        top_k (int | None): The maximum number of boxes to keep.
+        offset (float): Added to the box sides when computing areas, 1.0
+            reproduces the pixel-inclusive IoU of insightface.
+        block_size (int): The number of boxes per block.
+
+    Returns:
+        np.ndarray: Indices of the kept boxes, sorted by decreasing score.
+    """
+    if len(boxes) == 0:
+        return np.empty((0,), dtype=np.int64)
+
+    order = np.argsort(-scores, kind="stable")
+    x1, y1, x2, y2 = (np.ascontiguousarray(boxes[order, i]) for i in range(4))
+    areas = (x2 - x1 + offset) * (y2 - y1 + offset)
+
+    def overlaps(rows: np.ndarray, columns: np.ndarray) -> np.ndarray:
+        # IoU above the threshold between every row box and column box
+        r = rows[:, np.newaxis]
+        w = np.maximum(
+            0.0,
+            np.minimum(x2[r], x2[columns]) - np.maximum(x1[r], x1[columns]) + offset,
+        )
+        h = np.maximum(
+            0.0,
+            np.minimum(y2[r], y2[columns]) - np.maximum(y1[r], y1[columns]) + offset,
+        )
+        inter = w * h
+        return inter / (areas[r] + areas[columns] - inter) > iou_threshold
+
+    keep = []
+    suppressed = np.zeros(len(order), dtype=bool)
+    for start in range(0, len(order), block_size):
+        end = min(start + block_size, len(order))
+        block = overlaps(np.arange(start, end), np.arange(start, end))
+
+        kept = []
+        for i in range(start, end):
+            if suppressed[i]:
+                continue
+            kept.append(i)
+            if top_k is not None and len(keep) + len(kept) >= top_k:
+                return order[keep + kept]
+            suppressed[start:end] |= block[i - start]
+        keep += kept
+
+        # Only the boxes that are still candidates need to be compared
+        rest = np.flatnonzero(~suppressed[end:]) + end
+        if len(kept) > 0 and len(rest) > 0:
+            suppressed[rest] = overlaps(np.asarray(kept), rest).any(axis=0)
+
+    return order[keep]
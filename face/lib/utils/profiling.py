@@ -0,0 +1,258 @@
+import os
+import re
+import sys
+import hmac
+import json
+import time
+import uuid
+import random
+import threading
+import tracemalloc
+from collections import Counter
+from flask import Flask, g, request
+from lib.utils.executor import THREAD_NAME_PREFIX
+
+# Files written by RequestProfiler: <date>-<time>-<endpoint>-<id>.folded|.json
+PROFILE_FILE_PATTERN = re.compile(r"^\d{8}-\d{6}-\w+-[0-9a-f]{8}\.(folded|json)$")
+
+
+class SamplingProfiler:
+    """Sample the call stacks of a request at a fixed interval.
+
+    The request thread is sampled together with the busy worker threads of
+    the shared executor, where detection, alignment and embedding run. Each
+    stack starts with "request" or the name of the worker thread. Workers
+    are shared, so tasks of concurrent requests can appear in the samples.
+
+    The samples are aggregated as collapsed stacks ("folded" format), which
+    can be rendered directly by flamegraph.pl, speedscope or inferno. While
+    tracemalloc is tracing, a snapshot is also kept each time the traced
+    memory grows past its previous high, so the allocations alive around the
+    peak can be inspected after the request has released them.
+    """
+
+    def __init__(self, thread_id: int, interval: float = 0.005):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples: Counter[str] = Counter()
+        self.peak_snapshot: tracemalloc.Snapshot | None = None
+        self.peak_snapshot_size = 0
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        while not self._stopped.wait(self.interval):
+            frames = sys._current_frames()
+            threads = [("request", frames.get(self.thread_id))] + [
+                (thread.name, frames.get(thread.ident))
+                for thread in threading.enumerate()
+                if thread.name.startswith(THREAD_NAME_PREFIX)
+            ]
+            for root, frame in threads:
+                # Idle workers wait for a task in ThreadPoolExecutor._worker
+                if frame is None or (
+                    root != "request" and frame.f_code.co_name == "_worker"
+                ):
+                    continue
+
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(
+                        "{} ({}:{})".format(
+                            code.co_name,
+                            os.path.basename(code.co_filename),
+                            code.co_firstlineno,
+                        )
+                    )
+                    frame = frame.f_back
+                stack.append(root)
+
+                self.samples[";".join(reversed(stack))] += 1
+
+            if tracemalloc.is_tracing():
+                current, _ = tracemalloc.get_traced_memory()
+                if current > self.peak_snapshot_size * 1.1:
+                    self.peak_snapshot_size = current
+                    self.peak_snapshot = tracemalloc.take_snapshot().filter_traces(
+                        [
+                            tracemalloc.Filter(False, __file__),
+                            tracemalloc.Filter(False, tracemalloc.__file__),
+                        ]
+                    )
+
+    def write_folded(self, path: str) -> None:
+        with open(path, "w") as f:
+            for stack, count in self.samples.most_common():
+                f.write("{} {}\n".format(stack, count))
+
+
+class RequestProfiler:
+    """Opt-in per-request profiling of the Flask app.
+
+    A request is profiled when it carries the `X-Profile` header with the
+    value of `PROFILE_TOKEN`, or when it is picked by `PROFILE_SAMPLE_RATE`.
+    For each profiled request, a folded stack file and a JSON summary with the
+    tracemalloc peak and the top allocation sites are written to
+    `PROFILE_DIR`, which keeps at most `PROFILE_MAX_FILES` requests.
+
+    Only one request is profiled at a time because tracemalloc is global.
+    """
+
+    def __init__(self, app: Flask | None = None):
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app: Flask) -> None:
+        app.config.setdefault("PROFILE_TOKEN", os.environ.get("PROFILE_TOKEN"))
+        app.config.setdefault(
+            "PROFILE_SAMPLE_RATE", float(os.environ.get("PROFILE_SAMPLE_RATE", 0))
+        )
+        app.config.setdefault("PROFILE_DIR", os.environ.get("PROFILE_DIR", "profiles"))
+        app.config.setdefault(
+            "PROFILE_MAX_FILES", int(os.environ.get("PROFILE_MAX_FILES", 50))
+        )
+        app.config.setdefault(
+            "PROFILE_INTERVAL", float(os.environ.get("PROFILE_INTERVAL", 0.005))
+        )
+
+        self.app = app
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+
+    def _requested(self) -> bool:
+        token = self.app.config["PROFILE_TOKEN"]
+        header = request.headers.get("X-Profile")
+        if token and header and hmac.compare_digest(header, token):
+            return True
+
+        return random.random() < self.app.config["PROFILE_SAMPLE_RATE"]
+
+    def _before_request(self) -> None:
+        if not self._requested() or not self._lock.acquire(blocking=False):
+            return
+
+        g.profile_started_at = time.perf_counter()
+        g.profile_was_tracing = tracemalloc.is_tracing()
+        if g.profile_was_tracing:
+            tracemalloc.reset_peak()
+        else:
+            tracemalloc.start()
+
+        g.profiler = SamplingProfiler(
+            threading.get_ident(), self.app.config["PROFILE_INTERVAL"]
+        )
+        g.profiler.start()
+
+    def _after_request(self, response):
+        profiler = g.pop("profiler", None)
+        if profiler is None:
+            return response
+
+        try:
+            profile_id = self._finish(profiler, response.status_code)
+        finally:
+            self._lock.release()
+
+        response.headers["X-Profile-Id"] = profile_id
+        return response
+
+    def _teardown_request(self, exc) -> None:
+        # after_request is skipped when the view raises an unhandled exception
+        profiler = g.pop("profiler", None)
+        if profiler is None:
+            return
+
+        try:
+            self._finish(profiler, 500)
+        finally:
+            self._lock.release()
+
+    def _finish(self, profiler: SamplingProfiler, status_code: int) -> str:
+        profiler.stop()
+        elapsed = time.perf_counter() - g.profile_started_at
+
+        current, peak = tracemalloc.get_traced_memory()
+        if not g.profile_was_tracing:
+            tracemalloc.stop()
+
+        profile_dir = self.app.config["PROFILE_DIR"]
+        os.makedirs(profile_dir, exist_ok=True)
+
+        profile_id = "{}-{}-{}".format(
+            time.strftime("%Y%m%d-%H%M%S"),
+            (request.endpoint or "unknown").replace(".", "_"),
+            uuid.uuid4().hex[:8],
+        )
+        profiler.write_folded(os.path.join(profile_dir, profile_id + ".folded"))
+
+        top_allocations = [
+            {
+                "location": "{}:{}".format(
+                    stat.traceback[0].filename, stat.traceback[0].lineno
+                ),
+                "size": stat.size,
+                "count": stat.count,
+            }
+            for stat in (
+                profiler.peak_snapshot.statistics("lineno")
+                if profiler.peak_snapshot is not None
+                else []
+            )[:20]
+        ]
+        with open(os.path.join(profile_dir, profile_id + ".json"), "w") as f:
+            json.dump(
+                {
+                    "id": profile_id,
+                    "method": request.method,
+                    "path": request.path,
+                    "status": status_code,
+                    "elapsed": elapsed,
+                    "samples": sum(profiler.samples.values()),
+                    "interval": profiler.interval,
+                    "memory": {
+                        "current": current,
+                        "peak": peak,
+                        "peak_snapshot_size": profiler.peak_snapshot_size,
+                        "top_allocations": top_allocations,
+                    },
+                },
+                f,
+                indent=2,
+            )
+
+        self._prune(profile_dir)
+        return profile_id
+
+    def _prune(self, profile_dir: str) -> None:
+        # PROFILE_DIR may be shared, so only the profiles are considered
+        entries = [
+            entry
+            for entry in os.scandir(profile_dir)
+            if entry.is_file() and PROFILE_FILE_PATTERN.match(entry.name)
+        ]
+
+        # Each profiled request writes two files, kept or removed together
+        latest: dict[str, float] = {}
+        for entry in entries:
+            profile_id = os.path.splitext(entry.name)[0]
+            latest[profile_id] = max(latest.get(profile_id, 0.0), entry.stat().st_mtime)
+        newest = sorted(latest, key=latest.get, reverse=True)
+        kept = set(newest[: self.app.config["PROFILE_MAX_FILES"]])
+
+        for entry in entries:
+            if os.path.splitext(entry.name)[0] in kept:
+                continue
+            try:
+                os.remove(entry.path)
+            except FileNotFoundError:
+                pass
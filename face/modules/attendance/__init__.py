@@ -0,0 +1,190 @@
+import os, re, json
+from http import HTTPStatus
+from flask import Blueprint, Response, current_app
+from lib.gallery.roster import Roster, load_roster, remove_roster
+from lib.utils.degradation import resolve_pipeline
+from lib.utils.image import read_image
+from modules.common import model_detection, model_recognition
+from modules.attendance.form import AttendanceForm, RosterForm
+
+bp = Blueprint("attendance", __name__)
+
+
+def _roster_path(class_id: str, model_rec_name: str) -> str:
+    return os.path.join(
+        current_app.config["ROSTER_DIR"], model_rec_name, "{}.npz".format(class_id)
+    )
+
+
+def _invalid(errors: dict[str, list[str]]) -> Response:
+    return Response(
+        json.dumps({"errors": errors, "message": "Dữ liệu không hợp lệ"}),
+        status=HTTPStatus.BAD_REQUEST,
+    )
+
+
+@bp.route("/", methods=["POST"])
+def attendance():
+    form = AttendanceForm()
+    if not form.validate_on_submit():
+        return _invalid(form.errors)
+
+    # The roster holds embeddings of the requested recognizer, so only the
+    # detection can be degraded
+    degradation = resolve_pipeline(form.pipeline.data, keep_recognizer=True)
+    model_det_name = degradation.model_detection
+    model_rec_name = degradation.model_recognition
+
+    # Roster from the request body takes priority over the cached roster
+    if form.roster.data:
+        try:
+            roster = Roster.from_payload(json.loads(form.roster.data))
+        except ValueError as e:
+            return _invalid({"roster": [str(e)]})
+    elif form.class_id.data:
+        roster = load_roster(_roster_path(form.class_id.data, model_rec_name))
+        if roster is None:
+            return _invalid({"class_id": ["Chưa có danh sách sinh viên của lớp này"]})
+    else:
+        return _invalid(
+            {"roster": ["Vui lòng cung cấp danh sách sinh viên hoặc mã lớp"]}
+        )
+
+    threshold = (
+        form.threshold.data
+        if form.threshold.data is not None
+        else model_recognition[model_rec_name].default_threshold
+    )
+
+    image = read_image(form.image.data.stream)
+    detected_faces = model_detection[model_det_name].detect_downscaled(
+        image,
+        degradation.scale,
+        conf_threshold=form.conf_threshold.data,
+        nms_threshold=form.nms_threshold.data,
+        top_k=form.top_k.data,
+    )
+    embeddings = model_recognition[model_rec_name].infer_batch(image, detected_faces)
+
+    try:
+        scores = roster.score(embeddings)
+    except ValueError as e:
+        return _invalid({"roster": [str(e)]})
+
+    matches = roster.assign(scores, threshold)
+
+    faces = [detected_face.to_dict() for detected_face in detected_faces]
+    matched_faces = {face_index for face_index, _, _ in matches}
+    matched_students = {student_index for _, student_index, _ in matches}
+
+    # Best similarity of each absent student, to help reviewing borderline cases
+    best_scores = (
+        scores.max(axis=0).tolist() if len(faces) > 0 else [None] * len(roster)
+    )
+
+    present = [
+        {
+            "student_id": roster.student_ids[student_index],
+            "similarity": similarity,
+            "face": faces[face_index],
+        }
+        for face_index, student_index, similarity in matches
+    ]
+    absent = [
+        {
+            "student_id": student_id,
+            "similarity": best_scores[student_index],
+        }
+        for student_index, student_id in enumerate(roster.student_ids)
+        if student_index not in matched_students
+    ]
+    unknown = [
+        face for face_index, face in enumerate(faces) if face_index not in matched_faces
+    ]
+
+    return Response(
+        json.dumps(
+            {
+                "present": present,
+                "absent": absent,
+                "unknown": unknown,
+                "meta": {
+                    "face_count": len(faces),
+                    "student_count": len(roster),
+                    "present_count": len(present),
+                    "threshold": threshold,
+                    "model_detection": model_det_name,
+                    "model_recognition": model_rec_name,
+                    **degradation.meta(),
+                },
+                "message": "Điểm danh thành công",
+            }
+        ),
+        status=HTTPStatus.OK,
+    )
+
+
+@bp.route("/roster/<class_id>", methods=["PUT"])
+def put_roster(class_id: str):
+    if not re.match(r"^[A-Za-z0-9_-]+$", class_id):
+        return _invalid(
+            {"class_id": ["Mã lớp chỉ được chứa chữ cái, chữ số, '_' và '-'"]}
+        )
+
+    form = RosterForm()
+    if not form.validate_on_submit():
+        return _invalid(form.errors)
+
+    try:
+        roster = Roster.from_payload(json.loads(form.roster.data))
+    except ValueError as e:
+        return _invalid({"roster": [str(e)]})
+
+    _, model_rec_name = form.pipeline.data.split("+")
+    roster.save(_roster_path(class_id, model_rec_name))
+
+    return Response(
+        json.dumps(
+            {
+                "meta": {
+                    "class_id": class_id,
+                    "student_count": len(roster),
+                    "embedding_count": len(roster.embeddings),
+                    "size": roster.size,
+                    "model_recognition": model_rec_name,
+                },
+                "message": "Cập nhật danh sách sinh viên thành công",
+            }
+        ),
+        status=HTTPStatus.OK,
+    )
+
+
+@bp.route("/roster/<class_id>", methods=["DELETE"])
+def delete_roster(class_id: str):
+    if not re.match(r"^[A-Za-z0-9_-]+$", class_id):
+        return _invalid(
+            {"class_id": ["Mã lớp chỉ được chứa chữ cái, chữ số, '_' và '-'"]}
+        )
+
+    removed = [
+        model_rec_name
+        for model_rec_name in model_recognition
+        if remove_roster(_roster_path(class_id, model_rec_name))
+    ]
+
+    if len(removed) == 0:
+        return Response(
+            json.dumps({"message": "Không tìm thấy danh sách sinh viên của lớp này"}),
+            status=HTTPStatus.NOT_FOUND,
+        )
+
+    return Response(
+        json.dumps(
+            {
+                "meta": {"class_id": class_id, "model_recognition": removed},
+                "message": "Xóa danh sách sinh viên thành công",
+            }
+        ),
+        status=HTTPStatus.OK,
+    )
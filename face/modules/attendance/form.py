@@ -0,0 +1,102 @@
+from flask_wtf import FlaskForm
+from wtforms import StringField, FileField, FloatField, IntegerField
+from wtforms.validators import DataRequired, Regexp, Optional, NumberRange
+from flask_wtf.file import FileRequired, FileAllowed, FileSize
+
+
+class AttendanceForm(FlaskForm):
+    class Meta:
+        csrf = False
+
+    image = FileField(
+        "image",
+        validators=[
+            FileRequired(message="Vui lòng chọn file ảnh lớp học"),
+            FileAllowed(
+                ["jpg", "jpeg", "png"],
+                message="Chỉ hỗ trợ các định dạng ảnh: jpg, jpeg, png",
+            ),
+            FileSize(
+                max_size=10 * 1024 * 1024,
+                message="Kích thước file ảnh không được vượt quá 10MB",
+            ),
+        ],
+    )
+    pipeline = StringField(
+        "pipeline",
+        validators=[
+            DataRequired(
+                message="Vui lòng chọn pipeline. Các pipeline hiện có: 'yunet+sface', 'retinaface+arcface'"
+            ),
+            Regexp(
+                "^(yunet\+sface|retinaface\+arcface)$",
+                message="Pipeline không hợp lệ. Các pipeline hiện có: 'yunet+sface', 'retinaface+arcface'",
+            ),
+        ],
+    )
+    class_id = StringField(
+        "class_id",
+        validators=[
+            Optional(),
+            Regexp(
+                "^[A-Za-z0-9_-]+$",
+                message="Mã lớp chỉ được chứa chữ cái, chữ số, '_' và '-'",
+            ),
+        ],
+    )
+    roster = StringField("roster", validators=[Optional()])
+    threshold = FloatField(
+        "threshold",
+        validators=[
+            Optional(),
+            NumberRange(min=-1, max=1, message="Ngưỡng phải nằm trong khoảng [-1, 1]"),
+        ],
+    )
+
+    conf_threshold = FloatField(
+        "conf_threshold",
+        validators=[
+            Optional(),
+            NumberRange(
+                min=0, max=1, message="Ngưỡng tin cậy phải nằm trong khoảng [0, 1]"
+            ),
+        ],
+    )
+    nms_threshold = FloatField(
+        "nms_threshold",
+        validators=[
+            Optional(),
+            NumberRange(
+                min=0, max=1, message="Ngưỡng NMS phải nằm trong khoảng [0, 1]"
+            ),
+        ],
+    )
+    top_k = IntegerField(
+        "top_k",
+        validators=[
+            Optional(),
+            NumberRange(min=1, message="Số khuôn mặt tối đa phải lớn hơn 0"),
+        ],
+    )
+
+
+class RosterForm(FlaskForm):
+    class Meta:
+        csrf = False
+
+    pipeline = StringField(
+        "pipeline",
+        validators=[
+            DataRequired(
+                message="Vui lòng chọn pipeline. Các pipeline hiện có: 'yunet+sface', 'retinaface+arcface'"
+            ),
+            Regexp(
+                "^(yunet\+sface|retinaface\+arcface)$",
+                message="Pipeline không hợp lệ. Các pipeline hiện có: 'yunet+sface', 'retinaface+arcface'",
+            ),
+        ],
+    )
+    roster = StringField(
+        "roster",
+        validators=[DataRequired(message="Vui lòng cung cấp danh sách sinh viên")],
+    )
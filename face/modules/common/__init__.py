@@ -1,24 +1,38 @@
+import os
 import json
-import cv2
 import numpy as np
 from http import HTTPStatus
-from PIL import Image, ImageOps
-from flask import Blueprint, Response
+from flask import Blueprint, Response, request
+from werkzeug.datastructures import MultiDict
 from lib.face_detector.retinaface import RetinaFaceDetector
 from lib.face_detector.yunet import YuNetDetector
 from lib.face_recognizer.arcface import ArcFaceRecognizer
 from lib.face_recognizer.base import BaseFaceRecognizer
 from lib.face_recognizer.sface import SFaceRecognizer
 from lib.face_detector.base import BaseFaceDetector
-from modules.common.form import GetForm
+from lib.gallery.cluster import cluster_embeddings, medoids
+from lib.utils.degradation import resolve_pipeline
+from lib.utils.executor import executor
+from lib.utils.image import (
+    read_image,
+    encode_chip,
+    decode_chip,
+    frame_layout,
+    read_frame,
+)
+from modules.common.form import GetForm, EmbedForm, ClusterForm, FrameForm
 
 bp = Blueprint("common", __name__)
+# Inference backend of YuNet and SFace ("opencv" or "onnxruntime") and the
+# number of threads per onnxruntime session (0 for the onnxruntime default)
+backend = os.environ.get("FACE_BACKEND", "opencv")
+num_threads = int(os.environ.get("FACE_ORT_THREADS", 0))
 model_detection: dict[str, BaseFaceDetector] = {
-    "yunet": YuNetDetector(),
+    "yunet": YuNetDetector(backend=backend, numThreads=num_threads),
     "retinaface": RetinaFaceDetector(),
 }
 model_recognition: dict[str, BaseFaceRecognizer] = {
-    "sface": SFaceRecognizer(),
+    "sface": SFaceRecognizer(backend=backend, numThreads=num_threads),
     "arcface": ArcFaceRecognizer(),
 }
 
@@ -32,26 +46,38 @@ def get():
             status=HTTPStatus.BAD_REQUEST,
         )
 
-    pil_image = Image.open(form.image.data.stream)
-    pil_image = ImageOps.exif_transpose(pil_image)
-    pil_image = pil_image.convert("RGB")
-    cv_image = np.array(pil_image)
-    image = cv_image[:, :, ::-1].copy()
+    image = read_image(form.image.data.stream)
+    return _get(image, form)
 
-    model_det_name, model_rec_name = form.pipeline.data.split("+")
 
-    detected_faces = model_detection[model_det_name].detect(image)
-    embeddings = [
-        model_recognition[model_rec_name].infer(image, detected_face).tolist()
+def _get(image, form: GetForm | FrameForm) -> Response:
+    degradation = resolve_pipeline(form.pipeline.data)
+    model_det_name = degradation.model_detection
+    model_rec_name = degradation.model_recognition
+    thresholds = {
+        "conf_threshold": form.conf_threshold.data,
+        "nms_threshold": form.nms_threshold.data,
+        "top_k": form.top_k.data,
+    }
+
+    detected_faces = model_detection[model_det_name].detect_downscaled(
+        image, degradation.scale, **thresholds
+    )
+    chips = [
+        model_recognition[model_rec_name].align(image, detected_face)
         for detected_face in detected_faces
     ]
-
-    if len(embeddings) > 0 and model_rec_name == "sface":
-        embeddings = [embedding[0] for embedding in embeddings]
+    embeddings = (
+        model_recognition[model_rec_name].infer_aligned(chips).tolist()
+        if len(chips) > 0
+        else []
+    )
 
     faces = [detected_face.to_dict() for detected_face in detected_faces]
-    for face, embedding in zip(faces, embeddings):
+    for face, embedding, chip in zip(faces, embeddings, chips):
         face["embedding"] = embedding
+        if form.chip.data:
+            face["chip"] = encode_chip(chip, form.chip.data)
 
     return Response(
         json.dumps(
@@ -60,6 +86,7 @@ def get():
                 "meta": {
                     "face_count": len(embeddings),
                     "size": len(embeddings[0]) if len(embeddings) > 0 else 0,
+                    **degradation.meta(),
                 },
                 "message": "Phát hiện và trích xuất thành công",
             }
@@ -77,61 +104,45 @@ def get_single():
             status=HTTPStatus.BAD_REQUEST,
         )
 
-    pil_image = Image.open(form.image.data.stream)
-    pil_image = ImageOps.exif_transpose(pil_image)
-    pil_image = pil_image.convert("RGB")
-    cv_image = np.array(pil_image)
-    image = cv_image[:, :, ::-1].copy()
+    image = read_image(form.image.data.stream)
+    return _get_single(image, form, "image")
 
-    model_det_name, model_rec_name = form.pipeline.data.split("+")
-
-    detected_face = None
-    if model_det_name == "yunet":
-        detected_face, scale = model_detection[model_det_name].detect_single_multiscale(
-            image
-        )
-        if detected_face is None:
-            return Response(
-                json.dumps(
-                    {
-                        "errors": {
-                            "image": [
-                                "Không tìm thấy khuôn mặt hoặc tìm thấy nhiều khuôn mặt"
-                            ],
-                        },
-                        "message": "Dữ liệu không hợp lệ",
-                    }
-                ),
-                status=HTTPStatus.BAD_REQUEST,
-            )
 
-        h, w = image.shape[:2]
-        image = cv2.resize(image, (int(w * scale), int(h * scale)))
-    else:
-        detected_face = model_detection[model_det_name].detect(image)
-        if len(detected_face) != 1:
-            return Response(
-                json.dumps(
-                    {
-                        "errors": {
-                            "image": [
-                                "Không tìm thấy khuôn mặt hoặc tìm thấy nhiều khuôn mặt"
-                            ],
-                        },
-                        "message": "Dữ liệu không hợp lệ",
-                    }
-                ),
-                status=HTTPStatus.BAD_REQUEST,
-            )
+def _get_single(image, form: GetForm | FrameForm, field: str) -> Response:
+    degradation = resolve_pipeline(form.pipeline.data)
+    model_det_name = degradation.model_detection
+    model_rec_name = degradation.model_recognition
+    thresholds = {
+        "conf_threshold": form.conf_threshold.data,
+        "nms_threshold": form.nms_threshold.data,
+        "top_k": form.top_k.data,
+    }
 
-        detected_face = detected_face[0]
+    image, detected_face = model_detection[model_det_name].detect_single_downscaled(
+        image, degradation.scale, **thresholds
+    )
+    if detected_face is None:
+        return Response(
+            json.dumps(
+                {
+                    "errors": {
+                        field: [
+                            "Không tìm thấy khuôn mặt hoặc tìm thấy nhiều khuôn mặt"
+                        ],
+                    },
+                    "message": "Dữ liệu không hợp lệ",
+                }
+            ),
+            status=HTTPStatus.BAD_REQUEST,
+        )
 
-    embedding = model_recognition[model_rec_name].infer(image, detected_face).tolist()
-    if model_rec_name == "sface":
-        embedding = embedding[0]
+    chip = model_recognition[model_rec_name].align(image, detected_face)
+    embedding = model_recognition[model_rec_name].infer_aligned([chip])[0].tolist()
 
     face = detected_face.to_dict()
     face["embedding"] = embedding
+    if form.chip.data:
+        face["chip"] = encode_chip(chip, form.chip.data)
 
     return Response(
         json.dumps(
@@ -140,9 +151,271 @@ def get_single():
                 "meta": {
                     "face_count": 1,
                     "size": len(embedding),
+                    **degradation.meta(),
                 },
                 "message": "Phát hiện và trích xuất thành công",
             }
         ),
         status=HTTPStatus.OK,
     )
+
+
+def _frame_form() -> FrameForm:
+    formdata = MultiDict(request.args)
+    for field, header in [
+        ("width", "X-Frame-Width"),
+        ("height", "X-Frame-Height"),
+        ("stride", "X-Frame-Stride"),
+        ("format", "X-Frame-Format"),
+    ]:
+        if header in request.headers:
+            formdata[field] = request.headers[header]
+    return FrameForm(formdata=formdata)
+
+
+def _read_frame(form: FrameForm) -> tuple[np.ndarray | None, dict]:
+    """Wrap the request body into an image, without copying BGR frames.
+
+    Returns:
+        out (tuple[np.ndarray | None, dict]): The image, or None with the
+        errors in the same shape as the form errors.
+    """
+    width, height = form.width.data, form.height.data
+    pixel_format = form.format.data or "bgr"
+    rows, row_bytes = frame_layout(width, height, pixel_format)
+    stride = form.stride.data or row_bytes
+
+    errors = {}
+    if pixel_format in ["nv12", "i420"] and (width % 2 != 0 or height % 2 != 0):
+        errors["format"] = [
+            "Khung hình YUV 4:2:0 phải có chiều rộng và chiều cao là số chẵn"
+        ]
+    elif stride < row_bytes or (pixel_format == "i420" and stride % 2 != 0):
+        errors["stride"] = [
+            "Số byte mỗi dòng không hợp lệ, tối thiểu {} byte".format(row_bytes)
+        ]
+    elif request.content_length != stride * rows:
+        errors["frame"] = [
+            "Kích thước khung hình phải là {} byte, nhận được {} byte".format(
+                stride * rows, request.content_length or 0
+            )
+        ]
+    if len(errors) > 0:
+        return None, errors
+
+    return read_frame(request.get_data(), width, height, pixel_format, stride), {}
+
+
+@bp.route("/get_frame", methods=["POST"])
+def get_frame():
+    # Same as /get, for a raw frame of a camera client
+    form = _frame_form()
+    if not form.validate_on_submit():
+        return Response(
+            json.dumps({"errors": form.errors, "message": "Dữ liệu không hợp lệ"}),
+            status=HTTPStatus.BAD_REQUEST,
+        )
+
+    image, errors = _read_frame(form)
+    if image is None:
+        return Response(
+            json.dumps({"errors": errors, "message": "Dữ liệu không hợp lệ"}),
+            status=HTTPStatus.BAD_REQUEST,
+        )
+
+    return _get(image, form)
+
+
+@bp.route("/get_single_frame", methods=["POST"])
+def get_single_frame():
+    # Same as /get_single, for a raw frame of a camera client
+    form = _frame_form()
+    if not form.validate_on_submit():
+        return Response(
+            json.dumps({"errors": form.errors, "message": "Dữ liệu không hợp lệ"}),
+            status=HTTPStatus.BAD_REQUEST,
+        )
+
+    image, errors = _read_frame(form)
+    if image is None:
+        return Response(
+            json.dumps({"errors": errors, "message": "Dữ liệu không hợp lệ"}),
+            status=HTTPStatus.BAD_REQUEST,
+        )
+
+    return _get_single(image, form, "frame")
+
+
+@bp.route("/embed", methods=["POST"])
+def embed():
+    form = EmbedForm()
+    if not form.validate_on_submit():
+        return Response(
+            json.dumps({"errors": form.errors, "message": "Dữ liệu không hợp lệ"}),
+            status=HTTPStatus.BAD_REQUEST,
+        )
+
+    _, model_rec_name = form.pipeline.data.split("+")
+
+    # Chips are already aligned, so detection and alignment are skipped
+    chips = [decode_chip(file.read(), file.filename or "") for file in form.chips.data]
+    invalid = [index for index, chip in enumerate(chips) if chip is None]
+    if len(invalid) > 0:
+        return Response(
+            json.dumps(
+                {
+                    "errors": {
+                        "chips": [
+                            "Ảnh khuôn mặt thứ {} không phải ảnh 112x112 đã căn chỉnh".format(
+                                index + 1
+                            )
+                            for index in invalid
+                        ]
+                    },
+                    "message": "Dữ liệu không hợp lệ",
+                }
+            ),
+            status=HTTPStatus.BAD_REQUEST,
+        )
+
+    embeddings = model_recognition[model_rec_name].infer_aligned(chips).tolist()
+
+    return Response(
+        json.dumps(
+            {
+                "embeddings": embeddings,
+                "meta": {
+                    "face_count": len(embeddings),
+                    "size": len(embeddings[0]) if len(embeddings) > 0 else 0,
+                    "model_recognition": model_rec_name,
+                },
+                "message": "Trích xuất thành công",
+            }
+        ),
+        status=HTTPStatus.OK,
+    )
+
+
+@bp.route("/cluster", methods=["POST"])
+def cluster():
+    form = ClusterForm()
+    if not form.validate_on_submit():
+        return Response(
+            json.dumps({"errors": form.errors, "message": "Dữ liệu không hợp lệ"}),
+            status=HTTPStatus.BAD_REQUEST,
+        )
+
+    # An explicit threshold is calibrated for the requested recognizer
+    degradation = resolve_pipeline(
+        form.pipeline.data, keep_recognizer=form.threshold.data is not None
+    )
+    model_det_name = degradation.model_detection
+    model_rec_name = degradation.model_recognition
+    detector = model_detection[model_det_name]
+    recognizer = model_recognition[model_rec_name]
+    thresholds = {
+        "conf_threshold": form.conf_threshold.data,
+        "nms_threshold": form.nms_threshold.data,
+        "top_k": form.top_k.data,
+    }
+    threshold = (
+        form.threshold.data
+        if form.threshold.data is not None
+        else recognizer.default_threshold
+    )
+
+    def prepare(stream):
+        # Same detection and alignment as /api/get, for one photo
+        image = read_image(stream)
+        detected_faces = detector.detect_downscaled(
+            image, degradation.scale, **thresholds
+        )
+        return detected_faces, [
+            recognizer.align(image, detected_face) for detected_face in detected_faces
+        ]
+
+    futures = [executor.submit(prepare, file.stream) for file in form.images.data]
+
+    # A photo that cannot be decoded only fails itself, not the whole request
+    images, faces, chips, groups = [], [], [], []
+    for index, (file, future) in enumerate(zip(form.images.data, futures)):
+        try:
+            detected_faces, image_chips = future.result()
+        except (OSError, ValueError):
+            images.append(
+                {
+                    "filename": file.filename,
+                    "face_count": 0,
+                    "error": "Không đọc được file ảnh",
+                }
+            )
+            continue
+
+        images.append(
+            {
+                "filename": file.filename,
+                "face_count": len(detected_faces),
+                "error": None,
+            }
+        )
+        faces.extend(
+            (index, face_index, detected_face)
+            for face_index, detected_face in enumerate(detected_faces)
+        )
+        chips.extend(image_chips)
+        groups.extend([index] * len(image_chips))
+
+    # All faces of all photos are embedded as a single batch
+    embeddings = (
+        recognizer.infer_aligned(chips)
+        if len(chips) > 0
+        else np.empty((0, 0), dtype=np.float32)
+    )
+    labels = cluster_embeddings(
+        embeddings, threshold, np.asarray(groups), form.linkage.data or "average"
+    )
+
+    identities = []
+    for label, representative in enumerate(medoids(embeddings, labels)):
+        image_index, face_index, detected_face = faces[representative]
+        face = detected_face.to_dict()
+        face["embedding"] = embeddings[representative].tolist()
+        members = np.flatnonzero(labels == label)
+        identities.append(
+            {
+                "representative": {"image": image_index, "face": face},
+                "members": [
+                    {
+                        "image": faces[member][0],
+                        "face_index": faces[member][1],
+                        "similarity": float(
+                            recognizer.similarity(
+                                embeddings[representative], embeddings[member]
+                            )
+                        ),
+                    }
+                    for member in members
+                ],
+                "count": len(members),
+            }
+        )
+
+    return Response(
+        json.dumps(
+            {
+                "identities": identities,
+                "images": images,
+                "meta": {
+                    "face_count": len(faces),
+                    "identity_count": len(identities),
+                    "threshold": threshold,
+                    "linkage": form.linkage.data or "average",
+                    "model_detection": model_det_name,
+                    "model_recognition": model_rec_name,
+                    **degradation.meta(),
+                },
+                "message": "Gom cụm khuôn mặt thành công",
+            }
+        ),
+        status=HTTPStatus.OK,
+    )
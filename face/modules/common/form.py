@@ -1,7 +1,16 @@
 from flask_wtf import FlaskForm
-from wtforms import StringField, FileField
-from wtforms.validators import DataRequired, Regexp
-from flask_wtf.file import FileRequired, FileAllowed, FileSize
+from wtforms import StringField, FileField, FloatField, IntegerField
+from wtforms.validators import (
+    DataRequired,
+    InputRequired,
+    Regexp,
+    Optional,
+    AnyOf,
+    NumberRange,
+    Length,
+)
+from flask_wtf.file import FileRequired, FileAllowed, FileSize, MultipleFileField
+from lib.utils.image import FRAME_FORMATS
 
 
 class GetForm(FlaskForm):
@@ -34,3 +43,236 @@ class GetForm(FlaskForm):
             ),
         ],
     )
+    chip = StringField(
+        "chip",
+        validators=[
+            Optional(),
+            AnyOf(
+                ["jpeg", "raw"],
+                message="Định dạng ảnh khuôn mặt không hợp lệ. Các định dạng hiện có: 'jpeg', 'raw'",
+            ),
+        ],
+    )
+
+    conf_threshold = FloatField(
+        "conf_threshold",
+        validators=[
+            Optional(),
+            NumberRange(
+                min=0, max=1, message="Ngưỡng tin cậy phải nằm trong khoảng [0, 1]"
+            ),
+        ],
+    )
+    nms_threshold = FloatField(
+        "nms_threshold",
+        validators=[
+            Optional(),
+            NumberRange(
+                min=0, max=1, message="Ngưỡng NMS phải nằm trong khoảng [0, 1]"
+            ),
+        ],
+    )
+    top_k = IntegerField(
+        "top_k",
+        validators=[
+            Optional(),
+            NumberRange(min=1, message="Số khuôn mặt tối đa phải lớn hơn 0"),
+        ],
+    )
+
+
+class EmbedForm(FlaskForm):
+    class Meta:
+        csrf = False
+
+    chips = MultipleFileField(
+        "chips",
+        validators=[
+            FileRequired(message="Vui lòng chọn ảnh khuôn mặt đã căn chỉnh"),
+            Length(max=64, message="Chỉ được gửi tối đa 64 ảnh khuôn mặt"),
+            FileAllowed(
+                ["jpg", "jpeg", "png", "raw"],
+                message="Chỉ hỗ trợ các định dạng ảnh: jpg, jpeg, png, raw",
+            ),
+            FileSize(
+                max_size=1 * 1024 * 1024,
+                message="Kích thước ảnh khuôn mặt không được vượt quá 1MB",
+            ),
+        ],
+    )
+    pipeline = StringField(
+        "pipeline",
+        validators=[
+            DataRequired(
+                message="Vui lòng chọn pipeline. Các pipeline hiện có: 'yunet+sface', 'retinaface+arcface'"
+            ),
+            Regexp(
+                "^(yunet\+sface|retinaface\+arcface)$",
+                message="Pipeline không hợp lệ. Các pipeline hiện có: 'yunet+sface', 'retinaface+arcface'",
+            ),
+        ],
+    )
+
+
+class ClusterForm(FlaskForm):
+    class Meta:
+        csrf = False
+
+    images = MultipleFileField(
+        "images",
+        validators=[
+            FileRequired(message="Vui lòng chọn ít nhất một file ảnh"),
+            Length(max=10, message="Chỉ được gửi tối đa 10 ảnh"),
+            FileAllowed(
+                ["jpg", "jpeg", "png"],
+                message="Chỉ hỗ trợ các định dạng ảnh: jpg, jpeg, png",
+            ),
+            FileSize(
+                max_size=10 * 1024 * 1024,
+                message="Kích thước file ảnh không được vượt quá 10MB",
+            ),
+        ],
+    )
+    pipeline = StringField(
+        "pipeline",
+        validators=[
+            DataRequired(
+                message="Vui lòng chọn pipeline. Các pipeline hiện có: 'yunet+sface', 'retinaface+arcface'"
+            ),
+            Regexp(
+                "^(yunet\+sface|retinaface\+arcface)$",
+                message="Pipeline không hợp lệ. Các pipeline hiện có: 'yunet+sface', 'retinaface+arcface'",
+            ),
+        ],
+    )
+    threshold = FloatField(
+        "threshold",
+        validators=[
+            Optional(),
+            NumberRange(min=-1, max=1, message="Ngưỡng phải nằm trong khoảng [-1, 1]"),
+        ],
+    )
+    linkage = StringField(
+        "linkage",
+        default="average",
+        validators=[
+            Optional(),
+            AnyOf(
+                ["average", "single"],
+                message="Phương pháp gom cụm không hợp lệ. Các phương pháp hiện có: 'average', 'single'",
+            ),
+        ],
+    )
+    conf_threshold = FloatField(
+        "conf_threshold",
+        validators=[
+            Optional(),
+            NumberRange(
+                min=0, max=1, message="Ngưỡng tin cậy phải nằm trong khoảng [0, 1]"
+            ),
+        ],
+    )
+    nms_threshold = FloatField(
+        "nms_threshold",
+        validators=[
+            Optional(),
+            NumberRange(
+                min=0, max=1, message="Ngưỡng NMS phải nằm trong khoảng [0, 1]"
+            ),
+        ],
+    )
+    top_k = IntegerField(
+        "top_k",
+        validators=[
+            Optional(),
+            NumberRange(min=1, message="Số khuôn mặt tối đa phải lớn hơn 0"),
+        ],
+    )
+
+
+# The pixels of a raw frame are the request body, its layout comes from the
+# X-Frame-* headers and the other fields from the query string
+class FrameForm(FlaskForm):
+    class Meta:
+        csrf = False
+
+    width = IntegerField(
+        "width",
+        validators=[
+            InputRequired(message="Vui lòng cung cấp chiều rộng khung hình"),
+            NumberRange(min=1, message="Chiều rộng khung hình phải lớn hơn 0"),
+        ],
+    )
+    height = IntegerField(
+        "height",
+        validators=[
+            InputRequired(message="Vui lòng cung cấp chiều cao khung hình"),
+            NumberRange(min=1, message="Chiều cao khung hình phải lớn hơn 0"),
+        ],
+    )
+    stride = IntegerField(
+        "stride",
+        validators=[
+            Optional(),
+            NumberRange(min=1, message="Số byte mỗi dòng phải lớn hơn 0"),
+        ],
+    )
+    format = StringField(
+        "format",
+        default="bgr",
+        validators=[
+            Optional(),
+            AnyOf(
+                FRAME_FORMATS,
+                message="Định dạng khung hình không hợp lệ. Các định dạng hiện có: 'bgr', 'rgb', 'gray', 'nv12', 'i420'",
+            ),
+        ],
+    )
+    pipeline = StringField(
+        "pipeline",
+        validators=[
+            DataRequired(
+                message="Vui lòng chọn pipeline. Các pipeline hiện có: 'yunet+sface', 'retinaface+arcface'"
+            ),
+            Regexp(
+                "^(yunet\+sface|retinaface\+arcface)$",
+                message="Pipeline không hợp lệ. Các pipeline hiện có: 'yunet+sface', 'retinaface+arcface'",
+            ),
+        ],
+    )
+    chip = StringField(
+        "chip",
+        validators=[
+            Optional(),
+            AnyOf(
+                ["jpeg", "raw"],
+                message="Định dạng ảnh khuôn mặt không hợp lệ. Các định dạng hiện có: 'jpeg', 'raw'",
+            ),
+        ],
+    )
+
+    conf_threshold = FloatField(
+        "conf_threshold",
+        validators=[
+            Optional(),
+            NumberRange(
+                min=0, max=1, message="Ngưỡng tin cậy phải nằm trong khoảng [0, 1]"
+            ),
+        ],
+    )
+    nms_threshold = FloatField(
+        "nms_threshold",
+        validators=[
+            Optional(),
+            NumberRange(
+                min=0, max=1, message="Ngưỡng NMS phải nằm trong khoảng [0, 1]"
+            ),
+        ],
+    )
+    top_k = IntegerField(
+        "top_k",
+        validators=[
+            Optional(),
+            NumberRange(min=1, message="Số khuôn mặt tối đa phải lớn hơn 0"),
+        ],
+    )
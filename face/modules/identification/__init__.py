@@ -0,0 +1,297 @@
+import os
+import json
+import math
+import threading
+import numpy as np
+from http import HTTPStatus
+from flask import Blueprint, Response
+from lib.gallery.shard import ShardedGallery
+from lib.gallery.template import TemplateStore, templates_from_payload
+from lib.utils.degradation import resolve_pipeline
+from lib.utils.image import read_image
+from modules.common import model_detection, model_recognition
+from modules.identification.form import IdentificationForm, GalleryForm, FacesForm
+
+bp = Blueprint("identification", __name__)
+# Number of shards of each gallery, the key they are placed by ("student" or
+# "class") and whether each shard runs in its own worker process
+num_shards = int(os.environ.get("GALLERY_SHARDS", 1))
+shard_by = os.environ.get("GALLERY_SHARD_BY", "student")
+processes = os.environ.get("GALLERY_PROCESSES", "0") == "1"
+# Whether each student is searched through a fused template and how many
+# medoids are added to it, instead of one row per selfie
+fusion = os.environ.get("GALLERY_FUSION", "0") == "1"
+medoid_count = int(os.environ.get("GALLERY_MEDOIDS", 0))
+
+# One gallery per recognizer, since embeddings of different models cannot be
+# compared, created on first use
+stores: dict[str, TemplateStore] = {}
+_stores_lock = threading.Lock()
+
+
+def _store(model_rec_name: str) -> TemplateStore:
+    with _stores_lock:
+        store = stores.get(model_rec_name)
+        if store is None:
+            store = TemplateStore(
+                ShardedGallery(num_shards, shard_by, processes), fusion, medoid_count
+            )
+            stores[model_rec_name] = store
+        return store
+
+
+def _invalid(errors: dict[str, list[str]]) -> Response:
+    return Response(
+        json.dumps({"errors": errors, "message": "Dữ liệu không hợp lệ"}),
+        status=HTTPStatus.BAD_REQUEST,
+    )
+
+
+@bp.route("/", methods=["POST"])
+def identify():
+    form = IdentificationForm()
+    if not form.validate_on_submit():
+        return _invalid(form.errors)
+
+    # The gallery holds embeddings of the requested recognizer, so only the
+    # detection can be degraded
+    degradation = resolve_pipeline(form.pipeline.data, keep_recognizer=True)
+    model_det_name = degradation.model_detection
+    model_rec_name = degradation.model_recognition
+    recognizer = model_recognition[model_rec_name]
+
+    # A precomputed embedding takes priority over the image
+    if form.embedding.data:
+        try:
+            embedding = np.asarray(json.loads(form.embedding.data), dtype=np.float32)
+        except (ValueError, TypeError):
+            return _invalid({"embedding": ["Embedding không hợp lệ"]})
+        if embedding.ndim != 1 or not np.isfinite(embedding).all():
+            return _invalid({"embedding": ["Embedding không hợp lệ"]})
+    elif form.image.data:
+        image, detected_face = model_detection[model_det_name].detect_single_downscaled(
+            read_image(form.image.data.stream),
+            degradation.scale,
+            conf_threshold=form.conf_threshold.data,
+            nms_threshold=form.nms_threshold.data,
+            top_k=form.top_k.data,
+        )
+        if detected_face is None:
+            return _invalid(
+                {
+                    "image": [
+                        "Không tìm thấy khuôn mặt hoặc tìm thấy nhiều khuôn mặt trong ảnh"
+                    ]
+                }
+            )
+        chip = recognizer.align(image, detected_face)
+        embedding = recognizer.infer_aligned([chip])[0]
+    else:
+        return _invalid({"image": ["Vui lòng chọn file ảnh hoặc cung cấp embedding"]})
+
+    threshold = (
+        form.threshold.data
+        if form.threshold.data is not None
+        else recognizer.default_threshold
+    )
+
+    try:
+        (candidates,) = _store(model_rec_name).gallery.search(
+            embedding[np.newaxis, :],
+            form.limit.data or 1,
+            form.class_id.data or None,
+        )
+    except ValueError as e:
+        return _invalid({"embedding": [str(e)]})
+
+    candidates = [
+        {"student_id": student_id, "similarity": similarity}
+        for student_id, similarity in candidates
+    ]
+    match = (
+        candidates[0]
+        if len(candidates) > 0 and candidates[0]["similarity"] >= threshold
+        else None
+    )
+
+    return Response(
+        json.dumps(
+            {
+                "match": match,
+                "candidates": candidates,
+                "meta": {
+                    "threshold": threshold,
+                    "class_id": form.class_id.data or None,
+                    "model_detection": model_det_name,
+                    "model_recognition": model_rec_name,
+                    **degradation.meta(),
+                },
+                "message": (
+                    "Nhận diện thành công" if match else "Không tìm thấy sinh viên"
+                ),
+            }
+        ),
+        status=HTTPStatus.OK,
+    )
+
+
+@bp.route("/gallery", methods=["PUT"])
+def put_gallery():
+    form = GalleryForm()
+    if not form.validate_on_submit():
+        return _invalid(form.errors)
+
+    try:
+        students = templates_from_payload(json.loads(form.students.data))
+    except ValueError as e:
+        return _invalid({"students": [str(e)]})
+
+    _, model_rec_name = form.pipeline.data.split("+")
+    store = _store(model_rec_name)
+    try:
+        store.replace(students)
+    except ValueError as e:
+        return _invalid({"students": [str(e)]})
+
+    return Response(
+        json.dumps(
+            {
+                "meta": {
+                    "student_count": len(students),
+                    "face_count": sum(len(template) for _, template, _ in students),
+                    "model_recognition": model_rec_name,
+                    "gallery": store.stats(),
+                },
+                "message": "Cập nhật danh sách nhận diện thành công",
+            }
+        ),
+        status=HTTPStatus.OK,
+    )
+
+
+@bp.route("/gallery/<student_id>", methods=["DELETE"])
+def delete_gallery(student_id: str):
+    with _stores_lock:
+        items = list(stores.items())
+    removed = [
+        model_rec_name for model_rec_name, store in items if store.remove(student_id)
+    ]
+
+    if len(removed) == 0:
+        return Response(
+            json.dumps(
+                {"message": "Không tìm thấy sinh viên trong danh sách nhận diện"}
+            ),
+            status=HTTPStatus.NOT_FOUND,
+        )
+
+    return Response(
+        json.dumps(
+            {
+                "meta": {"student_id": student_id, "model_recognition": removed},
+                "message": "Xóa sinh viên khỏi danh sách nhận diện thành công",
+            }
+        ),
+        status=HTTPStatus.OK,
+    )
+
+
+@bp.route("/gallery/<student_id>/faces", methods=["POST"])
+def add_faces(student_id: str):
+    form = FacesForm()
+    if not form.validate_on_submit():
+        return _invalid(form.errors)
+
+    try:
+        faces = json.loads(form.faces.data)
+        if not isinstance(faces, list) or len(faces) == 0:
+            raise ValueError
+        faces = [
+            (
+                str(face["face_id"]),
+                np.asarray(face["embedding"], dtype=np.float32),
+                float(face.get("quality", 1.0)),
+            )
+            for face in faces
+        ]
+    except (ValueError, TypeError, KeyError):
+        return _invalid(
+            {
+                "faces": [
+                    "Mỗi khuôn mặt phải có face_id, embedding và quality (tùy chọn)"
+                ]
+            }
+        )
+
+    class_ids = None
+    if form.class_ids.data:
+        try:
+            class_ids = json.loads(form.class_ids.data)
+            if not isinstance(class_ids, list):
+                raise ValueError
+        except ValueError:
+            return _invalid({"class_ids": ["class_ids phải là một danh sách"]})
+        class_ids = [str(class_id) for class_id in class_ids]
+
+    if any(
+        embedding.ndim != 1
+        or not np.isfinite(embedding).all()
+        or not math.isfinite(quality)
+        or quality <= 0
+        for _, embedding, quality in faces
+    ):
+        return _invalid(
+            {"faces": ["Embedding phải là một vector và quality phải là số dương"]}
+        )
+
+    _, model_rec_name = form.pipeline.data.split("+")
+    store = _store(model_rec_name)
+    try:
+        template = store.add_faces(student_id, faces, class_ids)
+    except ValueError as e:
+        return _invalid({"faces": [str(e)]})
+
+    return Response(
+        json.dumps(
+            {
+                "meta": {
+                    "student_id": student_id,
+                    "face_count": len(template),
+                    "model_recognition": model_rec_name,
+                },
+                "message": "Thêm khuôn mặt thành công",
+            }
+        ),
+        status=HTTPStatus.OK,
+    )
+
+
+@bp.route("/gallery/<student_id>/faces/<face_id>", methods=["DELETE"])
+def delete_face(student_id: str, face_id: str):
+    with _stores_lock:
+        items = list(stores.items())
+    removed = [
+        model_rec_name
+        for model_rec_name, store in items
+        if store.remove_face(student_id, face_id)
+    ]
+
+    if len(removed) == 0:
+        return Response(
+            json.dumps({"message": "Không tìm thấy khuôn mặt của sinh viên"}),
+            status=HTTPStatus.NOT_FOUND,
+        )
+
+    return Response(
+        json.dumps(
+            {
+                "meta": {
+                    "student_id": student_id,
+                    "face_id": face_id,
+                    "model_recognition": removed,
+                },
+                "message": "Xóa khuôn mặt thành công",
+            }
+        ),
+        status=HTTPStatus.OK,
+    )
@@ -0,0 +1,134 @@
+from flask_wtf import FlaskForm
+from wtforms import StringField, FileField, FloatField, IntegerField
+from wtforms.validators import DataRequired, Regexp, Optional, NumberRange
+from flask_wtf.file import FileAllowed, FileSize
+
+
+class IdentificationForm(FlaskForm):
+    class Meta:
+        csrf = False
+
+    image = FileField(
+        "image",
+        validators=[
+            FileAllowed(
+                ["jpg", "jpeg", "png"],
+                message="Chỉ hỗ trợ các định dạng ảnh: jpg, jpeg, png",
+            ),
+            FileSize(
+                max_size=10 * 1024 * 1024,
+                message="Kích thước file ảnh không được vượt quá 10MB",
+            ),
+        ],
+    )
+    embedding = StringField("embedding", validators=[Optional()])
+    pipeline = StringField(
+        "pipeline",
+        validators=[
+            DataRequired(
+                message="Vui lòng chọn pipeline. Các pipeline hiện có: 'yunet+sface', 'retinaface+arcface'"
+            ),
+            Regexp(
+                "^(yunet\+sface|retinaface\+arcface)$",
+                message="Pipeline không hợp lệ. Các pipeline hiện có: 'yunet+sface', 'retinaface+arcface'",
+            ),
+        ],
+    )
+    class_id = StringField(
+        "class_id",
+        validators=[
+            Optional(),
+            Regexp(
+                "^[A-Za-z0-9_-]+$",
+                message="Mã lớp chỉ được chứa chữ cái, chữ số, '_' và '-'",
+            ),
+        ],
+    )
+    limit = IntegerField(
+        "limit",
+        default=1,
+        validators=[
+            Optional(),
+            NumberRange(
+                min=1, max=100, message="Số sinh viên trả về phải từ 1 đến 100"
+            ),
+        ],
+    )
+    threshold = FloatField(
+        "threshold",
+        validators=[
+            Optional(),
+            NumberRange(min=-1, max=1, message="Ngưỡng phải nằm trong khoảng [-1, 1]"),
+        ],
+    )
+
+    conf_threshold = FloatField(
+        "conf_threshold",
+        validators=[
+            Optional(),
+            NumberRange(
+                min=0, max=1, message="Ngưỡng tin cậy phải nằm trong khoảng [0, 1]"
+            ),
+        ],
+    )
+    nms_threshold = FloatField(
+        "nms_threshold",
+        validators=[
+            Optional(),
+            NumberRange(
+                min=0, max=1, message="Ngưỡng NMS phải nằm trong khoảng [0, 1]"
+            ),
+        ],
+    )
+    top_k = IntegerField(
+        "top_k",
+        validators=[
+            Optional(),
+            NumberRange(min=1, message="Số khuôn mặt tối đa phải lớn hơn 0"),
+        ],
+    )
+
+
+class GalleryForm(FlaskForm):
+    class Meta:
+        csrf = False
+
+    pipeline = StringField(
+        "pipeline",
+        validators=[
+            DataRequired(
+                message="Vui lòng chọn pipeline. Các pipeline hiện có: 'yunet+sface', 'retinaface+arcface'"
+            ),
+            Regexp(
+                "^(yunet\+sface|retinaface\+arcface)$",
+                message="Pipeline không hợp lệ. Các pipeline hiện có: 'yunet+sface', 'retinaface+arcface'",
+            ),
+        ],
+    )
+    students = StringField(
+        "students",
+        validators=[DataRequired(message="Vui lòng cung cấp danh sách sinh viên")],
+    )
+
+
+class FacesForm(FlaskForm):
+    class Meta:
+        csrf = False
+
+    pipeline = StringField(
+        "pipeline",
+        validators=[
+            DataRequired(
+                message="Vui lòng chọn pipeline. Các pipeline hiện có: 'yunet+sface', 'retinaface+arcface'"
+            ),
+            Regexp(
+                "^(yunet\+sface|retinaface\+arcface)$",
+                message="Pipeline không hợp lệ. Các pipeline hiện có: 'yunet+sface', 'retinaface+arcface'",
+            ),
+        ],
+    )
+    faces = StringField(
+        "faces",
+        validators=[DataRequired(message="Vui lòng cung cấp danh sách khuôn mặt")],
+    )
+    class_ids = StringField("class_ids", validators=[Optional()])
@@ -1,25 +1,33 @@
-import json, cv2
+import io
+import json
 import numpy as np
 from http import HTTPStatus
-from PIL import Image, ImageOps
-from flask import Blueprint, Response, current_app
+from flask import Blueprint, Response
 from lib.face_recognizer.base import BaseFaceRecognizer
 from lib.face_detector.base import BaseFaceDetector
-from lib.face_recognizer.arcface import ArcFaceRecognizer
-from lib.face_recognizer.sface import SFaceRecognizer
-from lib.face_detector.retinaface import RetinaFaceDetector
-from lib.face_detector.yunet import YuNetDetector
-from modules.verification.form import VerificationForm
+from lib.utils.degradation import resolve_pipeline
+from lib.utils.executor import executor
+from lib.utils.image import read_image
+from modules.common import model_detection, model_recognition
+from modules.verification.form import VerificationForm, BatchVerificationForm
 
 bp = Blueprint("verification", __name__)
-model_detection: dict[str, BaseFaceDetector] = {
-    "yunet": YuNetDetector(),
-    "retinaface": RetinaFaceDetector(),
-}
-model_recognition: dict[str, BaseFaceRecognizer] = {
-    "sface": SFaceRecognizer(),
-    "arcface": ArcFaceRecognizer(),
-}
+
+
+def _prepare(
+    detector: BaseFaceDetector,
+    recognizer: BaseFaceRecognizer,
+    stream,
+    thresholds: dict,
+    scale: float = 1.0,
+) -> np.ndarray | None:
+    # Decode, detect and align one image, returns None if the face is invalid
+    image, detected_face = detector.detect_single_downscaled(
+        read_image(stream), scale, **thresholds
+    )
+    if detected_face is None:
+        return None
+    return recognizer.align(image, detected_face)
 
 
 @bp.route("/", methods=["POST"])
@@ -31,115 +39,233 @@ def verify():
             status=HTTPStatus.BAD_REQUEST,
         )
 
-    # Convert to OpenCV image
-    pil_image_1 = Image.open(form.image_1.data.stream)
-    pil_image_2 = Image.open(form.image_2.data.stream)
-
-    pil_image_1 = ImageOps.exif_transpose(pil_image_1)
-    pil_image_2 = ImageOps.exif_transpose(pil_image_2)
-
-    pil_image_1 = pil_image_1.convert("RGB")
-    pil_image_2 = pil_image_2.convert("RGB")
-
-    cv_image_1 = np.array(pil_image_1)
-    cv_image_2 = np.array(pil_image_2)
+    degradation = resolve_pipeline(form.pipeline.data)
+    model_det_name = degradation.model_detection
+    model_rec_name = degradation.model_recognition
+    detector = model_detection[model_det_name]
+    recognizer = model_recognition[model_rec_name]
+    thresholds = {
+        "conf_threshold": form.conf_threshold.data,
+        "nms_threshold": form.nms_threshold.data,
+        "top_k": form.top_k.data,
+    }
 
-    image_1 = cv_image_1[:, :, ::-1].copy()
-    image_2 = cv_image_2[:, :, ::-1].copy()
-
-    # Detect face in images
-    model_det_name, model_rec_name = form.pipeline.data.split("+")
-
-    detected_face_1 = None
-    detected_face_2 = None
-
-    if model_det_name == "yunet":
-        detected_face_1, scale_1 = model_detection[
-            model_det_name
-        ].detect_single_multiscale(image_1)
+    # Both images are processed in parallel, then embedded as a single batch
+    futures = [
+        executor.submit(
+            _prepare,
+            detector,
+            recognizer,
+            form.image_1.data.stream,
+            thresholds,
+            degradation.scale,
+        ),
+        executor.submit(
+            _prepare,
+            detector,
+            recognizer,
+            form.image_2.data.stream,
+            thresholds,
+            degradation.scale,
+        ),
+    ]
+    chips = [future.result() for future in futures]
 
-        if detected_face_1 is None:
+    for name, chip in zip(["image_1", "image_2"], chips):
+        if chip is None:
             return Response(
                 json.dumps(
                     {
-                        "errors": {"image_1": ["Ảnh không hợp lệ"]},
+                        "errors": {name: ["Ảnh không hợp lệ"]},
                         "message": "Dữ liệu không hợp lệ",
                     }
                 ),
                 status=HTTPStatus.BAD_REQUEST,
             )
 
-        h_1, w_1 = image_1.shape[:2]
-        image_1 = cv2.resize(image_1, (int(w_1 * scale_1), int(h_1 * scale_1)))
+    # Get similarity of faces
+    embedding_1, embedding_2 = recognizer.infer_aligned(chips)
+    similarity = recognizer.similarity(embedding_1, embedding_2)
 
-        detected_face_2, scale_2 = model_detection[
-            model_det_name
-        ].detect_single_multiscale(image_2)
+    return Response(
+        json.dumps(
+            {
+                "similarity": float(similarity),
+                "embedding": {
+                    "image_1": embedding_1.tolist(),
+                    "image_2": embedding_2.tolist(),
+                },
+                "meta": {
+                    "model_detection": model_det_name,
+                    "model_recognition": model_rec_name,
+                    **degradation.meta(),
+                },
+                "message": "Tính toán thành công",
+            }
+        ),
+        status=HTTPStatus.OK,
+    )
 
-        if detected_face_2 is None:
-            return Response(
-                json.dumps(
-                    {
-                        "errors": {"image_2": ["Ảnh không hợp lệ"]},
-                        "message": "Dữ liệu không hợp lệ",
-                    }
-                ),
-                status=HTTPStatus.BAD_REQUEST,
+
+@bp.route("/batch", methods=["POST"])
+def verify_batch():
+    form = BatchVerificationForm()
+    if not form.validate_on_submit():
+        return Response(
+            json.dumps({"errors": form.errors, "message": "Dữ liệu không hợp lệ"}),
+            status=HTTPStatus.BAD_REQUEST,
+        )
+
+    # An explicit threshold is calibrated for the requested recognizer
+    degradation = resolve_pipeline(
+        form.pipeline.data, keep_recognizer=form.threshold.data is not None
+    )
+    model_det_name = degradation.model_detection
+    model_rec_name = degradation.model_recognition
+    detector = model_detection[model_det_name]
+    recognizer = model_recognition[model_rec_name]
+    thresholds = {
+        "conf_threshold": form.conf_threshold.data,
+        "nms_threshold": form.nms_threshold.data,
+        "top_k": form.top_k.data,
+    }
+    threshold = (
+        form.threshold.data
+        if form.threshold.data is not None
+        else recognizer.default_threshold
+    )
+
+    # The selfies are stored with the embedding of the storage pipeline, which
+    # keeps its recognizer so they can be compared with the stored faces
+    storage = resolve_pipeline(
+        form.storage_pipeline.data or "yunet+sface", keep_recognizer=True
+    )
+    storage_detector = model_detection[storage.model_detection]
+    storage_recognizer = model_recognition[storage.model_recognition]
+    reuse = (
+        storage.model_detection == model_det_name
+        and storage.model_recognition == model_rec_name
+        and storage.scale == degradation.scale
+    )
+
+    # The card and all selfies are processed in parallel
+    card_future = executor.submit(
+        _prepare,
+        detector,
+        recognizer,
+        form.card.data.stream,
+        thresholds,
+        degradation.scale,
+    )
+    # Each selfie is also prepared for the storage pipeline, unless it is the
+    # same as the verification one
+    pipelines = [(detector, recognizer, degradation.scale)]
+    if not reuse:
+        pipelines.append((storage_detector, storage_recognizer, storage.scale))
+    selfie_futures = []
+    for selfie in form.selfies.data:
+        data = selfie.stream.read()
+        selfie_futures.append(
+            [
+                executor.submit(_prepare, det, rec, io.BytesIO(data), thresholds, scale)
+                for det, rec, scale in pipelines
+            ]
+        )
+
+    # A selfie that cannot be decoded only fails itself, not the whole batch
+    selfie_chips, storage_chips, selfie_errors = [], [], []
+    for futures in selfie_futures:
+        try:
+            chips = [future.result() for future in futures]
+            error = (
+                None
+                if all(chip is not None for chip in chips)
+                else "Không tìm thấy khuôn mặt hoặc tìm thấy nhiều khuôn mặt"
             )
+        except (OSError, ValueError):
+            chips, error = [], "Không đọc được file ảnh"
+        selfie_chips.append(chips[0] if error is None else None)
+        storage_chips.append(chips[-1] if error is None else None)
+        selfie_errors.append(error)
+
+    try:
+        card_chip = card_future.result()
+        card_error = None if card_chip is not None else "Ảnh không hợp lệ"
+    except (OSError, ValueError):
+        card_error = "Không đọc được file ảnh"
+    if card_error is not None:
+        return Response(
+            json.dumps(
+                {
+                    "errors": {"card": [card_error]},
+                    "message": "Dữ liệu không hợp lệ",
+                }
+            ),
+            status=HTTPStatus.BAD_REQUEST,
+        )
 
-        h_2, w_2 = image_2.shape[:2]
-        image_2 = cv2.resize(image_2, (int(w_2 * scale_2), int(h_2 * scale_2)))
+    # The card is embedded once, together with every valid selfie
+    valid_chips = [chip for chip in selfie_chips if chip is not None]
+    embeddings = recognizer.infer_aligned([card_chip] + valid_chips)
+    card_embedding, selfie_embeddings = embeddings[0], embeddings[1:]
+    if reuse:
+        storage_embeddings = iter(selfie_embeddings)
     else:
-        detected_face_1 = model_detection[model_det_name].detect(image_1)
-        if len(detected_face_1) != 1:
-            return Response(
-                json.dumps(
-                    {
-                        "errors": {"image_1": ["Ảnh không hợp lệ"]},
-                        "message": "Dữ liệu không hợp lệ",
-                    }
-                ),
-                status=HTTPStatus.BAD_REQUEST,
-            )
-        detected_face_1 = detected_face_1[0]
+        valid_storage_chips = [chip for chip in storage_chips if chip is not None]
+        storage_embeddings = iter(
+            storage_recognizer.infer_aligned(valid_storage_chips)
+            if len(valid_storage_chips) > 0
+            else []
+        )
+    selfie_embeddings = iter(selfie_embeddings)
 
-        detected_face_2 = model_detection[model_det_name].detect(image_2)
-        if len(detected_face_2) != 1:
-            return Response(
-                json.dumps(
-                    {
-                        "errors": {"image_2": ["Ảnh không hợp lệ"]},
-                        "message": "Dữ liệu không hợp lệ",
-                    }
-                ),
-                status=HTTPStatus.BAD_REQUEST,
+    results = []
+    for index, (selfie, chip, error) in enumerate(
+        zip(form.selfies.data, selfie_chips, selfie_errors)
+    ):
+        if chip is None:
+            results.append(
+                {
+                    "index": index,
+                    "filename": selfie.filename,
+                    "match": False,
+                    "similarity": None,
+                    "embedding": None,
+                    "error": error,
+                }
             )
-        detected_face_2 = detected_face_2[0]
+            continue
 
-    # Get similarity of faces
-    embedding_1 = model_recognition[model_rec_name].infer(image_1, detected_face_1)
-    embedding_2 = model_recognition[model_rec_name].infer(image_2, detected_face_2)
-    similarity = model_recognition[model_rec_name].similarity(embedding_1, embedding_2)
+        similarity = float(
+            recognizer.similarity(card_embedding, next(selfie_embeddings))
+        )
+        results.append(
+            {
+                "index": index,
+                "filename": selfie.filename,
+                "match": similarity >= threshold,
+                "similarity": similarity,
+                "embedding": next(storage_embeddings).tolist(),
+                "error": None,
+            }
+        )
 
     return Response(
         json.dumps(
             {
-                "similarity": float(similarity),
-                "embedding": {
-                    "image_1": (
-                        embedding_1.tolist()
-                        if model_rec_name == "arcface"
-                        else embedding_1.tolist()[0]
-                    ),
-                    "image_2": (
-                        embedding_2.tolist()
-                        if model_rec_name == "arcface"
-                        else embedding_2.tolist()[0]
-                    ),
-                },
+                "card": {"embedding": card_embedding.tolist()},
+                "selfies": results,
                 "meta": {
+                    "selfie_count": len(results),
+                    "match_count": sum(1 for result in results if result["match"]),
+                    "error_count": sum(
+                        1 for result in results if result["error"] is not None
+                    ),
+                    "threshold": threshold,
                     "model_detection": model_det_name,
                     "model_recognition": model_rec_name,
+                    "storage_pipeline": storage.meta()["pipeline"],
+                    **degradation.meta(),
                 },
                 "message": "Tính toán thành công",
             }
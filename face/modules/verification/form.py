@@ -1,7 +1,7 @@
 from flask_wtf import FlaskForm
-from wtforms import StringField, FileField
-from wtforms.validators import DataRequired, Regexp
-from flask_wtf.file import FileRequired, FileAllowed, FileSize
+from wtforms import StringField, FileField, FloatField, IntegerField
+from wtforms.validators import DataRequired, Regexp, Optional, NumberRange, Length
+from flask_wtf.file import FileRequired, FileAllowed, FileSize, MultipleFileField
 
 
 class VerificationForm(FlaskForm):
@@ -48,3 +48,118 @@ class VerificationForm(FlaskForm):
             ),
         ],
     )
+    conf_threshold = FloatField(
+        "conf_threshold",
+        validators=[
+            Optional(),
+            NumberRange(
+                min=0, max=1, message="Ngưỡng tin cậy phải nằm trong khoảng [0, 1]"
+            ),
+        ],
+    )
+    nms_threshold = FloatField(
+        "nms_threshold",
+        validators=[
+            Optional(),
+            NumberRange(
+                min=0, max=1, message="Ngưỡng NMS phải nằm trong khoảng [0, 1]"
+            ),
+        ],
+    )
+    top_k = IntegerField(
+        "top_k",
+        validators=[
+            Optional(),
+            NumberRange(min=1, message="Số khuôn mặt tối đa phải lớn hơn 0"),
+        ],
+    )
+
+
+class BatchVerificationForm(FlaskForm):
+    class Meta:
+        csrf = False
+
+    card = FileField(
+        "card",
+        validators=[
+            FileRequired(message="Vui lòng chọn file ảnh thẻ sinh viên"),
+            FileAllowed(
+                ["jpg", "jpeg", "png"],
+                message="Chỉ hỗ trợ các định dạng ảnh: jpg, jpeg, png",
+            ),
+            FileSize(
+                max_size=10 * 1024 * 1024,
+                message="Kích thước file ảnh không được vượt quá 10MB",
+            ),
+        ],
+    )
+    selfies = MultipleFileField(
+        "selfies",
+        validators=[
+            FileRequired(message="Vui lòng chọn ít nhất một ảnh selfie"),
+            Length(max=20, message="Chỉ được gửi tối đa 20 ảnh selfie"),
+            FileAllowed(
+                ["jpg", "jpeg", "png"],
+                message="Chỉ hỗ trợ các định dạng ảnh: jpg, jpeg, png",
+            ),
+            FileSize(
+                max_size=10 * 1024 * 1024,
+                message="Kích thước file ảnh không được vượt quá 10MB",
+            ),
+        ],
+    )
+    pipeline = StringField(
+        "pipeline",
+        validators=[
+            DataRequired(
+                message="Vui lòng chọn pipeline. Các pipeline hiện có: 'yunet+sface', 'retinaface+arcface'"
+            ),
+            Regexp(
+                "^(yunet\+sface|retinaface\+arcface)$",
+                message="Pipeline không hợp lệ. Các pipeline hiện có: 'yunet+sface', 'retinaface+arcface'",
+            ),
+        ],
+    )
+    storage_pipeline = StringField(
+        "storage_pipeline",
+        default="yunet+sface",
+        validators=[
+            Optional(),
+            Regexp(
+                "^(yunet\+sface|retinaface\+arcface)$",
+                message="Pipeline không hợp lệ. Các pipeline hiện có: 'yunet+sface', 'retinaface+arcface'",
+            ),
+        ],
+    )
+    threshold = FloatField(
+        "threshold",
+        validators=[
+            Optional(),
+            NumberRange(min=-1, max=1, message="Ngưỡng phải nằm trong khoảng [-1, 1]"),
+        ],
+    )
+    conf_threshold = FloatField(
+        "conf_threshold",
+        validators=[
+            Optional(),
+            NumberRange(
+                min=0, max=1, message="Ngưỡng tin cậy phải nằm trong khoảng [0, 1]"
+            ),
+        ],
+    )
+    nms_threshold = FloatField(
+        "nms_threshold",
+        validators=[
+            Optional(),
+            NumberRange(
+                min=0, max=1, message="Ngưỡng NMS phải nằm trong khoảng [0, 1]"
+            ),
+        ],
+    )
+    top_k = IntegerField(
+        "top_k",
+        validators=[
+            Optional(),
+            NumberRange(min=1, message="Số khuôn mặt tối đa phải lớn hơn 0"),
+        ],
+    )